@@ -1,38 +1,65 @@
 import asyncio
 import json
+import time
 from typing import Dict, Any, Optional
 
+import numpy as np
+
 import aio_pika
 from aio_pika.abc import IncomingMessage
 from motor.motor_asyncio import AsyncIOMotorClient
 
 from message_queue_manager import MessageQueueManager
-from posterData import PosterData
+from _config import model_registry_path, model_registry_section, model_registry_poll_seconds, comparables_rebuild_seconds
+from ML.comparables import ComparablesIndex
+from ML.fair_price_model import FairPriceModel, verdict
+from ML.feature_store import FeatureStore
+from ML.model_registry import ModelRegistry
+from result_cache import ResultCache
 
 class RealEstateModel:
-    async def analyze(self, poster_data: PosterData) -> Dict[str, Any]:
-        print(f"  [AnalysisModel] Анализ объявления ID: {poster_data.id}")
-        
+    version = "rules-v2" # Версия входит в ключ кеша результатов: новая модель не отдает старые ответы
+
+    async def analyze(self, ad_id: str, features: Dict[str, Any]) -> Dict[str, Any]:
+        """features - плоский словарь признаков (см. ML.feature_store.FEATURE_FIELDS)."""
+        print(f"  [AnalysisModel] Анализ объявления ID: {ad_id}")
+
+        price = features.get("price")
+        area_total = features.get("area_total")
+        rooms = features.get("rooms")
+        metro_distance = features.get("district_info.metro_distance")
+        crime_rate = features.get("district_info.crime_rate")
+        unemployment_rate = features.get("economic_data.unemployment_rate")
+        market_price_per_sqm = features.get("district_info.median_price_per_sqm")
+
         score = 0
-        if poster_data.price and poster_data.area_total and poster_data.area_total > 0:
-            price_per_sqm = poster_data.price / poster_data.area_total
-            if price_per_sqm < 130000:
+        price_to_market = None
+        if price and area_total and area_total > 0:
+            price_per_sqm = price / area_total
+            if market_price_per_sqm: # Сравнение с медианой района, если статистика есть
+                price_to_market = price_per_sqm / market_price_per_sqm
+                if price_to_market < 0.9:
+                    score += 3
+                elif price_to_market < 1.05:
+                    score += 2
+                else:
+                    score += 1
+            elif price_per_sqm < 130000:
                 score += 3
             elif price_per_sqm < 160000:
                 score += 2
             else:
                 score += 1
 
-        if poster_data.rooms is not None and poster_data.rooms <= 2:
+        if rooms is not None and rooms <= 2:
             score += 1
 
-        if poster_data.district_info:
-            if poster_data.district_info.metro_distance is not None and poster_data.district_info.metro_distance < 1.0:
-                score += 2
-            if poster_data.district_info.crime_rate is not None and poster_data.district_info.crime_rate < 0.04:
-                score += 1
+        if metro_distance is not None and metro_distance < 1.0:
+            score += 2
+        if crime_rate is not None and crime_rate < 0.04:
+            score += 1
 
-        if poster_data.economic_data and poster_data.economic_data.unemployment_rate is not None and poster_data.economic_data.unemployment_rate < 3.5:
+        if unemployment_rate is not None and unemployment_rate < 3.5:
             score += 1
 
         investment_attractiveness = "Низкая"
@@ -42,10 +69,11 @@ class RealEstateModel:
             investment_attractiveness = "Средняя"
         
         return {
-            "ad_id": poster_data.id,
+            "ad_id": ad_id,
             "analysis_score": score,
             "investment_attractiveness": investment_attractiveness,
-            "estimated_rent_yield": f"{score * 0.5}%"
+            "estimated_rent_yield": f"{score * 0.5}%",
+            "price_to_market_ratio": round(price_to_market, 2) if price_to_market is not None else None,
         }
 
 
@@ -66,9 +94,27 @@ class AnalysisWorker:
         self.notification_routing_key = "notify.user"
 
         self.real_estate_model = RealEstateModel()
+        # Модель справедливой цены из реестра: для своего типа сделки заменяет эвристическую оценку цены.
+        # Модель и версия подменяются вместе, без await между присваиваниями (см. reload_model)
+        self.model_registry = ModelRegistry(model_registry_path)
+        self.model_section = model_registry_section
+        self.fair_price_model: Optional[FairPriceModel] = None
+        self.model_version = self.real_estate_model.version
+        self.result_cache = ResultCache(self.db["result_cache"])
+        self.feature_store = FeatureStore(self.collection)
+        self.comparables = ComparablesIndex()
 
     async def initialize(self):
         await self.mq_manager.connect()
+        await self.result_cache.ensure_indexes()
+        await self.feature_store.ensure_indexes()
+        try:
+            await self.reload_model()
+        except Exception as e:
+            print(f"  [ModelRegistry] Не удалось загрузить модель, используется эвристика: {e}")
+        await self.result_cache.set_active_version(self.model_version)
+        loaded = await self.comparables.load(self.collection)
+        print(f"  [Comparables] Индекс аналогов загружен, объявлений: {loaded}")
         await self.mq_manager.declare_queue(self.analysis_queue_name)
         await self.mq_manager.declare_exchange(self.data_flow_exchange_name, type=aio_pika.ExchangeType.TOPIC)
         await self.mq_manager.bind_queue_to_exchange(
@@ -82,7 +128,46 @@ class AnalysisWorker:
         )
         print(f"Аналитический воркер готов к работе. Слушает '{self.analysis_queue_name}', публикует в '{self.notification_queue_name}'.")
 
+    def _load_and_warm_up(self, version: str, samples) -> FairPriceModel:
+        """Загрузка и прогрев новой версии (в потоке, пока старая модель обслуживает сообщения)."""
+        model = self.model_registry.load(self.model_section, version)
+        started_at = time.perf_counter()
+        predictions = model.predict_many(samples)
+        model.predict(samples[0])
+        if not np.all(np.isfinite(predictions)) or np.any(predictions <= 0):
+            raise ValueError(f"модель {version} дает некорректные прогнозы на прогреве")
+        print(f"  [ModelRegistry] Версия {version} прогрета на {len(samples)} объявлениях "
+              f"за {(time.perf_counter() - started_at) * 1000:.0f} мс")
+        return model
+
+    async def reload_model(self) -> bool:
+        """Подхватывает активную версию реестра, если она сменилась. True - модель заменена."""
+        version = self.model_registry.current_version(self.model_section)
+        current = self.fair_price_model.version if self.fair_price_model is not None else None
+        if version is None or version == current:
+            return False
+        # Прогрев на признаках последних объявлений; до первых сообщений - на пустых признаках (все NaN)
+        samples = self.feature_store.sample(256) or [{"section": self.model_section}]
+        model = await asyncio.get_running_loop().run_in_executor(None, self._load_and_warm_up, version, samples)
+        model_version = f"{model.version}+{self.real_estate_model.version}"
+        # Сначала версия для читателей кеша: при ошибке модель не подменяется и попытка повторится
+        await self.result_cache.set_active_version(model_version)
+        self.fair_price_model, self.model_version = model, model_version
+        print(f"  [ModelRegistry] Активная модель: {current or self.real_estate_model.version} -> {model.version}")
+        return True
+
+    async def watch_model_registry(self, interval_seconds: float = 30.0):
+        """Фоновая задача: проверка активной версии в реестре и подмена модели без перезапуска воркера."""
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                await self.reload_model()
+            except Exception as e:
+                print(f"  [ModelRegistry] Новая версия не подключена, работает {self.model_version}: {e}")
+
     async def process_message(self, message: IncomingMessage):
+        # Модель и версия фиксируются на все сообщение: подмена посреди обработки его не затрагивает
+        fair_price_model, model_version = self.fair_price_model, self.model_version
         async with message.process():
             try:
                 msg_body = json.loads(message.body.decode('utf-8'))
@@ -97,17 +182,32 @@ class AnalysisWorker:
 
                 print(f"[{request_id}] [Analysis] Получен запрос на анализ для ID: {ad_id}, MongoDB _id: {mongo_id} (chat_id: {chat_id})")
 
-                poster_data_dict = await self.collection.find_one({"id": ad_id})
-                
-                if not poster_data_dict:
+                features = msg_body.get("features") # Признаки, только что сохраненные DB-воркером
+                if features is not None:
+                    self.feature_store.put(ad_id, features)
+                    self.comparables.add(ad_id, features, msg_body.get("cluster_id"))
+                else:
+                    features = await self.feature_store.get(ad_id)
+
+                if features is None:
                     print(f"[{request_id}] [Analysis] Данные для ID {ad_id} не найдены в базе данных.")
                     return
-                
-                poster_data = PosterData(**poster_data_dict)
 
-                analysis_results = await self.real_estate_model.analyze(poster_data)
+                analysis_results = await self.real_estate_model.analyze(ad_id, features)
+                if fair_price_model is not None and fair_price_model.applies_to(features.get("section")):
+                    fair_price = fair_price_model.predict(features)
+                    analysis_results.update(verdict(features.get("price"), fair_price))
+                comparables = self.comparables.query(features, exclude_id=ad_id, cluster_id=msg_body.get("cluster_id"))
+                if comparables is not None:
+                    analysis_results["comparables"] = comparables
+                analysis_results["model_version"] = model_version
+                analysis_results["original_ad_url"] = msg_body.get("url")
+                analysis_results["address"] = msg_body.get("address")
+                try:
+                    await self.result_cache.store(ad_id, model_version, analysis_results)
+                except Exception as e:
+                    print(f"[{request_id}] [Analysis] Не удалось сохранить результат в кеш: {e}")
                 analysis_results["request_id"] = request_id
-                analysis_results["original_ad_url"] = poster_data.url
                 if chat_id is not None: # <- Добавляем chat_id, если он есть
                     analysis_results["chat_id"] = chat_id
 
@@ -126,6 +226,8 @@ class AnalysisWorker:
     async def start_consuming(self):
         await self.mq_manager.consume_messages(self.analysis_queue_name, self.process_message)
         print(f"Аналитический воркер слушает очередь '{self.analysis_queue_name}'...")
+        registry_task = asyncio.create_task(self.watch_model_registry(model_registry_poll_seconds))
+        comparables_task = asyncio.create_task(self.comparables.watch(comparables_rebuild_seconds))
         try:
             while True:
                 await asyncio.sleep(3600) 
@@ -134,6 +236,8 @@ class AnalysisWorker:
         except KeyboardInterrupt:
             print("Аналитический воркер остановлен (KeyboardInterrupt).")
         finally:
+            registry_task.cancel()
+            comparables_task.cancel()
             self.db_client.close()
             await self.mq_manager.close()
 
@@ -0,0 +1,202 @@
+"""
+Пакетная переоценка справедливой цены всех объявлений коллекции posters.
+
+python -m ML.batch_rescore --registry data/models/registry [--section rent] [--workers 4] [--max-rate 20000]
+python -m ML.batch_rescore --model data/models/fair_price_rent.pkl [--all]
+
+Объявления раздела читаются курсором по _id пачками --chunk-size (только входные колонки ML.featurizer, цена и id),
+пачки считаются пулом процессов через пакетный API модели (PosterBatch -> матрица -> один проход ансамбля),
+результат пишется в поле fair_price документа (predicted_price, price_deviation_pct, investment_attractiveness,
+model_version, scored_at) неупорядоченным bulk_write. updated_at не меняется: переоценка - не изменение
+объявления, и инкрементальный экспорт bd/export_parquet.py ее не выгружает.
+
+Пропускаются объявления, уже оцененные этой версией модели (--all - пересчитать все, например после обновления
+рыночной статистики). После каждой записанной пачки в --checkpoint сохраняется последний _id: прерванный запуск
+с той же версией модели продолжает с этого места. Чтобы не мешать интерактивному анализу, процессы пула работают
+с пониженным приоритетом, в обработке не больше 2 x --workers пачек, а --max-rate ограничивает число объявлений в секунду.
+"""
+import argparse
+import json
+import os
+import time
+from collections import deque
+from datetime import datetime
+from multiprocessing import Pool
+from typing import Dict, Any, Optional, List
+
+import numpy as np
+from bson import ObjectId
+from pymongo import MongoClient, ASCENDING, UpdateOne
+
+from ML.fair_price_model import FairPriceModel, verdict
+from ML.featurizer import INPUT_COLUMNS
+from ML.model_registry import ModelRegistry
+from posterBatch import PosterBatch
+
+RESULT_FIELD = "fair_price"
+
+_model: Optional[FairPriceModel] = None # Модель процесса пула (загружается один раз в _init_worker)
+
+
+def _load_model(registry_root: Optional[str], section: str, model_path: Optional[str],
+                version: Optional[str] = None) -> FairPriceModel:
+    if model_path:
+        return FairPriceModel.load(model_path)
+    registry = ModelRegistry(registry_root)
+    version = version or registry.current_version(section)
+    if version is None:
+        raise ValueError(f"В реестре '{registry_root}' нет активной версии ({section})")
+    return registry.load(section, version)
+
+
+def _init_worker(registry_root: Optional[str], section: str, model_path: Optional[str], version: str, nice: int):
+    global _model
+    if nice:
+        os.nice(nice)
+    _model = _load_model(registry_root, section, model_path, version)
+
+
+def _score_chunk(documents: List[Dict[str, Any]]) -> np.ndarray:
+    batch = PosterBatch.from_documents(documents, INPUT_COLUMNS)
+    return _model.predict_matrix(_model.matrix_from_batch(batch))
+
+
+def load_checkpoint(path: str) -> Optional[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_checkpoint(path: str, state: Dict[str, Any]):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({**state, "saved_at": datetime.utcnow().isoformat()}, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _chunks(cursor, chunk_size: int):
+    chunk = []
+    for document in cursor:
+        chunk.append(document)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _updates(documents: List[Dict[str, Any]], prices: np.ndarray, model_version: str) -> List[UpdateOne]:
+    scored_at = datetime.utcnow()
+    operations = []
+    for document, fair_price in zip(documents, prices):
+        if not np.isfinite(fair_price) or fair_price <= 0:
+            continue
+        result = verdict(document.get("price"), float(fair_price))
+        result.update({"model_version": model_version, "scored_at": scored_at})
+        operations.append(UpdateOne({"_id": document["_id"]}, {"$set": {RESULT_FIELD: result}}))
+    return operations
+
+
+def rescore(collection, checkpoint_path: str, registry_root: Optional[str] = None, section: str = "rent",
+            model_path: Optional[str] = None, workers: int = 0, chunk_size: int = 5000,
+            max_rate: float = 0.0, rescore_all: bool = False, nice: int = 10) -> Dict[str, Any]:
+    """
+    Переоценивает объявления раздела section моделью из реестра (активная версия) или из файла model_path.
+    max_rate - не больше стольких объявлений в секунду (0 - без ограничения).
+    """
+    model = _load_model(registry_root, section, model_path)
+    section = model.section
+    workers = workers or max(1, (os.cpu_count() or 2) - 1)
+
+    query: Dict[str, Any] = {"section": section, "price": {"$gt": 0}}
+    if not rescore_all:
+        query[f"{RESULT_FIELD}.model_version"] = {"$ne": model.version}
+    state = load_checkpoint(checkpoint_path)
+    resumed = bool(state and not state.get("finished") and state.get("model_version") == model.version
+                   and state.get("section") == section and state.get("rescore_all") == rescore_all)
+    if resumed:
+        last_id = state["last_id"]
+        query["_id"] = {"$gt": ObjectId(last_id) if ObjectId.is_valid(last_id) else last_id}
+        print(f"  [BatchRescore] Продолжение с _id {last_id} (уже оценено {state['scored']})")
+    state = {"model_version": model.version, "section": section, "rescore_all": rescore_all,
+             "last_id": state["last_id"] if resumed else None, "scored": state["scored"] if resumed else 0,
+             "finished": False}
+
+    projection = {"_id": 1, "price": 1, **{name: 1 for name in INPUT_COLUMNS}}
+    cursor = collection.find(query, projection, sort=[("_id", ASCENDING)], batch_size=chunk_size)
+    started = time.monotonic()
+    processed = chunks_done = 0
+    pool = Pool(workers, initializer=_init_worker, initargs=(registry_root, section, model_path, model.version, nice))
+    try:
+        pending = deque()
+        chunks = _chunks(cursor, chunk_size)
+        exhausted = False
+        while pending or not exhausted:
+            # Пачки читаются из MongoDB, пока пул считает предыдущие; очередь ограничена - память тоже
+            while not exhausted and len(pending) < 2 * workers:
+                documents = next(chunks, None)
+                if documents is None:
+                    exhausted = True
+                else:
+                    pending.append((documents, pool.apply_async(_score_chunk, (documents,))))
+            if not pending:
+                break
+            documents, result = pending.popleft()
+            operations = _updates(documents, result.get(), model.version)
+            if operations:
+                collection.bulk_write(operations, ordered=False)
+            # Пачки записываются в порядке _id: после записи все объявления до last_id оценены
+            processed += len(documents)
+            chunks_done += 1
+            state["scored"] += len(operations)
+            state["last_id"] = str(documents[-1]["_id"])
+            save_checkpoint(checkpoint_path, state)
+
+            elapsed = time.monotonic() - started
+            if max_rate > 0 and processed / max_rate > elapsed:
+                time.sleep(processed / max_rate - elapsed)
+            if chunks_done % 20 == 0:
+                print(f"  [BatchRescore] Обработано {processed}, {processed / max(elapsed, 1e-9):.0f} объявлений/с")
+    finally:
+        cursor.close()
+        pool.terminate()
+        pool.join()
+
+    state["finished"] = True
+    save_checkpoint(checkpoint_path, state)
+    elapsed = time.monotonic() - started
+    stats = {"model_version": model.version, "processed": processed, "scored": state["scored"],
+             "seconds": round(elapsed, 1), "per_second": round(processed / max(elapsed, 1e-9))}
+    print(f"  [BatchRescore] Готово: {stats}")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пакетная переоценка справедливой цены объявлений коллекции posters")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--registry", help="Каталог реестра ML/model_registry.py (берется активная версия)")
+    source.add_argument("--model", help="Файл модели ML/train_model.py --output")
+    parser.add_argument("--section", default="rent", help="Раздел реестра: rent или purchase")
+    parser.add_argument("--checkpoint", help="Файл контрольной точки (по умолчанию data/models/rescore_<section>.json)")
+    parser.add_argument("--mongo-uri", default=os.getenv("MONGO_URI", "mongodb://localhost:27017/"))
+    parser.add_argument("--db", default=os.getenv("MONGO_DB_NAME", "real_estate_db"))
+    parser.add_argument("--collection", default=os.getenv("MONGO_COLLECTION_NAME", "posters"))
+    parser.add_argument("--workers", type=int, default=0, help="Процессов пула (0 - число ядер минус одно)")
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    parser.add_argument("--max-rate", type=float, default=0.0, help="Не больше стольких объявлений в секунду (0 - без ограничения)")
+    parser.add_argument("--all", action="store_true", help="Пересчитать и объявления, уже оцененные этой версией модели")
+    args = parser.parse_args()
+
+    client = MongoClient(args.mongo_uri)
+    try:
+        rescore(client[args.db][args.collection], args.checkpoint or f"data/models/rescore_{args.section}.json",
+                registry_root=args.registry, section=args.section, model_path=args.model, workers=args.workers,
+                chunk_size=args.chunk_size, max_rate=args.max_rate, rescore_all=args.all)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+"""
+Похожие объявления ("аналоги") и оценка цены по ним.
+
+Объявление - точка в нормированном пространстве: координаты в км, log(площади), комнаты, этаж, уровень
+ремонта; масштабы COMPARABLE_SCALES задают, что считается "одинаково непохожим" (1 км ~ 20% площади ~
+1 комната). Для каждого типа сделки - своя часть индекса: KD-дерево (scipy cKDTree) по строкам на момент
+последней перестройки плюс буфер новых строк, который просматривается перебором. Новое или обновленное
+объявление дописывается в буфер за O(1), прежняя строка того же объявления помечается удаленной; когда буфер
+или доля удаленных строк растет, watch() перестраивает дерево в отдельном потоке.
+
+Наполнение: load() при старте AnalysisWorker (активные объявления из MongoDB), далее - признаки из
+сообщений analyze.ad, которые DB-воркер отправляет после каждого сохранения.
+"""
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, List, Sequence, Tuple
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from _config import comparables_k, comparables_active_days
+from posterBatch import PosterBatch
+
+COMPARABLE_COLUMNS = ("id", "price", "section", "area_total", "rooms", "floor", "repair_type",
+                      "coordinates.latitude", "coordinates.longitude")
+COMPARABLE_SCALES = np.array([1.0, 1.0, 0.2, 1.0, 8.0, 1.5]) # км, км, log(площади), комнаты, этаж, ремонт
+MAX_DISTANCE = 3.0 # Дальше в нормированных единицах - уже не аналог
+MIN_COMPARABLES = 3 # Меньше - оценка не дается
+KM_PER_DEGREE = 111.2
+# Уровень ремонта по подстроке значения repair_type (без ремонта < косметический < евро < дизайнерский)
+REPAIR_LEVELS = (("без", 0.0), ("космет", 1.0), ("евро", 2.0), ("дизайн", 3.0))
+DEFAULT_REPAIR_LEVEL = 1.0
+DEFAULT_FLOOR = 5.0
+
+
+def _repair_level(value: str) -> float:
+    value = value.lower()
+    return next((level for key, level in REPAIR_LEVELS if key in value), DEFAULT_REPAIR_LEVEL)
+
+
+def comparable_vectors(batch: PosterBatch) -> Tuple[np.ndarray, np.ndarray]:
+    """(нормированные векторы, маска строк с координатами и площадью)."""
+    lat, lon, area = batch["coordinates.latitude"], batch["coordinates.longitude"], batch["area_total"]
+    valid = np.isfinite(lat) & np.isfinite(lon) & (area > 0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        log_area = np.log(area)
+    # Пропуски необязательных признаков: комнаты - по площади, этаж и ремонт - типичные значения
+    rooms = np.where(np.isnan(batch["rooms"]), np.clip(np.round(area / 30), 0, 5), batch["rooms"])
+    floor = np.where(np.isnan(batch["floor"]), DEFAULT_FLOOR, batch["floor"])
+    repair_column = batch["repair_type"]
+    repair_table = np.array([_repair_level(c) for c in repair_column.categories] + [DEFAULT_REPAIR_LEVEL])
+    repair = repair_table[repair_column.codes]
+    vectors = np.column_stack([
+        lat * KM_PER_DEGREE,
+        lon * KM_PER_DEGREE * np.cos(np.radians(lat)),
+        log_area, rooms, floor, repair,
+    ]) / COMPARABLE_SCALES
+    return vectors, valid
+
+
+def _weighted_median(values: np.ndarray, weights: np.ndarray) -> float:
+    order = np.argsort(values)
+    cumulative = np.cumsum(weights[order])
+    return float(values[order][np.searchsorted(cumulative, cumulative[-1] / 2)])
+
+
+class _Partition:
+    """Строки одного типа сделки: [0, tree_size) - в дереве, [tree_size, size) - буфер."""
+
+    def __init__(self, dimensions: int, capacity: int = 1024):
+        self.vectors = np.empty((capacity, dimensions))
+        self.prices = np.empty(capacity)
+        self.areas = np.empty(capacity)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.ids: List[str] = []
+        self.clusters: List[Optional[str]] = []
+        self.size = 0
+        self.tree: Optional[cKDTree] = None
+        self.tree_size = 0
+        self.dead = 0
+
+    def append(self, ad_id: str, cluster_id: Optional[str], vector: np.ndarray, price: float, area: float) -> int:
+        if self.size == len(self.prices):
+            capacity = 2 * len(self.prices)
+            self.vectors = np.resize(self.vectors, (capacity, self.vectors.shape[1]))
+            self.prices, self.areas = np.resize(self.prices, capacity), np.resize(self.areas, capacity)
+            self.alive = np.concatenate([self.alive, np.zeros(capacity - len(self.alive), dtype=bool)])
+        row = self.size
+        self.vectors[row], self.prices[row], self.areas[row], self.alive[row] = vector, price, area, True
+        self.ids.append(ad_id)
+        self.clusters.append(cluster_id)
+        self.size += 1
+        return row
+
+    def kill(self, row: int):
+        self.alive[row] = False
+        self.dead += 1
+
+    def candidates(self, vector: np.ndarray, count: int):
+        """(строки, расстояния) не дальше MAX_DISTANCE: из дерева с запасом на удаленные строки и весь буфер."""
+        rows, distances = [], []
+        if self.tree is not None and self.tree_size:
+            fetch = min(self.tree_size, count)
+            while True: # Запрос расширяется, пока среди найденных мало живых строк
+                found_distances, found_rows = self.tree.query(vector, k=fetch, distance_upper_bound=MAX_DISTANCE)
+                found_distances, found_rows = np.atleast_1d(found_distances), np.atleast_1d(found_rows)
+                mask = found_rows < self.tree_size # Недостающие соседи возвращаются с индексом tree_size
+                if mask.sum() < fetch or fetch == self.tree_size or self.alive[found_rows[mask]].sum() >= count:
+                    break
+                fetch = min(self.tree_size, 2 * fetch)
+            rows.append(found_rows[mask])
+            distances.append(found_distances[mask])
+        if self.size > self.tree_size:
+            buffer = self.vectors[self.tree_size:self.size]
+            buffer_distances = np.sqrt(((buffer - vector) ** 2).sum(axis=1))
+            mask = buffer_distances <= MAX_DISTANCE
+            rows.append(np.flatnonzero(mask) + self.tree_size)
+            distances.append(buffer_distances[mask])
+        if not rows:
+            return np.empty(0, dtype=np.intp), np.empty(0)
+        rows, distances = np.concatenate(rows), np.concatenate(distances)
+        mask = self.alive[rows]
+        return rows[mask], distances[mask]
+
+
+class ComparablesIndex:
+    def __init__(self, k: int = comparables_k, rebuild_min_buffer: int = 2000, rebuild_fraction: float = 0.1):
+        self.k = k
+        self.rebuild_min_buffer = rebuild_min_buffer
+        self.rebuild_fraction = rebuild_fraction
+        self._partitions: Dict[str, _Partition] = {}
+        self._rows: Dict[str, tuple] = {} # ad_id -> (section, строка)
+        self.rebuilds = 0
+        self.queries = 0
+
+    def _partition(self, section: str) -> _Partition:
+        partition = self._partitions.get(section)
+        if partition is None:
+            partition = self._partitions[section] = _Partition(len(COMPARABLE_SCALES))
+        return partition
+
+    def add_batch(self, batch: PosterBatch, cluster_ids: Optional[Sequence[Optional[str]]] = None) -> int:
+        """Добавляет или обновляет объявления пачки (колонки COMPARABLE_COLUMNS); возвращает число проиндексированных."""
+        vectors, valid = comparable_vectors(batch)
+        ids, sections = batch["id"], batch["section"].to_list()
+        added = 0
+        for i in np.flatnonzero(valid & (batch["price"] > 0)):
+            ad_id, section = ids[i], sections[i]
+            if ad_id is None or section is None:
+                continue
+            self.remove(ad_id)
+            cluster_id = cluster_ids[i] if cluster_ids is not None else None
+            row = self._partition(section).append(ad_id, cluster_id, vectors[i], batch["price"][i], batch["area_total"][i])
+            self._rows[ad_id] = (section, row)
+            added += 1
+        return added
+
+    def add(self, ad_id: str, features: Dict[str, Any], cluster_id: Optional[str] = None) -> bool:
+        """Объявление из плоских признаков ML.feature_store (сообщение analyze.ad)."""
+        batch = PosterBatch.from_features([{**features, "id": ad_id}], COMPARABLE_COLUMNS)
+        return self.add_batch(batch, [cluster_id]) > 0
+
+    def remove(self, ad_id: str):
+        location = self._rows.pop(ad_id, None)
+        if location is not None:
+            section, row = location
+            self._partitions[section].kill(row)
+
+    def query(self, features: Dict[str, Any], exclude_id: Optional[str] = None,
+              cluster_id: Optional[str] = None, k: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        k ближайших аналогов того же типа сделки и оценка цены по медиане цены за м²,
+        взвешенной по близости. Само объявление и его почти-дубликаты (тот же cluster_id) исключаются,
+        из каждого кластера аналогов берется одно объявление.
+        """
+        k = k or self.k
+        batch = PosterBatch.from_features([features], COMPARABLE_COLUMNS)
+        vectors, valid = comparable_vectors(batch)
+        partition = self._partitions.get(features.get("section"))
+        if not valid[0] or partition is None:
+            return None
+        self.queries += 1
+        rows, distances = partition.candidates(vectors[0], 2 * k + 1)
+        order = np.argsort(distances, kind="stable")
+        chosen, seen_clusters = [], {cluster_id} if cluster_id else set()
+        for j in order:
+            row = rows[j]
+            ad_id, row_cluster = partition.ids[row], partition.clusters[row]
+            if ad_id == exclude_id or (row_cluster is not None and row_cluster in seen_clusters):
+                continue
+            if row_cluster is not None:
+                seen_clusters.add(row_cluster)
+            chosen.append((row, float(distances[j])))
+            if len(chosen) == k:
+                break
+        if len(chosen) < MIN_COMPARABLES:
+            return None
+
+        chosen_rows = np.array([row for row, _ in chosen])
+        chosen_distances = np.array([distance for _, distance in chosen])
+        price_per_sqm = partition.prices[chosen_rows] / partition.areas[chosen_rows]
+        median_price_per_sqm = _weighted_median(price_per_sqm, 1.0 / (0.25 + chosen_distances))
+        return {
+            "estimate": int(round(median_price_per_sqm * features["area_total"], -2)),
+            "median_price_per_sqm": round(median_price_per_sqm, 1),
+            "count": len(chosen),
+            "items": [{"ad_id": partition.ids[row], "price": int(partition.prices[row]),
+                       "area_total": round(float(partition.areas[row]), 1), "distance": round(distance, 2)}
+                      for row, distance in chosen],
+        }
+
+    def _needs_rebuild(self, partition: _Partition) -> bool:
+        buffer = partition.size - partition.tree_size
+        return (buffer >= max(self.rebuild_min_buffer, self.rebuild_fraction * partition.tree_size)
+                or partition.dead > self.rebuild_fraction * max(partition.size, 1)
+                or (partition.tree is None and buffer > 0))
+
+    async def rebuild(self, section: str):
+        """Уплотняет строки части и перестраивает дерево; дерево строится в потоке, добавления не блокируются."""
+        partition = self._partitions[section]
+        snapshot_size = partition.size
+        keep = np.flatnonzero(partition.alive[:snapshot_size])
+        vectors = partition.vectors[keep].copy()
+        tree = await asyncio.get_running_loop().run_in_executor(None, cKDTree, vectors)
+
+        # Строки, добавленные во время перестройки, переносятся в буфер новой части
+        rebuilt = _Partition(vectors.shape[1], capacity=max(1024, 2 * partition.size))
+        for row in np.concatenate([keep, np.arange(snapshot_size, partition.size)]):
+            new_row = rebuilt.append(partition.ids[row], partition.clusters[row], partition.vectors[row],
+                                     partition.prices[row], partition.areas[row])
+            if not partition.alive[row]: # Удалена, пока строилось дерево: в дереве строка остается мертвой
+                rebuilt.kill(new_row)
+        rebuilt.tree, rebuilt.tree_size = tree, len(keep)
+        self._partitions[section] = rebuilt
+        self._rows = {ad_id: location for ad_id, location in self._rows.items() if location[0] != section}
+        for row in np.flatnonzero(rebuilt.alive[:rebuilt.size]):
+            self._rows[rebuilt.ids[row]] = (section, int(row))
+        self.rebuilds += 1
+
+    async def watch(self, interval_seconds: float = 30.0):
+        """Фоновая задача: перестройка частей, у которых вырос буфер или накопились удаленные строки."""
+        while True:
+            await asyncio.sleep(interval_seconds)
+            for section in list(self._partitions):
+                try:
+                    if self._needs_rebuild(self._partitions[section]):
+                        await self.rebuild(section)
+                except Exception as e:
+                    print(f"  [Comparables] Не удалось перестроить индекс '{section}': {e}")
+
+    async def load(self, collection, active_days: float = comparables_active_days, batch_size: int = 5000) -> int:
+        """Начальное наполнение: объявления, сохраненные за последние active_days дней."""
+        since = datetime.utcnow() - timedelta(days=active_days)
+        projection = {"_id": 0, **{name.split(".")[0]: 1 for name in COMPARABLE_COLUMNS}}
+        cursor = collection.find({"updated_at": {"$gte": since}}, projection).batch_size(batch_size)
+        loaded, documents = 0, []
+        async for document in cursor:
+            documents.append(document)
+            if len(documents) >= batch_size:
+                loaded += self.add_batch(PosterBatch.from_documents(documents, COMPARABLE_COLUMNS))
+                documents = []
+        if documents:
+            loaded += self.add_batch(PosterBatch.from_documents(documents, COMPARABLE_COLUMNS))
+        for section in list(self._partitions):
+            await self.rebuild(section)
+        return loaded
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"size": len(self._rows), "queries": self.queries, "rebuilds": self.rebuilds,
+                "buffer": {section: p.size - p.tree_size for section, p in self._partitions.items()}}
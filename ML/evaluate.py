@@ -0,0 +1,271 @@
+"""
+Офлайн-оценка модели справедливой цены и замер стоимости инференса на выгрузке bd/export_parquet.py.
+
+python -m ML.evaluate --dataset data/export/posters [--section rent] [--folds 5] [--output report.json]
+python -m ML.evaluate --dataset data/export/posters --baseline-registry data/models/registry [--tolerance-pct 2]
+python -m ML.evaluate --dataset data/export/posters --candidate-model fast.pkl --baseline-model current.pkl
+
+Кросс-валидация кодом ML/train_model.py (_fit - тот же featurizer и оценщик) по двум схемам:
+  - district: фолды из целых районов (район целиком либо в обучении, либо в проверке) - насколько модель
+    переносится на районы, которых не видела;
+  - time: скользящее начало по времени появления объявления (дата публикации, иначе первое сохранение;
+    см. load_dataset в ML/train_model.py) - обучение на более ранних объявлениях, проверка на следующем
+    по времени блоке, как при реальном переобучении.
+Для каждой схемы - MAE/RMSE/R²/медианная относительная ошибка по всем out-of-fold прогнозам, по фолдам
+и по сегментам (регион, число комнат, самые крупные районы).
+
+Кандидат (обученный на всем, кроме последнего по времени блока, или --candidate-model) и базовая модель
+(--baseline-model или активная версия --baseline-registry) сравниваются на самых свежих объявлениях
+(--holdout-fraction) по точности, задержке одного объявления (путь AnalysisWorker: словарь признаков),
+пачки (PosterBatch -> матрица -> ансамбль) и пиковой памяти пачки (tracemalloc).
+Кандидат принимается, если его MAE на свежих объявлениях не хуже базового больше чем на --tolerance-pct
+процентов; иначе код возврата 1 (можно использовать как проверку перед публикацией в реестр).
+"""
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+from ML.fair_price_model import FairPriceModel, metrics_of
+from ML.model_registry import ModelRegistry
+from ML.train_model import load_dataset, _drop_outliers, _fit
+from posterBatch import PosterBatch, Categorical
+
+DISTRICT_COLUMN = "district_info.district_name"
+REGION_COLUMN = "district_info.region_name"
+MIN_SEGMENT_ROWS = 30 # Меньше - метрики сегмента не показываются: слишком шумные
+ROOM_SEGMENTS = ("студия", "1", "2", "3", "4+")
+
+
+def district_folds(batch: PosterBatch, n_folds: int, seed: int = 0) -> np.ndarray:
+    """
+    Номер фолда каждой строки: районы целиком раскладываются по фолдам жадно (крупные первыми - в наименее
+    заполненный фолд), чтобы фолды были близки по размеру. Строки без района - отдельная группа.
+    """
+    groups, inverse, sizes = np.unique(batch[DISTRICT_COLUMN].codes, return_inverse=True, return_counts=True)
+    order = np.random.RandomState(seed).permutation(len(groups))
+    order = order[np.argsort(-sizes[order], kind="stable")]
+    load = np.zeros(n_folds, dtype=np.int64)
+    fold_of_group = np.empty(len(groups), dtype=np.int64)
+    for group in order:
+        fold = int(np.argmin(load))
+        fold_of_group[group] = fold
+        load[fold] += sizes[group]
+    return fold_of_group[inverse]
+
+
+def district_splits(batch: PosterBatch, n_folds: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+    folds = district_folds(batch, n_folds)
+    return [(np.flatnonzero(folds != fold), np.flatnonzero(folds == fold)) for fold in range(n_folds)]
+
+
+def time_splits(listed_at: np.ndarray, n_folds: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """Скользящее начало: объявления по времени появления делятся на n_folds + 1 блоков, фолд k обучается на блоках 0..k-1."""
+    blocks = np.array_split(np.argsort(listed_at, kind="stable"), n_folds + 1)
+    return [(np.concatenate(blocks[:k]), blocks[k]) for k in range(1, n_folds + 1)]
+
+
+def room_segments(rooms: np.ndarray) -> np.ndarray:
+    labels = np.full(len(rooms), None, dtype=object)
+    known = ~np.isnan(rooms)
+    labels[known & (rooms == 0)] = ROOM_SEGMENTS[0]
+    for count in (1, 2, 3):
+        labels[known & (rooms == count)] = ROOM_SEGMENTS[count]
+    labels[known & (rooms >= 4)] = ROOM_SEGMENTS[4]
+    return labels
+
+
+def segment_metrics(batch: PosterBatch, y: np.ndarray, predicted: np.ndarray,
+                    top_districts: int = 10) -> Dict[str, Dict[str, Dict[str, float]]]:
+    """Метрики по регионам, числу комнат и top_districts самым крупным районам (строки с прогнозом)."""
+    scored = np.isfinite(predicted)
+    districts = batch[DISTRICT_COLUMN]
+    counts = np.bincount(districts.codes[scored & (districts.codes >= 0)], minlength=len(districts.categories))
+    largest = {districts.categories[i] for i in np.argsort(-counts, kind="stable")[:top_districts] if counts[i]}
+    labels = {
+        "region": np.array(batch[REGION_COLUMN].to_list(), dtype=object),
+        "rooms": room_segments(batch["rooms"]),
+        "district": np.array([name if name in largest else None for name in districts.to_list()], dtype=object),
+    }
+    result = {}
+    for segment, values in labels.items():
+        result[segment] = {}
+        for value in sorted({v for v in values[scored] if v is not None}):
+            mask = scored & (values == value)
+            if mask.sum() >= MIN_SEGMENT_ROWS:
+                result[segment][value] = metrics_of(y[mask], predicted[mask])
+    return result
+
+
+def cross_validate(batch: PosterBatch, y: np.ndarray, splits: List[Tuple[np.ndarray, np.ndarray]]) -> Dict[str, Any]:
+    """Out-of-fold прогнозы: на каждом фолде featurizer и оценщик обучаются заново только на его обучающей части."""
+    predicted = np.full(len(y), np.nan)
+    folds = []
+    for fold, (train_idx, test_idx) in enumerate(splits):
+        started = time.perf_counter()
+        featurizer, ensemble = _fit(batch.take(train_idx), y[train_idx])
+        predicted[test_idx] = np.expm1(ensemble.predict(featurizer.transform(batch.take(test_idx))))
+        folds.append({**metrics_of(y[test_idx], predicted[test_idx]), "train_rows": int(len(train_idx)),
+                      "seconds": round(time.perf_counter() - started, 1)})
+        print(f"  [Evaluate] Фолд {fold + 1}/{len(splits)}: {folds[-1]}")
+    scored = np.isfinite(predicted)
+    return {"overall": metrics_of(y[scored], predicted[scored]), "folds": folds,
+            "segments": segment_metrics(batch, y, predicted)}
+
+
+def feature_rows(batch: PosterBatch) -> List[Dict[str, Any]]:
+    """Плоские словари признаков (как в ML.feature_store) - вход AnalysisWorker для замера одиночного инференса."""
+    lists = {}
+    for name, column in batch.columns.items():
+        if isinstance(column, Categorical):
+            lists[name] = column.to_list()
+        elif column.dtype == np.int8:
+            lists[name] = [None if v < 0 else bool(v) for v in column.tolist()]
+        elif column.dtype.kind == "f":
+            lists[name] = [None if v != v else v for v in column.tolist()]
+        else:
+            lists[name] = column.tolist()
+    return [{name: values[i] for name, values in lists.items()} for i in range(len(batch))]
+
+
+def measure_latency(model: FairPriceModel, batch: PosterBatch, single_rows: int = 200,
+                    batch_rows: int = 10000, repeats: int = 3) -> Dict[str, float]:
+    """
+    Задержка одного объявления (predict по словарю признаков, перцентили в мс), пачки batch_rows
+    (лучшее из repeats, мс и мкс на объявление) и пиковая память пачки по tracemalloc (МБ).
+    """
+    rows = feature_rows(batch.take(np.arange(min(single_rows, len(batch)))))
+    sample = batch.take(np.arange(min(batch_rows, len(batch))))
+    model.predict(rows[0]) # Прогрев: ленивые импорты, кеши стеммера и хешей
+    single = []
+    for row in rows:
+        started = time.perf_counter()
+        model.predict(row)
+        single.append((time.perf_counter() - started) * 1000)
+
+    batch_ms = featurize_ms = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter()
+        matrix = model.matrix_from_batch(sample)
+        featurized = time.perf_counter()
+        model.predict_matrix(matrix)
+        featurize_ms = min(featurize_ms, (featurized - started) * 1000)
+        batch_ms = min(batch_ms, (time.perf_counter() - started) * 1000)
+
+    tracemalloc.start()
+    try:
+        model.predict_matrix(model.matrix_from_batch(sample))
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    model_bytes = model.ensemble.nbytes()
+    if model.featurizer.text_weights is not None:
+        model_bytes += model.featurizer.text_weights.nbytes
+    return {
+        "single_p50_ms": round(float(np.percentile(single, 50)), 3),
+        "single_p95_ms": round(float(np.percentile(single, 95)), 3),
+        "single_p99_ms": round(float(np.percentile(single, 99)), 3),
+        "batch_rows": len(sample),
+        "batch_ms": round(batch_ms, 1),
+        "batch_featurize_ms": round(featurize_ms, 1),
+        "batch_us_per_row": round(batch_ms * 1000 / max(len(sample), 1), 2),
+        "batch_peak_mb": round(peak / 2 ** 20, 1),
+        "model_mb": round(model_bytes / 2 ** 20, 2),
+    }
+
+
+def _holdout_report(model: FairPriceModel, batch: PosterBatch, y: np.ndarray, listed_at: np.ndarray,
+                    stored: bool = True) -> Dict[str, Any]:
+    predicted = model.predict_matrix(model.matrix_from_batch(batch))
+    report = {"version": model.version, "metrics": metrics_of(y, predicted), "latency": measure_latency(model, batch)}
+    # Готовая модель, обученная позже начала отложенной части, могла видеть эти объявления: сравнение в ее пользу
+    trained_at = np.datetime64(model.trained_at, "ms").astype(np.int64)
+    report["trained_on_holdout"] = stored and bool(listed_at.min() <= trained_at)
+    return report
+
+
+def evaluate(dataset_path: str, section: str = "rent", n_folds: int = 5, holdout_fraction: float = 0.15,
+             candidate: Optional[FairPriceModel] = None, baseline: Optional[FairPriceModel] = None,
+             tolerance_pct: float = 2.0) -> Dict[str, Any]:
+    batch, y, listed_at = load_dataset(dataset_path, section)
+    batch, y, listed_at = _drop_outliers(batch, y, listed_at)
+    print(f"  [Evaluate] Объявлений '{section}': {len(y)}")
+    if len(y) < 100:
+        raise ValueError(f"Слишком мало объявлений для оценки: {len(y)}")
+
+    report: Dict[str, Any] = {"section": section, "rows": int(len(y)), "cross_validation": {}}
+    for scheme, splits in (("district", district_splits(batch, n_folds)), ("time", time_splits(listed_at, n_folds))):
+        print(f"  [Evaluate] Кросс-валидация '{scheme}', фолдов: {len(splits)}")
+        report["cross_validation"][scheme] = cross_validate(batch, y, splits)
+        print(f"  [Evaluate] '{scheme}': {report['cross_validation'][scheme]['overall']}")
+
+    order = np.argsort(listed_at, kind="stable")
+    split = int(len(order) * (1 - holdout_fraction))
+    train_idx, test_idx = order[:split], order[split:]
+    stored = candidate is not None
+    if not stored:
+        featurizer, ensemble = _fit(batch.take(train_idx), y[train_idx])
+        candidate = FairPriceModel(ensemble, featurizer, section)
+    holdout, y_holdout, listed_holdout = batch.take(test_idx), y[test_idx], listed_at[test_idx]
+    report["candidate"] = _holdout_report(candidate, holdout, y_holdout, listed_holdout, stored)
+    print(f"  [Evaluate] Кандидат на {len(test_idx)} свежих объявлениях: {report['candidate']}")
+
+    if baseline is not None:
+        report["baseline"] = _holdout_report(baseline, holdout, y_holdout, listed_holdout)
+        print(f"  [Evaluate] Базовая модель: {report['baseline']}")
+        candidate_mae, baseline_mae = report["candidate"]["metrics"]["mae"], report["baseline"]["metrics"]["mae"]
+        candidate_latency, baseline_latency = report["candidate"]["latency"], report["baseline"]["latency"]
+        report["comparison"] = {
+            "mae_change_pct": round((candidate_mae / baseline_mae - 1) * 100, 2) if baseline_mae else 0.0,
+            "single_speedup": round(baseline_latency["single_p50_ms"] / max(candidate_latency["single_p50_ms"], 1e-9), 2),
+            "batch_speedup": round(baseline_latency["batch_ms"] / max(candidate_latency["batch_ms"], 1e-9), 2),
+            "tolerance_pct": tolerance_pct,
+            "baseline_trained_on_holdout": report["baseline"]["trained_on_holdout"],
+        }
+        report["comparison"]["accepted"] = report["comparison"]["mae_change_pct"] <= tolerance_pct
+        print(f"  [Evaluate] Сравнение с базовой моделью: {report['comparison']}")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Кросс-валидация, сравнение с базовой моделью и замер инференса")
+    parser.add_argument("--dataset", required=True, help="Каталог выгрузки bd/export_parquet.py")
+    parser.add_argument("--section", default="rent", help="Тип сделки: rent или purchase")
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--holdout-fraction", type=float, default=0.15)
+    parser.add_argument("--candidate-model", help="Готовая модель-кандидат вместо обучения на выгрузке")
+    baseline = parser.add_mutually_exclusive_group()
+    baseline.add_argument("--baseline-model", help="Файл базовой модели")
+    baseline.add_argument("--baseline-registry", help="Реестр ML/model_registry.py: базовая - активная версия раздела")
+    parser.add_argument("--tolerance-pct", type=float, default=2.0, help="Допустимый рост MAE кандидата, %%")
+    parser.add_argument("--output", help="Путь к отчету JSON")
+    args = parser.parse_args()
+
+    candidate = FairPriceModel.load(args.candidate_model) if args.candidate_model else None
+    baseline_model = None
+    if args.baseline_model:
+        baseline_model = FairPriceModel.load(args.baseline_model)
+    elif args.baseline_registry:
+        registry = ModelRegistry(args.baseline_registry)
+        version = registry.current_version(args.section)
+        if version is None:
+            parser.error(f"в реестре нет активной версии ({args.section})")
+        baseline_model = registry.load(args.section, version)
+
+    report = evaluate(args.dataset, args.section, args.folds, args.holdout_fraction, candidate, baseline_model,
+                      args.tolerance_pct)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"  [Evaluate] Отчет сохранен в '{args.output}'")
+    if not report.get("comparison", {}).get("accepted", True):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
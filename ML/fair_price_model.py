@@ -0,0 +1,107 @@
+import hashlib
+import os
+import pickle
+from datetime import datetime
+from typing import Dict, Any, Optional, Sequence
+
+import numpy as np
+
+from ML.featurizer import Featurizer
+from ML.tree_ensemble import TreeEnsemble
+
+
+class FairPriceModel:
+    """
+    Модель справедливой цены: градиентный бустинг по log(1 + цена) для одного типа сделки (section).
+    Обучается ML/train_model.py, хранится одним pickle-файлом (массивы TreeEnsemble + состояние Featurizer
+    + метрики) без объектов sklearn: он нужен только при обучении.
+    Вход - плоские признаки {имя колонки: значение} (как в ML.feature_store) или PosterBatch;
+    матрицу признаков в обоих случаях строит тот же Featurizer, что и при обучении.
+    """
+
+    def __init__(self, ensemble: TreeEnsemble, featurizer: Featurizer, section: str,
+                 version: Optional[str] = None, metrics: Optional[Dict[str, float]] = None,
+                 trained_at: Optional[datetime] = None):
+        self.ensemble = ensemble
+        self.featurizer = featurizer
+        self.section = section
+        self.trained_at = trained_at or datetime.utcnow()
+        self.version = version or self._make_version()
+        self.metrics = metrics or {}
+
+    def _make_version(self) -> str:
+        digest = hashlib.sha1(pickle.dumps(self.ensemble.to_state())).hexdigest()[:8]
+        return f"fair-price-{self.section}-{self.trained_at:%Y%m%d%H%M}-{digest}"
+
+    def applies_to(self, section: Optional[str]) -> bool:
+        return section == self.section
+
+    @property
+    def feature_names(self) -> Sequence[str]:
+        return self.featurizer.feature_names
+
+    def matrix(self, rows: Sequence[Dict[str, Any]]) -> np.ndarray:
+        """Матрица признаков для плоских словарей признаков."""
+        return self.featurizer.transform_features(rows)
+
+    def matrix_from_batch(self, batch) -> np.ndarray:
+        """Матрица признаков из PosterBatch без построчного Python-кода."""
+        return self.featurizer.transform(batch)
+
+    def predict_matrix(self, matrix: np.ndarray) -> np.ndarray:
+        return np.expm1(self.ensemble.predict(matrix))
+
+    def predict_many(self, rows: Sequence[Dict[str, Any]]) -> np.ndarray:
+        """Справедливые цены для пачки объявлений (один проход ансамбля на пачку)."""
+        if not rows:
+            return np.empty(0)
+        return self.predict_matrix(self.matrix(rows))
+
+    def predict(self, features: Dict[str, Any]) -> float:
+        return float(self.predict_matrix(self.matrix([features]))[0])
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump({
+                "ensemble": self.ensemble.to_state(), "featurizer": self.featurizer.to_state(), "section": self.section,
+                "version": self.version, "metrics": self.metrics, "trained_at": self.trained_at,
+            }, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "FairPriceModel":
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+        return cls(TreeEnsemble.from_state(state["ensemble"]), Featurizer.from_state(state["featurizer"]), state["section"],
+                   version=state["version"], metrics=state.get("metrics"), trained_at=state.get("trained_at"))
+
+
+def verdict(listed_price: Optional[float], fair_price: float) -> Dict[str, Any]:
+    """Отклонение цены объявления от справедливой: положительное - завышена."""
+    result: Dict[str, Any] = {"predicted_price": int(round(fair_price, -2))}
+    if listed_price:
+        deviation = (listed_price - fair_price) / fair_price * 100
+        result["price_deviation_pct"] = round(deviation, 1)
+        if deviation <= -10:
+            result["investment_attractiveness"] = "Высокая"
+        elif deviation <= 5:
+            result["investment_attractiveness"] = "Средняя"
+        else:
+            result["investment_attractiveness"] = "Низкая"
+    return result
+
+
+def metrics_of(y_true: np.ndarray, y_pred: np.ndarray) -> Dict[str, float]:
+    """MAE, RMSE, R² и медианная относительная ошибка (в процентах)."""
+    errors = y_pred - y_true
+    total = np.sum((y_true - y_true.mean()) ** 2)
+    return {
+        "mae": round(float(np.mean(np.abs(errors))), 1),
+        "rmse": round(float(np.sqrt(np.mean(errors ** 2))), 1),
+        "r2": round(float(1 - np.sum(errors ** 2) / total), 4) if total > 0 else 0.0,
+        "median_ape_pct": round(float(np.median(np.abs(errors) / y_true) * 100), 2),
+        "n": int(len(y_true)),
+    }
+
@@ -0,0 +1,108 @@
+from collections import OrderedDict
+from itertools import islice
+from typing import Dict, Any, List, Optional
+
+from _config import feature_store_capacity
+
+# Признаки моделей (точечные пути в документе объявления): правила RealEstateModel и входные колонки
+# ML.featurizer (INPUT_COLUMNS).
+FEATURE_FIELDS = (
+    "price",
+    "section",
+    "area_total",
+    "rooms",
+    "floor",
+    "building_total_floors",
+    "kitchen_area",
+    "living_area",
+    "year_built",
+    "balcony",
+    "parking",
+    "elevator",
+    "building_type",
+    "repair_type",
+    "coordinates.latitude",
+    "coordinates.longitude",
+    "district_info.region_name",
+    "district_info.district_name",
+    "district_info.nearest_metro_station",
+    "district_info.metro_distance",
+    "district_info.metro_stations_nearby",
+    "district_info.minutes_to_centre",
+    "district_info.public_transport_accessibility",
+    "district_info.crime_rate",
+    "district_info.green_area_percentage",
+    "district_info.median_price_per_sqm",
+    "economic_data.unemployment_rate",
+    "economic_data.avg_earnings",
+)
+FEATURE_TEXT_FIELDS = ("description",)
+
+# Промах LRU читает документ по обычному индексу id; проекция сокращает только объем ответа (без списка фото)
+FEATURE_PROJECTION = {"_id": 0, "id": 1, **{name: 1 for name in FEATURE_FIELDS + FEATURE_TEXT_FIELDS}}
+
+
+def extract_features(document: Dict[str, Any]) -> Dict[str, Any]:
+    """Плоский словарь признаков {точечный путь: значение} из документа объявления (отсутствующие - None)."""
+    features: Dict[str, Any] = {}
+    for name in FEATURE_FIELDS + FEATURE_TEXT_FIELDS:
+        value: Any = document
+        for part in name.split("."):
+            value = value.get(part) if isinstance(value, dict) else None
+        features[name] = value
+    return features
+
+
+class FeatureStore:
+    """
+    Признаки объявлений для AnalysisWorker.
+    Основной источник - признаки, которые DB-воркер кладет в сообщение analyze.ad после сохранения:
+    они попадают в ограниченный LRU в памяти, и анализ не обращается к MongoDB.
+    При промахе (старое сообщение, перезапуск воркера) из MongoDB возвращается только проекция признаков
+    и описания, а не весь документ со списком фото.
+    """
+
+    def __init__(self, collection, capacity: int = feature_store_capacity):
+        self.collection = collection
+        self.capacity = capacity
+        self._features: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+        self.memory_hits = 0
+        self.mongo_reads = 0
+        self.misses = 0
+
+    async def ensure_indexes(self):
+        # Тот же индекс, что создает DB-воркер (bd/db_worker.py): кто бы ни запустился первым, спецификации совпадают
+        await self.collection.create_index("id", unique=True)
+        print(f"  [FeatureStore] Индекс id коллекции '{self.collection.name}' проверен.")
+
+    def put(self, ad_id: str, features: Dict[str, Any]):
+        self._features[ad_id] = features
+        self._features.move_to_end(ad_id)
+        while len(self._features) > self.capacity:
+            self._features.popitem(last=False)
+
+    async def get(self, ad_id: str) -> Optional[Dict[str, Any]]:
+        """Признаки объявления: из памяти, иначе из MongoDB по проекции; None, если объявления нет в базе."""
+        features = self._features.get(ad_id)
+        if features is not None:
+            self._features.move_to_end(ad_id)
+            self.memory_hits += 1
+            return features
+
+        document = await self.collection.find_one({"id": ad_id}, FEATURE_PROJECTION)
+        if document is None:
+            self.misses += 1
+            return None
+        self.mongo_reads += 1
+        features = extract_features(document)
+        self.put(ad_id, features)
+        return features
+
+    def sample(self, n: int) -> List[Dict[str, Any]]:
+        """Признаки n последних объявлений - живые входы для прогрева новой модели."""
+        return list(islice(reversed(self._features.values()), n))
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"size": len(self._features), "memory_hits": self.memory_hits,
+                "mongo_reads": self.mongo_reads, "misses": self.misses}
@@ -0,0 +1,289 @@
+"""
+Признаки модели справедливой цены - общий код обучения (ML/train_model.py) и инференса (AnalysisWorker).
+
+Featurizer.fit() один раз строит таблицы кодирования по обучающей пачке, transform() превращает
+PosterBatch в матрицу постоянной раскладки (feature_names) колоночными операциями numpy:
+  - числовые поля как есть (NaN - нет значения), булевы - 0/1/NaN;
+  - производные: доля этажа, первый/последний этаж, доли кухни и жилой площади, длина описания;
+  - расстояние до центра города по координатам (гаверсинус);
+  - one-hot для категорий с небольшим словарем (тип дома, ремонт), сглаженное target encoding
+    log(цены за м²) для района и ближайшей станции метро;
+  - флаги ключевых слов описания: один проход регулярного выражения по склеенным описаниям пачки;
+  - текстовая оценка log(цены за м²): гребневая регрессия по хешированным n-граммам описания (ML.text_features).
+Категории перекодируются таблицей по словарю Categorical пачки (десятки значений), а не по строкам.
+"""
+import re
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from ML.text_features import HashedTextVectorizer, fit_text_weights
+from parser.geo_parse.geo_base import EARTH_RADIUS_KM
+from posterBatch import PosterBatch, Categorical
+
+NUMERIC_COLUMNS = (
+    "area_total",
+    "rooms",
+    "floor",
+    "building_total_floors",
+    "kitchen_area",
+    "living_area",
+    "year_built",
+    "district_info.metro_distance",
+    "district_info.metro_stations_nearby",
+    "district_info.minutes_to_centre",
+    "district_info.median_price_per_sqm",
+    "district_info.crime_rate",
+    "district_info.green_area_percentage",
+    "district_info.public_transport_accessibility",
+    "economic_data.avg_earnings",
+    "economic_data.unemployment_rate",
+)
+BOOLEAN_COLUMNS = ("balcony", "parking", "elevator")
+ONE_HOT_COLUMNS = ("building_type", "repair_type")
+TARGET_COLUMNS = ("district_info.district_name", "district_info.nearest_metro_station")
+REGION_COLUMN = "district_info.region_name"
+COORDINATE_COLUMNS = ("coordinates.latitude", "coordinates.longitude")
+TEXT_COLUMN = "description"
+
+# Все колонки PosterBatch, которые читает transform()
+INPUT_COLUMNS = (*NUMERIC_COLUMNS, *BOOLEAN_COLUMNS, *ONE_HOT_COLUMNS, *TARGET_COLUMNS,
+                 REGION_COLUMN, *COORDINATE_COLUMNS, TEXT_COLUMN)
+
+DERIVED_FEATURES = ("floor_ratio", "first_floor", "last_floor", "kitchen_share", "living_share",
+                    "description_length", "centre_distance_km")
+TEXT_SCORE_FEATURE = f"{TEXT_COLUMN}:text_score"
+
+# Флаг -> регулярное выражение по описанию в нижнем регистре (группы без захвата)
+KEYWORDS = {
+    "kw_furniture": r"мебел",
+    "kw_appliances": r"техник|холодильник|стиральн|посудомоечн",
+    "kw_euro_repair": r"евроремонт|дизайнерск\w* ремонт",
+    "kw_needs_repair": r"требует\w* ремонт|без ремонта",
+    "kw_new_building": r"новостро|новый дом|сдан\w* в 20",
+    "kw_view": r"вид на|панорамн",
+    "kw_pets": r"с животными|с питомц",
+    "kw_owner": r"собственник|без комисси",
+    "kw_parking": r"паркинг|машиномест",
+    "kw_walk_to_metro": r"пешком до метро|шаговой доступност",
+}
+_KEYWORDS_RE = re.compile("|".join(f"(?P<{name}>{pattern})" for name, pattern in KEYWORDS.items()))
+_TEXT_SEPARATOR = "\x00"
+
+# Центры городов; для остальных регионов fit() берет медиану координат обучающих объявлений
+CITY_CENTRES = {
+    "Москва": (55.7539, 37.6208),
+    "Санкт-Петербург": (59.9390, 30.3158),
+}
+
+
+def haversine_km(lat1: np.ndarray, lon1: np.ndarray, lat2: np.ndarray, lon2: np.ndarray) -> np.ndarray:
+    """Векторный вариант parser.geo_parse.geo_base.haversine_km (NaN на входе - NaN на выходе)."""
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    a = np.sin((phi2 - phi1) / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(np.radians(lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def _remap(column: Categorical, table: Dict[str, Any], default: Any, missing: Any, dtype) -> np.ndarray:
+    """Значения table для каждой строки: таблица перекодировки по словарю пачки, затем одно индексирование."""
+    remap = np.array([table.get(category, default) for category in column.categories] + [missing], dtype=dtype)
+    return remap[column.codes] # код -1 попадает на последний элемент remap
+
+
+def _as_float(column: np.ndarray) -> np.ndarray:
+    if column.dtype == np.int8: # Булевы колонки PosterBatch: -1 - нет значения
+        return np.where(column < 0, np.nan, column.astype(np.float64))
+    return column.astype(np.float64, copy=False)
+
+
+def keyword_flags(descriptions: np.ndarray) -> np.ndarray:
+    """Матрица (строки x KEYWORDS) из 0/1 за один проход регулярного выражения по склеенным описаниям."""
+    flags = np.zeros((len(descriptions), len(KEYWORDS)), dtype=np.float64)
+    if not len(descriptions):
+        return flags
+    texts = [text.lower().replace(_TEXT_SEPARATOR, " ") if isinstance(text, str) else "" for text in descriptions]
+    ends = np.cumsum([len(text) + 1 for text in texts]) # Позиция после разделителя каждой строки
+    columns = {name: i for i, name in enumerate(KEYWORDS)}
+    positions, hits = [], []
+    for match in _KEYWORDS_RE.finditer(_TEXT_SEPARATOR.join(texts)):
+        positions.append(match.start())
+        hits.append(columns[match.lastgroup])
+    if positions:
+        flags[np.searchsorted(ends, positions, side="right"), hits] = 1.0
+    return flags
+
+
+def _text_target(batch: PosterBatch, prices: np.ndarray, text_matrix: sparse.csr_matrix) -> Tuple[np.ndarray, np.ndarray]:
+    """(log(цены за м²), номера строк с известной ценой за м² и непустым описанием) для текстовой регрессии."""
+    area = batch["area_total"]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        target = np.log(prices / np.where(area > 0, area, np.nan))
+    return target, np.flatnonzero(np.isfinite(target) & (text_matrix.getnnz(axis=1) > 0))
+
+
+class Featurizer:
+    """
+    Раскладка и таблицы кодирования признаков. Состояние - простые словари и списки (to_state/from_state),
+    сохраняется вместе с оценщиком в файле модели, поэтому инференс кодирует признаки так же, как обучение.
+    """
+
+    def __init__(self, one_hot: Dict[str, List[str]], target: Dict[str, Dict[str, float]],
+                 target_prior: float, centres: Dict[str, Tuple[float, float]],
+                 text_weights: Optional[np.ndarray] = None, text_intercept: float = 0.0):
+        self.one_hot = one_hot
+        self.target = target
+        self.target_prior = target_prior
+        self.centres = centres
+        # Модели, обученные до появления текстовой оценки, загружаются без нее (и без ее колонки)
+        self.text_weights = text_weights
+        self.text_intercept = text_intercept
+        self.text_vectorizer = HashedTextVectorizer(len(text_weights)) if text_weights is not None else None
+        self.feature_names = (
+            *NUMERIC_COLUMNS,
+            *BOOLEAN_COLUMNS,
+            *DERIVED_FEATURES,
+            *(f"{column}={category}" for column in ONE_HOT_COLUMNS for category in self.one_hot[column]),
+            *(f"{column}:target" for column in TARGET_COLUMNS),
+            *KEYWORDS,
+            *((TEXT_SCORE_FEATURE,) if text_weights is not None else ()),
+        )
+
+    @classmethod
+    def fit(cls, batch: PosterBatch, prices: np.ndarray, **params) -> "Featurizer":
+        """
+        Таблицы кодирования по обучающей пачке: самые частые категории для one-hot,
+        средний log(цены за м²) категории со сглаживанием к общему среднему для target encoding,
+        веса текстовой оценки по хешированным описаниям.
+        """
+        return cls._fit(batch, prices, HashedTextVectorizer().transform(batch[TEXT_COLUMN]), **params)
+
+    @classmethod
+    def fit_transform(cls, batch: PosterBatch, prices: np.ndarray, text_folds: int = 5,
+                      **params) -> Tuple["Featurizer", np.ndarray]:
+        """
+        fit() и матрица обучающей пачки, в которой текстовая оценка каждой строки получена out-of-fold:
+        на своих же ценах гребневая регрессия по тысячам n-грамм переобучается, и оценщик доверял бы ей сильнее,
+        чем она того стоит на новых объявлениях. Описания хешируются один раз на все фолды.
+        """
+        matrix = HashedTextVectorizer().transform(batch[TEXT_COLUMN])
+        featurizer = cls._fit(batch, prices, matrix, **params)
+        X = featurizer.transform(batch, text_matrix=matrix)
+        target, rows = _text_target(batch, prices, matrix)
+        folds = np.random.RandomState(0).permutation(len(rows)) % text_folds
+        column = featurizer.feature_names.index(TEXT_SCORE_FEATURE)
+        for fold in range(text_folds):
+            train, test = rows[folds != fold], rows[folds == fold]
+            if len(train) and len(test):
+                weights, intercept = fit_text_weights(matrix[train], target[train], params.get("text_alpha", 1.0))
+                X[test, column] = matrix[test] @ weights + intercept
+        return featurizer, X
+
+    @classmethod
+    def _fit(cls, batch: PosterBatch, prices: np.ndarray, text_matrix: sparse.csr_matrix, max_categories: int = 20,
+             min_category_count: int = 10, smoothing: float = 20.0, text_alpha: float = 1.0) -> "Featurizer":
+        one_hot = {}
+        for column in ONE_HOT_COLUMNS:
+            codes = batch[column].codes
+            counts = np.bincount(codes[codes >= 0], minlength=len(batch[column].categories))
+            top = [i for i in np.argsort(-counts, kind="stable")[:max_categories] if counts[i] >= min_category_count]
+            one_hot[column] = [batch[column].categories[i] for i in top]
+
+        area = batch["area_total"]
+        log_price_per_sqm = np.log(prices / np.where(area > 0, area, np.nan))
+        known = np.isfinite(log_price_per_sqm)
+        prior = float(log_price_per_sqm[known].mean()) if known.any() else 0.0
+        target = {}
+        for column in TARGET_COLUMNS:
+            codes = batch[column].codes
+            mask = known & (codes >= 0)
+            size = len(batch[column].categories)
+            counts = np.bincount(codes[mask], minlength=size)
+            sums = np.bincount(codes[mask], weights=log_price_per_sqm[mask], minlength=size)
+            encoded = (sums + smoothing * prior) / (counts + smoothing)
+            target[column] = {category: round(float(encoded[i]), 6)
+                              for i, category in enumerate(batch[column].categories) if counts[i]}
+
+        centres = dict(CITY_CENTRES)
+        region = batch[REGION_COLUMN]
+        lats, lons = batch[COORDINATE_COLUMNS[0]], batch[COORDINATE_COLUMNS[1]]
+        for code, name in enumerate(region.categories):
+            mask = (region.codes == code) & np.isfinite(lats) & np.isfinite(lons)
+            if name not in centres and mask.any():
+                centres[name] = (float(np.median(lats[mask])), float(np.median(lons[mask])))
+
+        text_target, rows = _text_target(batch, prices, text_matrix)
+        if len(rows):
+            text_weights, text_intercept = fit_text_weights(text_matrix[rows], text_target[rows], text_alpha)
+        else:
+            text_weights, text_intercept = np.zeros(text_matrix.shape[1], dtype=np.float32), prior
+        return cls(one_hot, target, prior, centres, text_weights, text_intercept)
+
+    def text_scores(self, descriptions: Sequence[Optional[str]],
+                    text_matrix: Optional[sparse.csr_matrix] = None) -> np.ndarray:
+        """Оценка log(цены за м²) по тексту: разреженная матрица на вектор весов; NaN - в описании нет слов."""
+        if text_matrix is None:
+            text_matrix = self.text_vectorizer.transform(descriptions)
+        scores = text_matrix @ self.text_weights + self.text_intercept
+        return np.where(text_matrix.getnnz(axis=1) > 0, scores, np.nan).astype(np.float64)
+
+    def transform(self, batch: PosterBatch, text_matrix: Optional[sparse.csr_matrix] = None) -> np.ndarray:
+        """
+        Матрица (len(batch) x len(feature_names)) float64 с NaN на месте отсутствующих значений.
+        text_matrix - уже хешированные описания пачки, если они есть у вызывающего.
+        """
+        n = len(batch)
+        blocks = [np.column_stack([_as_float(batch[column]) for column in (*NUMERIC_COLUMNS, *BOOLEAN_COLUMNS)])]
+
+        floor, total = batch["floor"], batch["building_total_floors"]
+        area = np.where(batch["area_total"] > 0, batch["area_total"], np.nan)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            floor_ratio = floor / np.where(total > 0, total, np.nan)
+            first_floor = np.where(np.isnan(floor), np.nan, (floor == 1).astype(np.float64))
+            last_floor = np.where(np.isnan(floor_ratio), np.nan, (floor >= total).astype(np.float64))
+            kitchen_share = batch["kitchen_area"] / area
+            living_share = batch["living_area"] / area
+        descriptions = batch[TEXT_COLUMN]
+        description_length = np.array([len(text) if isinstance(text, str) else np.nan for text in descriptions],
+                                      dtype=np.float64)
+        region = batch[REGION_COLUMN]
+        centre_lat = _remap(region, {name: lat for name, (lat, _) in self.centres.items()}, np.nan, np.nan, np.float64)
+        centre_lon = _remap(region, {name: lon for name, (_, lon) in self.centres.items()}, np.nan, np.nan, np.float64)
+        centre_distance = haversine_km(batch[COORDINATE_COLUMNS[0]], batch[COORDINATE_COLUMNS[1]], centre_lat, centre_lon)
+        blocks.append(np.column_stack([floor_ratio, first_floor, last_floor, kitchen_share, living_share,
+                                       description_length, centre_distance]))
+
+        for column in ONE_HOT_COLUMNS:
+            categories = self.one_hot[column]
+            one_hot = np.zeros((n, len(categories)), dtype=np.float64)
+            index = _remap(batch[column], {category: i for i, category in enumerate(categories)}, -1, -1, np.int64)
+            rows = np.flatnonzero(index >= 0)
+            one_hot[rows, index[rows]] = 1.0
+            blocks.append(one_hot)
+
+        # Категория вне таблицы - общее среднее, нет значения - NaN (оценщик сам выбирает ветку для пропусков)
+        blocks.append(np.column_stack([
+            _remap(batch[column], self.target[column], self.target_prior, np.nan, np.float64) for column in TARGET_COLUMNS
+        ]).reshape(n, len(TARGET_COLUMNS)))
+        blocks.append(keyword_flags(descriptions))
+        if self.text_weights is not None:
+            blocks.append(self.text_scores(descriptions, text_matrix)[:, None])
+        return np.hstack(blocks)
+
+    def transform_features(self, rows: Sequence[Dict[str, Any]]) -> np.ndarray:
+        """Для плоских словарей признаков ML.feature_store (инференс по сообщениям analyze.ad)."""
+        return self.transform(PosterBatch.from_features(rows, INPUT_COLUMNS))
+
+    def transform_posters(self, posters: Sequence[Any]) -> np.ndarray:
+        return self.transform(PosterBatch.from_posters(posters))
+
+    def to_state(self) -> Dict[str, Any]:
+        return {"one_hot": self.one_hot, "target": self.target, "target_prior": self.target_prior,
+                "centres": {name: list(centre) for name, centre in self.centres.items()},
+                "text_weights": self.text_weights, "text_intercept": self.text_intercept}
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> "Featurizer":
+        return cls(state["one_hot"], state["target"], state["target_prior"],
+                   {name: tuple(centre) for name, centre in state["centres"].items()},
+                   state.get("text_weights"), state.get("text_intercept", 0.0))
@@ -0,0 +1,148 @@
+"""
+Файловый реестр моделей справедливой цены.
+
+python -m ML.model_registry --root data/models/registry list --section rent
+python -m ML.model_registry --root data/models/registry publish --model data/models/fair_price_rent.pkl [--no-activate]
+python -m ML.model_registry --root data/models/registry activate --section rent --version <версия>
+
+Раскладка: <root>/<section>/<версия>/model.pkl + manifest.json (версия, признаки, метрики, sha256 файла модели)
+и <root>/<section>/CURRENT с активной версией. Версия публикуется во временный каталог и переименовывается
+целиком, CURRENT заменяется через os.replace: читатель видит либо старое, либо новое состояние.
+Откат - activate на одну из прежних версий; сами версии не удаляются.
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+from ML.fair_price_model import FairPriceModel
+
+CURRENT_FILE = "CURRENT"
+MODEL_FILE = "model.pkl"
+MANIFEST_FILE = "manifest.json"
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _write_atomic(path: str, text: str):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+class ModelRegistry:
+    def __init__(self, root: str):
+        self.root = root
+
+    def _section_dir(self, section: str) -> str:
+        return os.path.join(self.root, section)
+
+    def _version_dir(self, section: str, version: str) -> str:
+        return os.path.join(self.root, section, version)
+
+    def publish(self, model: FairPriceModel, activate: bool = True) -> str:
+        """Сохраняет модель новой версией реестра (и делает ее активной, если activate)."""
+        version_dir = self._version_dir(model.section, model.version)
+        if os.path.exists(version_dir):
+            raise ValueError(f"Версия {model.version} уже есть в реестре")
+        tmp_dir = os.path.join(self._section_dir(model.section), f".tmp-{model.version}")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        model_path = os.path.join(tmp_dir, MODEL_FILE)
+        model.save(model_path)
+        manifest = {
+            "version": model.version,
+            "section": model.section,
+            "trained_at": model.trained_at.isoformat(),
+            "published_at": datetime.utcnow().isoformat(),
+            "feature_names": list(model.feature_names),
+            "metrics": model.metrics,
+            "sha256": _sha256(model_path),
+        }
+        _write_atomic(os.path.join(tmp_dir, MANIFEST_FILE), json.dumps(manifest, ensure_ascii=False, indent=2))
+        os.rename(tmp_dir, version_dir)
+        print(f"  [ModelRegistry] Опубликована версия {model.version} ({model.section}), метрики: {model.metrics}")
+        if activate:
+            self.activate(model.section, model.version)
+        return model.version
+
+    def activate(self, section: str, version: str):
+        if not os.path.exists(os.path.join(self._version_dir(section, version), MANIFEST_FILE)):
+            raise ValueError(f"Версии {version} ({section}) нет в реестре")
+        _write_atomic(os.path.join(self._section_dir(section), CURRENT_FILE), version + "\n")
+        print(f"  [ModelRegistry] Активная версия ({section}): {version}")
+
+    def current_version(self, section: str) -> Optional[str]:
+        """Активная версия или None; чтение одного короткого файла - можно вызывать часто."""
+        try:
+            with open(os.path.join(self._section_dir(section), CURRENT_FILE), "r", encoding="utf-8") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def manifest(self, section: str, version: str) -> Dict[str, Any]:
+        with open(os.path.join(self._version_dir(section, version), MANIFEST_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def list_versions(self, section: str) -> List[Dict[str, Any]]:
+        """Манифесты всех версий раздела, от старых к новым."""
+        section_dir = self._section_dir(section)
+        if not os.path.isdir(section_dir):
+            return []
+        manifests = [self.manifest(section, name) for name in os.listdir(section_dir)
+                     if os.path.exists(os.path.join(section_dir, name, MANIFEST_FILE))]
+        return sorted(manifests, key=lambda manifest: manifest["published_at"])
+
+    def load(self, section: str, version: str) -> FairPriceModel:
+        """Модель версии с проверкой контрольной суммы и схемы признаков из манифеста."""
+        manifest = self.manifest(section, version)
+        model_path = os.path.join(self._version_dir(section, version), MODEL_FILE)
+        if _sha256(model_path) != manifest["sha256"]:
+            raise ValueError(f"Файл модели версии {version} не совпадает с манифестом")
+        model = FairPriceModel.load(model_path)
+        if list(model.feature_names) != manifest["feature_names"]:
+            raise ValueError(f"Признаки модели версии {version} не совпадают с манифестом")
+        return model
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Реестр моделей справедливой цены")
+    parser.add_argument("--root", required=True, help="Каталог реестра")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    list_parser = commands.add_parser("list", help="Версии раздела")
+    list_parser.add_argument("--section", default="rent")
+
+    publish = commands.add_parser("publish", help="Добавить модель из файла ML/train_model.py --output")
+    publish.add_argument("--model", required=True)
+    publish.add_argument("--no-activate", action="store_true", help="Только опубликовать, не делать активной")
+
+    activate = commands.add_parser("activate", help="Сделать версию активной (в том числе откат)")
+    activate.add_argument("--section", default="rent")
+    activate.add_argument("--version", required=True)
+    args = parser.parse_args()
+
+    registry = ModelRegistry(args.root)
+    if args.command == "list":
+        current = registry.current_version(args.section)
+        for manifest in registry.list_versions(args.section):
+            marker = "*" if manifest["version"] == current else " "
+            print(f"{marker} {manifest['version']}  {manifest['published_at']}  {manifest['metrics']}")
+    elif args.command == "publish":
+        registry.publish(FairPriceModel.load(args.model), activate=not args.no_activate)
+    else:
+        registry.activate(args.section, args.version)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Признаки из текста описаний без словаря: токенизация, дешевый стеммер для русского и хеширование n-грамм.
+
+HashedTextVectorizer.transform() превращает пачку описаний в разреженную матрицу фиксированной ширины
+(n_features): каждая n-грамма основ слов попадает в колонку crc32(n-грамма) mod n_features со знаком
+из старшего бита хеша (коллизии частично гасят друг друга), значения - log(1 + |счетчик|) со знаком,
+строки нормированы по L2. Векторизатор не хранит состояния: одинаково работает при обучении и в
+AnalysisWorker, и не требует прохода по всему корпусу. iter_transform() обрабатывает поток описаний кусками.
+
+Градиентному бустингу тысячи разреженных колонок не подходят, поэтому в модель текст попадает одним
+признаком: fit_text_weights() обучает по матрице гребневую регрессию log(цены за м²), а ее прогноз
+(ML.featurizer, "description:text_score") вычисляется произведением разреженной матрицы на вектор весов.
+"""
+import re
+import zlib
+from functools import lru_cache
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse.linalg import lsqr
+
+_WORD_RE = re.compile(r"[а-яa-z0-9]+")
+STOPWORDS = frozenset(
+    "и в во на с со к ко по из у за от до для о об а но или не ни что это как все так же бы ли то "
+    "при без под над через есть также очень".split()
+)
+# Окончания от длинных к коротким: отрезается первое подходящее, если основа остается не короче MIN_STEM
+SUFFIXES = tuple(sorted((
+    "иями", "ями", "ами", "ого", "его", "ому", "ему", "ыми", "ими", "ая", "яя", "ое", "ее", "ые", "ие",
+    "ой", "ей", "ий", "ый", "ую", "юю", "ов", "ев", "ах", "ях", "ом", "ем", "ам", "ям", "ия", "ья", "ье",
+    "ьи", "ии", "ать", "ять", "ить", "еть", "ется", "ются", "ится", "ятся", "ешь", "ет", "ут", "ют", "ит",
+    "ат", "ят", "ный", "ная", "ное", "ные", "ного", "ной", "ным", "ных", "ость", "ости",
+    "а", "я", "о", "е", "ы", "и", "у", "ю", "ь", "й",
+), key=len, reverse=True))
+MIN_STEM = 3
+
+
+@lru_cache(maxsize=200000)
+def stem(word: str) -> str:
+    """Основа слова: отрезание самого длинного из SUFFIXES (словарь не нужен, повторы берутся из кеша)."""
+    if len(word) <= MIN_STEM or not ("а" <= word[0] <= "я"):
+        return word
+    for suffix in SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= MIN_STEM:
+            return word[:-len(suffix)]
+    return word
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Основы значимых слов описания в исходном порядке."""
+    if not text:
+        return []
+    return [stem(word) for word in _WORD_RE.findall(text.lower().replace("ё", "е")) if word not in STOPWORDS]
+
+
+@lru_cache(maxsize=500000)
+def _hash(term: str) -> int:
+    return zlib.crc32(term.encode("utf-8"))
+
+
+class HashedTextVectorizer:
+    def __init__(self, n_features: int = 2 ** 18, ngram_max: int = 2):
+        self.n_features = n_features
+        self.ngram_max = ngram_max
+
+    def _terms(self, stems: List[str]) -> Iterator[str]:
+        for n in range(1, self.ngram_max + 1):
+            for start in range(len(stems) - n + 1):
+                yield " ".join(stems[start:start + n])
+
+    def transform(self, texts: Sequence[Optional[str]]) -> sparse.csr_matrix:
+        """Матрица (len(texts) x n_features), float32; пустое описание - пустая строка матрицы."""
+        rows, columns, signs = [], [], []
+        for row, text in enumerate(texts):
+            for term in self._terms(tokenize(text)):
+                h = _hash(term)
+                rows.append(row)
+                columns.append(h % self.n_features)
+                signs.append(1.0 if h & 0x80000000 else -1.0)
+        matrix = sparse.csr_matrix((np.array(signs, dtype=np.float32), (rows, columns)),
+                                   shape=(len(texts), self.n_features)) # Повторы n-грамм суммируются
+        matrix.data = np.sign(matrix.data) * np.log1p(np.abs(matrix.data))
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        matrix = sparse.diags(np.where(norms > 0, 1.0 / np.maximum(norms, 1e-12), 0.0).astype(np.float32)) @ matrix
+        matrix.eliminate_zeros()
+        return matrix.tocsr()
+
+    def iter_transform(self, texts: Iterable[Optional[str]], chunk_size: int = 10000) -> Iterator[sparse.csr_matrix]:
+        """Поток описаний -> матрицы по chunk_size строк (память не зависит от размера корпуса)."""
+        chunk = []
+        for text in texts:
+            chunk.append(text)
+            if len(chunk) == chunk_size:
+                yield self.transform(chunk)
+                chunk = []
+        if chunk:
+            yield self.transform(chunk)
+
+
+def fit_text_weights(matrix: sparse.csr_matrix, target: np.ndarray, alpha: float = 1.0,
+                     max_iter: int = 200) -> Tuple[np.ndarray, float]:
+    """Гребневая регрессия target по хешированным признакам (LSQR с затуханием): (веса, свободный член)."""
+    intercept = float(target.mean())
+    weights = lsqr(matrix, target - intercept, damp=np.sqrt(alpha), iter_lim=max_iter)[0]
+    return weights.astype(np.float32), intercept
@@ -0,0 +1,159 @@
+"""
+Обучение модели справедливой цены на выгрузке bd/export_parquet.py.
+
+python -m ML.train_model --dataset data/export/posters --registry data/models/registry [--section rent] [--no-activate]
+python -m ML.train_model --dataset data/export/posters --output data/models/fair_price_rent.pkl
+
+Из партиций читаются только входные колонки ML.featurizer; повторные выгрузки одного объявления схлопываются
+(остается строка с наибольшим updated_at). Качество оценивается на отложенных последних по времени появления
+объявлениях, после чего таблицы кодирования и модель строятся заново на всех данных и сохраняются
+вместе с метриками. Время появления - дата публикации, иначе first_seen_at (первое сохранение DB-воркером),
+иначе самая ранняя выгрузка объявления: updated_at перезаписывается при каждом повторном разборе, и по нему
+старое объявление выглядело бы новым.
+"""
+import argparse
+from typing import Optional, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+from sklearn.ensemble import HistGradientBoostingRegressor
+
+from ML.fair_price_model import FairPriceModel, metrics_of
+from ML.feature_store import FEATURE_FIELDS, FEATURE_TEXT_FIELDS
+from ML.featurizer import Featurizer, INPUT_COLUMNS
+from ML.model_registry import ModelRegistry
+from ML.tree_ensemble import TreeEnsemble
+from posterBatch import PosterBatch
+
+# Проверка экспорта ансамбля: столько строк обучающей матрицы, допустимое расхождение в log(1 + цена)
+EXPORT_CHECK_ROWS = 5000
+EXPORT_TOLERANCE = 1e-9
+
+
+def _timestamps_ms(column) -> np.ndarray:
+    """Колонка timestamp -> миллисекунды int64, нет значения - -1."""
+    return column.cast(pa.timestamp("ms")).cast(pa.int64()).fill_null(-1).to_numpy()
+
+
+def load_dataset(path: str, section: str) -> Tuple[PosterBatch, np.ndarray, np.ndarray]:
+    """
+    (пачка входных колонок Featurizer, цены, время появления в мс) для объявлений типа section,
+    по одной строке на объявление.
+    """
+    dataset = ds.dataset(path, format="parquet", partitioning="hive")
+    # В файлах ранних выгрузок нет first_seen_at: общая схема всех файлов, недостающие колонки читаются как null
+    schema = pa.unify_schemas([dataset.schema, *(fragment.physical_schema for fragment in dataset.get_fragments())])
+    dataset = ds.dataset(path, schema=schema, format="parquet", partitioning="hive")
+    columns = ["id", "price", "section", "updated_at", "published_at", *INPUT_COLUMNS]
+    if "first_seen_at" in schema.names:
+        columns.append("first_seen_at")
+    table = dataset.to_table(columns=columns)
+    table = table.filter(pc.and_(pc.equal(table["section"].cast(pa.string()), section), pc.greater(table["price"], 0)))
+
+    ids = np.asarray(table["id"].to_pylist(), dtype=object)
+    updated_at = _timestamps_ms(table["updated_at"])
+    order = np.lexsort((updated_at, ids))
+    sorted_ids = ids[order]
+    first_of_id = np.ones(len(order), dtype=bool)
+    first_of_id[1:] = sorted_ids[1:] != sorted_ids[:-1]
+    last_of_id = np.ones(len(order), dtype=bool)
+    last_of_id[:-1] = sorted_ids[1:] != sorted_ids[:-1]
+    keep = order[last_of_id]
+
+    published = pc.strptime(pc.utf8_slice_codeunits(table["published_at"].cast(pa.string()), 0, 10),
+                            format="%Y-%m-%d", unit="ms", error_is_null=True)
+    listed_at = _timestamps_ms(published)[keep]
+    fallback = updated_at[order][first_of_id] # Самая ранняя выгрузка объявления (группы идут в том же порядке, что keep)
+    if "first_seen_at" in table.column_names:
+        first_seen_at = _timestamps_ms(table["first_seen_at"])[keep]
+        fallback = np.where(first_seen_at >= 0, first_seen_at, fallback)
+    listed_at = np.where(listed_at >= 0, listed_at, fallback)
+
+    table = table.take(pa.array(keep))
+    y = table["price"].to_numpy(zero_copy_only=False).astype(np.float64)
+    return PosterBatch.from_arrow(table), y, listed_at
+
+
+def _drop_outliers(batch: PosterBatch, y: np.ndarray, listed_at: np.ndarray):
+    """Отбрасывает цены за м² вне 0.5-99.5 перцентилей (ошибки разбора, цены-заглушки)."""
+    area = batch["area_total"]
+    price_per_sqm = y / np.where(area > 0, area, np.nan)
+    low, high = np.nanpercentile(price_per_sqm, [0.5, 99.5])
+    mask = np.isnan(price_per_sqm) | ((price_per_sqm >= low) & (price_per_sqm <= high))
+    return batch.take(mask), y[mask], listed_at[mask]
+
+
+def make_estimator(random_state: int = 0) -> HistGradientBoostingRegressor:
+    return HistGradientBoostingRegressor(
+        max_iter=500, learning_rate=0.06, max_leaf_nodes=31, min_samples_leaf=20,
+        l2_regularization=1.0, early_stopping=True, validation_fraction=0.1, random_state=random_state,
+    )
+
+
+def _fit(batch: PosterBatch, y: np.ndarray) -> Tuple[Featurizer, TreeEnsemble]:
+    featurizer, X = Featurizer.fit_transform(batch, y)
+    empty = np.isnan(X).all(axis=0)
+    if empty.any(): # Признак еще не заполняется: константа вместо NaN, раскладка матрицы не меняется
+        print(f"  [TrainModel] Признаки без значений: {[name for name, e in zip(featurizer.feature_names, empty) if e]}")
+        X[:, empty] = 0.0
+    estimator = make_estimator().fit(X, np.log1p(y))
+    # Инференс идет по экспортированным массивам: расхождение с sklearn - ошибка экспорта, а не модели
+    ensemble = TreeEnsemble.from_sklearn(estimator)
+    check = X[:EXPORT_CHECK_ROWS]
+    error = float(np.max(np.abs(ensemble.predict(check) - estimator.predict(check)), initial=0.0))
+    if error > EXPORT_TOLERANCE:
+        raise ValueError(f"Экспортированный ансамбль расходится с моделью sklearn на {error:g}")
+    return featurizer, ensemble
+
+
+def train(dataset_path: str, output_path: Optional[str] = None, section: str = "rent",
+          holdout_fraction: float = 0.15) -> FairPriceModel:
+    missing = [name for name in INPUT_COLUMNS if name not in FEATURE_FIELDS + FEATURE_TEXT_FIELDS]
+    if missing:
+        print(f"  [TrainModel] Колонок нет в признаках ML.feature_store (на инференсе будут пустыми): {missing}")
+
+    batch, y, listed_at = load_dataset(dataset_path, section)
+    batch, y, listed_at = _drop_outliers(batch, y, listed_at)
+    print(f"  [TrainModel] Объявлений '{section}' для обучения: {len(y)}")
+    if len(y) < 100:
+        raise ValueError(f"Слишком мало объявлений для обучения: {len(y)}")
+
+    # Отложенная выборка - самые свежие объявления: так оценивается работа на будущих данных.
+    # Таблицы кодирования строятся только по обучающей части, чтобы target encoding не видел отложенные цены
+    order = np.argsort(listed_at, kind="stable")
+    split = int(len(order) * (1 - holdout_fraction))
+    train_idx, test_idx = order[:split], order[split:]
+    featurizer, ensemble = _fit(batch.take(train_idx), y[train_idx])
+    predicted = np.expm1(ensemble.predict(featurizer.transform(batch.take(test_idx))))
+    metrics = metrics_of(y[test_idx], predicted)
+    print(f"  [TrainModel] Метрики на отложенных {len(test_idx)} объявлениях: {metrics}")
+
+    featurizer, ensemble = _fit(batch, y)
+    model = FairPriceModel(ensemble, featurizer, section, metrics=metrics)
+    print(f"  [TrainModel] Обучена модель {model.version} ({len(featurizer.feature_names)} признаков)")
+    if output_path:
+        model.save(output_path)
+        print(f"  [TrainModel] Модель сохранена в '{output_path}'")
+    return model
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Обучение модели справедливой цены на выгрузке Parquet")
+    parser.add_argument("--dataset", required=True, help="Каталог выгрузки bd/export_parquet.py")
+    parser.add_argument("--output", help="Путь к файлу модели (.pkl)")
+    parser.add_argument("--registry", help="Каталог реестра ML/model_registry.py: опубликовать модель новой версией")
+    parser.add_argument("--no-activate", action="store_true", help="Опубликовать в реестр, не делая версию активной")
+    parser.add_argument("--section", default="rent", help="Тип сделки: rent или purchase")
+    parser.add_argument("--holdout-fraction", type=float, default=0.15)
+    args = parser.parse_args()
+    if not args.output and not args.registry:
+        parser.error("нужен --output или --registry")
+    model = train(args.dataset, args.output, args.section, holdout_fraction=args.holdout_fraction)
+    if args.registry:
+        ModelRegistry(args.registry).publish(model, activate=not args.no_activate)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Ансамбль деревьев в плоских массивах numpy для инференса без sklearn.
+
+TreeEnsemble.from_sklearn() переносит деревья обученного HistGradientBoostingRegressor в общие массивы
+узлов: признак, порог, куда идет пропуск (NaN), левый потомок, значение листа; корни деревьев -
+индексы в этих массивах. Узлы дерева перенумерованы по уровням так, что правый потомок - следующий
+за левым (right = left + 1), а лист ссылается сам на себя (порог +inf, пропуск - "влево").
+Поэтому predict() шагает всеми деревьями одновременно max_depth раз без проверки "дошли ли до листа":
+на каждом уровне для всей пачки (строки x деревья) - несколько векторных операций индексирования.
+
+Состояние - словарь массивов (to_state/from_state): файл модели распаковывается без импорта sklearn.
+"""
+from typing import Dict, Any, List
+
+import numpy as np
+
+ROW_CHUNK = 4096 # Строк за проход: матрица текущих узлов (строки x деревья) остается в кеше процессора
+
+
+def _level_order(nodes) -> List[int]:
+    """Номера узлов дерева sklearn в порядке обхода по уровням, потомки узла - соседние элементы."""
+    order, level = [0], [0]
+    while level:
+        children = []
+        for node in level:
+            if not nodes["is_leaf"][node]:
+                children.extend((int(nodes["left"][node]), int(nodes["right"][node])))
+        order.extend(children)
+        level = children
+    return order
+
+
+class TreeEnsemble:
+    def __init__(self, feature: np.ndarray, threshold: np.ndarray, missing_left: np.ndarray,
+                 left: np.ndarray, value: np.ndarray, roots: np.ndarray, baseline: float, max_depth: int):
+        # Индексы хранятся как intp: numpy не копирует их при каждом индексировании
+        self.feature = feature.astype(np.intp)
+        self.threshold = threshold
+        self.missing_left = missing_left
+        self.left = left.astype(np.intp)
+        self.value = value
+        self.roots = roots.astype(np.intp)
+        self.baseline = baseline
+        self.max_depth = max_depth
+
+    @classmethod
+    def from_sklearn(cls, estimator) -> "TreeEnsemble":
+        """Экспорт обученного HistGradientBoostingRegressor (функция потерь с тождественной связью)."""
+        if estimator.loss not in ("squared_error", "absolute_error", "quantile"):
+            raise ValueError(f"Функция потерь {estimator.loss} не поддерживается")
+        if estimator.n_trees_per_iteration_ != 1:
+            raise ValueError("Поддерживается только регрессия с одним деревом на итерацию")
+
+        features, thresholds, missing, lefts, values, roots = [], [], [], [], [], []
+        max_depth, offset = 0, 0
+        for (predictor,) in estimator._predictors:
+            nodes = predictor.nodes
+            if nodes["is_categorical"].any():
+                raise ValueError("Категориальные разбиения не поддерживаются")
+            order = np.array(_level_order(nodes))
+            position = np.empty(len(nodes), dtype=np.int64)
+            position[order] = np.arange(len(order)) + offset
+            nodes = nodes[order]
+            leaf = nodes["is_leaf"].astype(bool)
+            features.append(np.where(leaf, 0, nodes["feature_idx"]))
+            thresholds.append(np.where(leaf, np.inf, nodes["num_threshold"]))
+            missing.append(leaf | nodes["missing_go_to_left"].astype(bool))
+            lefts.append(np.where(leaf, np.arange(len(nodes)) + offset, position[nodes["left"]]))
+            values.append(np.where(leaf, nodes["value"], 0.0))
+            roots.append(offset)
+            max_depth = max(max_depth, int(nodes["depth"].max()))
+            offset += len(nodes)
+        return cls(np.concatenate(features).astype(np.int32), np.concatenate(thresholds).astype(np.float64),
+                   np.concatenate(missing), np.concatenate(lefts).astype(np.int32),
+                   np.concatenate(values).astype(np.float64), np.array(roots, dtype=np.int32),
+                   float(np.ravel(estimator._baseline_prediction)[0]), max_depth)
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.feature)
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """Сырые прогнозы (baseline + сумма листьев) для матрицы признаков; NaN - пропуск."""
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        result = np.empty(len(X), dtype=np.float64)
+        for start in range(0, len(X), ROW_CHUNK):
+            result[start:start + ROW_CHUNK] = self._predict_chunk(X[start:start + ROW_CHUNK])
+        return result
+
+    def _predict_chunk(self, X: np.ndarray) -> np.ndarray:
+        flat = X.ravel()
+        row_offsets = (np.arange(len(X), dtype=np.intp) * X.shape[1])[:, None]
+        nodes = np.broadcast_to(self.roots, (len(X), self.n_trees)).copy()
+        for _ in range(self.max_depth):
+            x = flat[row_offsets + self.feature[nodes]]
+            go_left = (x <= self.threshold[nodes]) | (self.missing_left[nodes] & np.isnan(x))
+            nodes = self.left[nodes] + ~go_left
+        return self.baseline + self.value[nodes].sum(axis=1)
+
+    def to_state(self) -> Dict[str, Any]:
+        return {"feature": self.feature.astype(np.int32), "threshold": self.threshold,
+                "missing_left": self.missing_left, "left": self.left.astype(np.int32), "value": self.value,
+                "roots": self.roots.astype(np.int32), "baseline": self.baseline, "max_depth": self.max_depth}
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> "TreeEnsemble":
+        return cls(**state)
+
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in (self.feature, self.threshold, self.missing_left,
+                                              self.left, self.value, self.roots))
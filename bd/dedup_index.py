@@ -0,0 +1,217 @@
+import hashlib
+import re
+import zlib
+from datetime import datetime
+from typing import Dict, Any, Optional, List, Tuple, Set, Iterable, Sequence
+
+import numpy as np
+from bson import Binary
+from pymongo import UpdateOne
+
+from _config import dedup_num_perm, dedup_bands, dedup_threshold
+
+_NON_WORD_RE = re.compile(r"[^\w]+")
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64(0xFFFFFFFF)
+_SHINGLE_WORDS = 3
+_GEO_CELL_DEGREES = 0.0005 # ~50 м по широте
+
+
+def listing_shingles(document: Dict[str, Any]) -> Set[str]:
+    """
+    Множество шинглов объявления: тройки слов нормализованного описания
+    плюс квантованные атрибуты (площадь до 1 м², этаж/этажность, ячейка координат ~50 м, комнаты).
+    Атрибуты отличают одинаковые шаблонные описания агентства для разных квартир.
+    """
+    shingles: Set[str] = set()
+    words = _NON_WORD_RE.sub(" ", (document.get("description") or "").lower().replace("ё", "е")).split()
+    if len(words) < _SHINGLE_WORDS:
+        shingles.update(words)
+    else:
+        shingles.update(" ".join(words[i:i + _SHINGLE_WORDS]) for i in range(len(words) - _SHINGLE_WORDS + 1))
+
+    area = document.get("area_total")
+    if area:
+        shingles.add(f"area:{round(float(area))}")
+    if document.get("floor") is not None:
+        shingles.add(f"floor:{document.get('floor')}/{document.get('building_total_floors')}")
+    if document.get("rooms") is not None:
+        shingles.add(f"rooms:{document.get('rooms')}")
+    coordinates = document.get("coordinates") or {}
+    lat, lon = coordinates.get("latitude"), coordinates.get("longitude")
+    if lat is not None and lon is not None:
+        shingles.add(f"geo:{round(float(lat) / _GEO_CELL_DEGREES)}:{round(float(lon) / _GEO_CELL_DEGREES)}")
+    return shingles
+
+
+class MinHasher:
+    """MinHash-сигнатура множества строк: num_perm хешей вида (a*x + b) mod (2^61 - 1) поверх crc32."""
+
+    def __init__(self, num_perm: int = dedup_num_perm, seed: int = 1):
+        self.num_perm = num_perm
+        rng = np.random.RandomState(seed)
+        # a, b < 2^32 и x < 2^32: a*x + b помещается в uint64 без переполнения
+        self._a = rng.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+
+    def signature(self, shingles: Iterable[str]) -> np.ndarray:
+        hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64)
+        if hashes.size == 0:
+            return np.full(self.num_perm, 0xFFFFFFFF, dtype=np.uint32)
+        permuted = (np.outer(hashes, self._a) + self._b) % _MERSENNE_PRIME & _MAX_HASH
+        return permuted.min(axis=0).astype(np.uint32)
+
+
+class DedupIndex:
+    """
+    LSH-индекс почти-дубликатов объявлений (репосты, разные агенты, разные ID одной квартиры).
+    Сигнатура делится на bands полос; объявления с совпавшей хотя бы одной полосой - кандидаты,
+    кандидат считается дубликатом, если оценка сходства Жаккара (доля совпавших хешей) >= threshold.
+    Попарного сравнения нет: запрос - bands обращений к словарю и сравнение с несколькими кандидатами.
+
+    В памяти: словарь ключ полосы -> ID объявлений и матрица сигнатур. В MongoDB (коллекция
+    dedup_signatures рядом с posters) хранятся сигнатура, ключи полос (мультиключевой индекс - для
+    поиска кандидатов без загрузки индекса) и cluster_id; load() восстанавливает индекс при старте.
+    """
+
+    def __init__(self, collection=None, num_perm: int = dedup_num_perm, bands: int = dedup_bands,
+                 threshold: float = dedup_threshold):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) должно делиться на bands ({bands})")
+        self.collection = collection
+        self.hasher = MinHasher(num_perm)
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+
+        self._buckets: Dict[int, List[str]] = {}
+        self._row_of: Dict[str, int] = {}
+        self._cluster_of: Dict[str, str] = {}
+        self._signatures = np.empty((1024, num_perm), dtype=np.uint32)
+        self._size = 0
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("bands")
+        await self.collection.create_index("cluster_id")
+        print(f"  [DedupIndex] Индексы коллекции '{self.collection.name}' проверены.")
+
+    def band_keys(self, signature: np.ndarray) -> List[int]:
+        """Ключи полос: 8 байт blake2b от (номер полосы, хеши полосы) как знаковое int64 для BSON."""
+        rows = signature.reshape(self.bands, self.rows)
+        return [
+            int.from_bytes(hashlib.blake2b(band.tobytes(), digest_size=8, salt=band_no.to_bytes(2, "little")).digest(),
+                           "little", signed=True)
+            for band_no, band in enumerate(rows)
+        ]
+
+    def signature_of(self, document: Dict[str, Any]) -> np.ndarray:
+        return self.hasher.signature(listing_shingles(document))
+
+    def __len__(self) -> int:
+        return len(self._row_of)
+
+    def cluster_of(self, ad_id: str) -> Optional[str]:
+        return self._cluster_of.get(ad_id)
+
+    def query(self, signature: np.ndarray, exclude: Optional[str] = None,
+              keys: Optional[Sequence[int]] = None) -> List[Tuple[str, float]]:
+        """Дубликаты сигнатуры: [(ad_id, оценка сходства)] по убыванию сходства."""
+        candidates: Set[str] = set()
+        for key in keys if keys is not None else self.band_keys(signature):
+            candidates.update(self._buckets.get(key, ()))
+        candidates.discard(exclude)
+        if not candidates:
+            return []
+        ids = list(candidates)
+        rows = self._signatures[[self._row_of[ad_id] for ad_id in ids]]
+        similarity = (rows == signature).mean(axis=1)
+        matches = [(ad_id, float(s)) for ad_id, s in zip(ids, similarity) if s >= self.threshold]
+        matches.sort(key=lambda item: -item[1])
+        return matches
+
+    def add(self, ad_id: str, signature: np.ndarray, cluster_id: Optional[str] = None,
+            keys: Optional[Sequence[int]] = None) -> str:
+        """Добавляет (или заменяет) сигнатуру объявления; возвращает его cluster_id."""
+        keys = keys if keys is not None else self.band_keys(signature)
+        row = self._row_of.get(ad_id)
+        if row is not None: # Повторное сохранение: строка матрицы переиспользуется
+            self._unlink(ad_id, row)
+        if cluster_id is None:
+            matches = self.query(signature, exclude=ad_id, keys=keys)
+            cluster_id = self._cluster_of[matches[0][0]] if matches else ad_id
+
+        if row is None:
+            if self._size == len(self._signatures):
+                self._signatures = np.concatenate([self._signatures, np.empty_like(self._signatures)])
+            row = self._size
+            self._size += 1 # Строки удаленных объявлений не переиспользуются: удаления редки
+            self._row_of[ad_id] = row
+        self._signatures[row] = signature
+        self._cluster_of[ad_id] = cluster_id
+        for key in keys:
+            self._buckets.setdefault(key, []).append(ad_id)
+        return cluster_id
+
+    def _unlink(self, ad_id: str, row: int):
+        for key in self.band_keys(self._signatures[row]):
+            bucket = self._buckets.get(key)
+            if bucket and ad_id in bucket:
+                bucket.remove(ad_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    def remove(self, ad_id: str):
+        row = self._row_of.pop(ad_id, None)
+        if row is not None:
+            self._unlink(ad_id, row)
+            self._cluster_of.pop(ad_id, None)
+
+    async def load(self, batch_size: int = 5000) -> int:
+        """Загружает сохраненные сигнатуры из MongoDB в память."""
+        count = 0
+        cursor = self.collection.find({}, {"sig": 1, "bands": 1, "cluster_id": 1}).batch_size(batch_size)
+        async for document in cursor:
+            signature = np.frombuffer(document["sig"], dtype=np.uint32)
+            if signature.size != self.hasher.num_perm:
+                continue # Сигнатура с другими параметрами - будет пересчитана при следующем сохранении
+            self.add(document["_id"], signature, document.get("cluster_id"), document.get("bands"))
+            count += 1
+        print(f"  [DedupIndex] Загружено сигнатур: {count}")
+        return count
+
+    async def upsert_many(self, documents: Sequence[Dict[str, Any]]) -> Dict[str, str]:
+        """
+        Считает сигнатуры сохраненных объявлений, добавляет их в индекс и пишет в MongoDB одним bulk_write.
+        Возвращает {ad_id: cluster_id}; объявление с cluster_id != ad_id - дубликат ранее виденного.
+        """
+        clusters: Dict[str, str] = {}
+        operations: List[UpdateOne] = []
+        now = datetime.utcnow()
+        for document in documents:
+            ad_id = document.get("id")
+            if not ad_id:
+                continue
+            shingles = listing_shingles(document)
+            if not shingles:
+                continue # Пустое объявление совпало бы со всеми пустыми
+            signature = self.hasher.signature(shingles)
+            keys = self.band_keys(signature)
+            cluster_id = self.add(ad_id, signature, keys=keys)
+            clusters[ad_id] = cluster_id
+            operations.append(UpdateOne(
+                {"_id": ad_id},
+                {"$set": {"sig": Binary(signature.tobytes()), "bands": keys, "cluster_id": cluster_id, "updated_at": now}},
+                upsert=True,
+            ))
+        if operations and self.collection is not None:
+            await self.collection.bulk_write(operations, ordered=False)
+        return clusters
+
+    async def find_candidates(self, keys: Sequence[int], limit: int = 50) -> List[Dict[str, Any]]:
+        """Кандидаты из MongoDB по ключам полос (для процессов, которые не держат индекс в памяти)."""
+        cursor = self.collection.find({"bands": {"$in": list(keys)}}, {"cluster_id": 1, "sig": 1}).limit(limit)
+        return [doc async for doc in cursor]
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"listings": len(self._row_of), "clusters": len(set(self._cluster_of.values())),
+                "buckets": len(self._buckets)}
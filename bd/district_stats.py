@@ -0,0 +1,250 @@
+"""
+Рыночная статистика цены за м² по ключу район × комнатность × тип сделки.
+
+Запись (DB-воркер): каждое новое объявление инкрементирует ($inc) дневной документ своего ключа
+и двух обобщающих ключей (район без учета комнат, регион целиком): счетчик, сумма, сумма квадратов
+и логарифмическая гистограмма (скетч с относительной ошибкой квантилей ALPHA). Гистограммы
+складываются, поэтому скетч окна - сумма дневных скетчей, а пересчет не читает объявления.
+
+Материализация: refresh() пересобирает снимок (count, mean, median, квантили для окон 7/30/90 дней)
+только для ключей, затронутых с прошлого пересчета; в начале нового дня - для всех ключей
+(окно сдвинулось). Чтение (обогащение): DistrictStatsReader держит снимок в памяти, поиск - O(1).
+"""
+import asyncio
+import math
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, List, Sequence, Set, Tuple
+
+from pymongo import ASCENDING, UpdateOne, ReplaceOne
+
+from _config import district_stats_windows_days, district_stats_min_samples
+
+ALPHA = 0.01 # Относительная ошибка квантилей
+_GAMMA = (1 + ALPHA) / (1 - ALPHA)
+_LOG_GAMMA = math.log(_GAMMA)
+QUANTILES = {"p10": 0.10, "p25": 0.25, "median": 0.50, "p75": 0.75, "p90": 0.90}
+ANY = "*" # Значение обобщающего ключа ("любая комнатность", "любой район")
+MIN_PRICE_PER_SQM = 1000.0 # Отсекает цены-заглушки и ошибки разбора
+
+
+def sketch_bin(value: float) -> int:
+    return math.ceil(math.log(value) / _LOG_GAMMA)
+
+
+def bin_value(index: int) -> float:
+    """Оценка значения ячейки: отличается от любого значения в ячейке не более чем на ALPHA."""
+    return 2 * _GAMMA ** index / (_GAMMA + 1)
+
+
+def sketch_quantiles(histogram: Dict[int, int], count: int) -> Dict[str, float]:
+    result: Dict[str, float] = {}
+    targets = sorted(QUANTILES.items(), key=lambda item: item[1])
+    cumulative, position = 0, 0
+    for index in sorted(histogram):
+        cumulative += histogram[index]
+        while position < len(targets) and cumulative > targets[position][1] * (count - 1):
+            result[targets[position][0]] = round(bin_value(index), 1)
+            position += 1
+        if position == len(targets):
+            break
+    return result
+
+
+def rooms_bucket(rooms: Any) -> Optional[str]:
+    if rooms is None:
+        return None
+    rooms = int(rooms)
+    return "4+" if rooms >= 4 else str(rooms)
+
+
+def stats_key(region: str, district: str, rooms: str, section: str) -> str:
+    return "|".join((region, district, rooms, section))
+
+
+def lookup_keys(region: Optional[str], district: Optional[str], rooms: Any, section: Optional[str]) -> List[str]:
+    """Ключи от самого узкого к самому общему: район+комнаты, район, регион."""
+    if not region or not section:
+        return []
+    keys = []
+    bucket = rooms_bucket(rooms)
+    if district:
+        if bucket is not None:
+            keys.append(stats_key(region, district, bucket, section))
+        keys.append(stats_key(region, district, ANY, section))
+    keys.append(stats_key(region, ANY, ANY, section))
+    return keys
+
+
+def price_per_sqm(document: Dict[str, Any]) -> Optional[float]:
+    price, area = document.get("price"), document.get("area_total")
+    if not price or not area or area <= 0:
+        return None
+    value = price / area
+    return value if value >= MIN_PRICE_PER_SQM else None
+
+
+class DistrictStatsStore:
+    """Запись дневных скетчей и материализация снимка по окнам (используется DB-воркером)."""
+
+    def __init__(self, daily_collection, snapshot_collection,
+                 windows_days: Sequence[int] = district_stats_windows_days):
+        self.daily = daily_collection
+        self.snapshot = snapshot_collection
+        self.windows_days = tuple(sorted(windows_days))
+        self._dirty: Set[str] = set()
+        self._refreshed_day: Optional[str] = None
+
+    async def ensure_indexes(self):
+        await self.daily.create_index([("key", ASCENDING), ("day", ASCENDING)])
+        await self.daily.create_index("expires_at", expireAfterSeconds=0)
+        print(f"  [DistrictStats] Индексы коллекции '{self.daily.name}' проверены.")
+
+    async def observe_many(self, documents: Sequence[Dict[str, Any]], observed_at: Optional[datetime] = None) -> int:
+        """Учитывает новые объявления в дневных скетчах; инкременты одной пачки складываются в одну операцию на ключ."""
+        observed_at = observed_at or datetime.utcnow()
+        day = observed_at.strftime("%Y-%m-%d")
+        increments: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        for document in documents:
+            value = price_per_sqm(document)
+            district_info = document.get("district_info") or {}
+            keys = lookup_keys(district_info.get("region_name"),
+                               district_info.get("district_name") or district_info.get("city_name"),
+                               document.get("rooms"), document.get("section"))
+            if value is None or not keys:
+                continue
+            bin_field = f"h.{sketch_bin(value)}"
+            for key in keys:
+                inc = increments[key]
+                inc["count"] += 1
+                inc["sum"] += value
+                inc["sum_sq"] += value * value
+                inc[bin_field] += 1
+        if not increments:
+            return 0
+
+        expires_at = datetime.strptime(day, "%Y-%m-%d") + timedelta(days=self.windows_days[-1] + 1)
+        operations = [
+            UpdateOne({"_id": f"{key}|{day}"},
+                      {"$inc": {name: v if name.startswith("sum") else int(v) for name, v in inc.items()},
+                       "$setOnInsert": {"key": key, "day": day, "expires_at": expires_at}},
+                      upsert=True)
+            for key, inc in increments.items()
+        ]
+        await self.daily.bulk_write(operations, ordered=False)
+        self._dirty.update(increments)
+        return len(operations)
+
+    async def refresh(self, now: Optional[datetime] = None) -> int:
+        """Пересчитывает снимок затронутых ключей (в новый день - всех ключей). Возвращает число ключей."""
+        now = now or datetime.utcnow()
+        today = now.strftime("%Y-%m-%d")
+        first_day = (now - timedelta(days=self.windows_days[-1] - 1)).strftime("%Y-%m-%d")
+        full = self._refreshed_day != today
+        dirty, self._dirty = self._dirty, set()
+        try:
+            refreshed = await self._rebuild(
+                await self.daily.distinct("key", {"day": {"$gte": first_day}}) if full else list(dirty),
+                now, first_day, full,
+            )
+        except Exception:
+            self._dirty |= dirty # Ключи неудачного пересчета будут пересчитаны в следующий раз
+            raise
+        self._refreshed_day = today
+        return refreshed
+
+    async def _rebuild(self, keys: List[str], now: datetime, first_day: str, full: bool) -> int:
+        started_at = datetime.utcnow()
+        window_starts = {days: (now - timedelta(days=days - 1)).strftime("%Y-%m-%d") for days in self.windows_days}
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            sketches: Dict[Tuple[str, int], Dict[str, Any]] = {}
+            cursor = self.daily.find({"key": {"$in": chunk}, "day": {"$gte": first_day}})
+            async for daily in cursor:
+                for days, window_start in window_starts.items():
+                    if daily["day"] < window_start:
+                        continue
+                    sketch = sketches.setdefault((daily["key"], days), {"count": 0, "sum": 0.0, "sum_sq": 0.0, "h": defaultdict(int)})
+                    sketch["count"] += daily.get("count", 0)
+                    sketch["sum"] += daily.get("sum", 0.0)
+                    sketch["sum_sq"] += daily.get("sum_sq", 0.0)
+                    for index, count in (daily.get("h") or {}).items():
+                        sketch["h"][int(index)] += count
+
+            operations = []
+            for key in chunk:
+                windows = {}
+                for days in self.windows_days:
+                    sketch = sketches.get((key, days))
+                    if not sketch or not sketch["count"]:
+                        continue
+                    count = sketch["count"]
+                    mean = sketch["sum"] / count
+                    variance = max(sketch["sum_sq"] / count - mean * mean, 0.0)
+                    windows[f"{days}d"] = {"count": count, "mean": round(mean, 1), "std": round(math.sqrt(variance), 1),
+                                           **sketch_quantiles(sketch["h"], count)}
+                if windows:
+                    region, district, rooms, section = key.split("|")
+                    operations.append(ReplaceOne({"_id": key}, {
+                        "region": region, "district": district, "rooms": rooms, "section": section,
+                        "windows": windows, "updated_at": started_at,
+                    }, upsert=True))
+            if operations:
+                await self.snapshot.bulk_write(operations, ordered=False)
+
+        if full: # Ключи, у которых окно опустело, удаляются из снимка
+            await self.snapshot.delete_many({"updated_at": {"$lt": started_at}})
+        return len(keys)
+
+    async def watch(self, interval_seconds: float = 300.0):
+        """Фоновая задача DB-воркера: периодическая материализация снимка."""
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                refreshed = await self.refresh()
+                if refreshed:
+                    print(f"  [DistrictStats] Снимок статистики обновлен, ключей: {refreshed}")
+            except Exception as e:
+                print(f"  [DistrictStats] Не удалось обновить снимок статистики: {e}")
+
+
+class DistrictStatsReader:
+    """Снимок статистики в памяти процесса: поиск по ключу - обращение к словарю."""
+
+    def __init__(self, snapshot_collection, min_samples: int = district_stats_min_samples):
+        self.snapshot = snapshot_collection
+        self.min_samples = min_samples
+        self._stats: Dict[str, Dict[str, Dict[str, Any]]] = {}
+
+    async def load(self) -> int:
+        stats = {}
+        async for document in self.snapshot.find({}, {"windows": 1}):
+            # Окна от узкого к широкому: свежая статистика предпочтительнее, если выборка достаточна
+            stats[document["_id"]] = dict(sorted(document.get("windows", {}).items(), key=lambda item: int(item[0][:-1])))
+        self._stats = stats # Подмена целиком: читатели не видят наполовину загруженный снимок
+        return len(stats)
+
+    async def watch(self, interval_seconds: float = 300.0):
+        """Фоновая задача: загрузка при старте и периодическая перезагрузка снимка."""
+        while True:
+            try:
+                loaded = await self.load()
+                print(f"  [DistrictStats] Загружен снимок статистики, ключей: {loaded}")
+            except Exception as e:
+                print(f"  [DistrictStats] Не удалось загрузить снимок статистики: {e}")
+            await asyncio.sleep(interval_seconds)
+
+    def lookup(self, region: Optional[str], district: Optional[str], rooms: Any,
+               section: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Статистика самого узкого ключа и окна с выборкой не меньше min_samples (с полями key и window)."""
+        for key in lookup_keys(region, district, rooms, section):
+            windows = self._stats.get(key)
+            if not windows:
+                continue
+            for window, stats in windows.items():
+                if stats["count"] >= self.min_samples:
+                    return {**stats, "key": key, "window": window}
+        return None
+
+    def __len__(self) -> int:
+        return len(self._stats)
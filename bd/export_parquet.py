@@ -0,0 +1,216 @@
+"""
+Потоковый экспорт коллекции posters в Parquet для обучения моделей.
+
+python -m bd.export_parquet --output data/export/posters [--full]
+
+Документы читаются курсором пачками по --batch-size, переводятся в колонки PosterBatch
+(вложенные district_info/economic_data/residential_complex - плоские колонки "district_info.metro_distance")
+и раскладываются по партициям region=<регион>/month=<ГГГГ-ММ> (месяц публикации, иначе месяц первого сохранения).
+Кроме колонок PosterBatch пишутся updated_at (последнее сохранение) и first_seen_at (первое сохранение объявления).
+Память ограничена: у партиции копится не больше --row-group-rows строк, всего в буферах - не больше
+--max-buffered-rows, открыто не больше --max-open-files файлов.
+
+Инкрементальный режим (по умолчанию) выгружает только документы с updated_at после водяного знака
+из прошлого запуска (_export_state.json в каталоге выгрузки). Обновленное объявление попадает в новый
+файл повторно: при чтении берется строка с наибольшим updated_at для каждого id.
+"""
+import argparse
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, List, Tuple
+from urllib.parse import quote
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from bson import ObjectId
+from pymongo import MongoClient, ASCENDING
+
+from posterBatch import PosterBatch, arrow_schema
+
+STATE_FILE = "_export_state.json"
+UNKNOWN_PARTITION = "unknown"
+
+
+def export_schema() -> pa.Schema:
+    return arrow_schema().append(pa.field("updated_at", pa.timestamp("ms"))).append(pa.field("first_seen_at", pa.timestamp("ms")))
+
+
+def partition_of(document: Dict[str, Any]) -> Tuple[str, str]:
+    """(регион, месяц ГГГГ-ММ) документа."""
+    district_info = document.get("district_info") or {}
+    economic_data = document.get("economic_data") or {}
+    region = district_info.get("region_name") or economic_data.get("region_name") or UNKNOWN_PARTITION
+    published_at = document.get("published_at")
+    saved_at = document.get("first_seen_at") or document.get("updated_at")
+    if isinstance(published_at, str) and len(published_at) >= 7:
+        month = published_at[:7]
+    elif isinstance(saved_at, datetime):
+        month = saved_at.strftime("%Y-%m")
+    else:
+        month = UNKNOWN_PARTITION
+    return region, month
+
+
+def load_state(output_dir: str) -> Optional[Dict[str, Any]]:
+    path = os.path.join(output_dir, STATE_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        state = json.load(f)
+    state["watermark"] = datetime.fromisoformat(state["watermark"])
+    return state
+
+
+def save_state(output_dir: str, watermark: datetime, last_id: Optional[str], exported: int):
+    """Атомарно: водяной знак сдвигается только после успешного закрытия всех файлов."""
+    path = os.path.join(output_dir, STATE_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"watermark": watermark.isoformat(), "last_id": last_id, "exported": exported,
+                   "finished_at": datetime.utcnow().isoformat()}, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+class PartitionedParquetWriter:
+    """Буферизованная запись документов в партиции region=/month= с ограничением памяти и открытых файлов."""
+
+    def __init__(self, output_dir: str, run_id: str, row_group_rows: int = 50000,
+                 max_buffered_rows: int = 200000, max_open_files: int = 64):
+        self.output_dir = output_dir
+        self.run_id = run_id
+        self.row_group_rows = row_group_rows
+        self.max_buffered_rows = max_buffered_rows
+        self.max_open_files = max_open_files
+        self.schema = export_schema()
+
+        self._buffers: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        self._buffered_rows = 0
+        self._writers: Dict[Tuple[str, str], pq.ParquetWriter] = {} # Порядок вставки - порядок открытия
+        self._parts: Dict[Tuple[str, str], int] = {}
+        self.rows_written = 0
+        self.files_written = 0
+
+    def add(self, document: Dict[str, Any]):
+        partition = partition_of(document)
+        buffer = self._buffers.setdefault(partition, [])
+        buffer.append(document)
+        self._buffered_rows += 1
+        if len(buffer) >= self.row_group_rows:
+            self._flush(partition)
+        elif self._buffered_rows >= self.max_buffered_rows:
+            self._flush(max(self._buffers, key=lambda key: len(self._buffers[key])))
+
+    def _writer(self, partition: Tuple[str, str]) -> pq.ParquetWriter:
+        writer = self._writers.get(partition)
+        if writer is not None:
+            return writer
+        if len(self._writers) >= self.max_open_files:
+            oldest = next(iter(self._writers))
+            self._writers.pop(oldest).close()
+        region, month = partition
+        directory = os.path.join(self.output_dir, f"region={quote(region, safe='')}", f"month={month}")
+        os.makedirs(directory, exist_ok=True)
+        part = self._parts.get(partition, 0) # Закрытую партицию продолжает следующий файл этого же запуска
+        self._parts[partition] = part + 1
+        writer = pq.ParquetWriter(os.path.join(directory, f"part-{self.run_id}-{part:04d}.parquet"),
+                                  self.schema, compression="zstd")
+        self._writers[partition] = writer
+        self.files_written += 1
+        return writer
+
+    def _flush(self, partition: Tuple[str, str]):
+        documents = self._buffers.pop(partition, [])
+        if not documents:
+            return
+        self._buffered_rows -= len(documents)
+        table = PosterBatch.from_documents(documents).to_arrow()
+        for name in ("updated_at", "first_seen_at"):
+            table = table.append_column(self.schema.field(name),
+                                        pa.array([d.get(name) for d in documents], type=pa.timestamp("ms")))
+        self._writer(partition).write_table(table)
+        self.rows_written += len(documents)
+
+    def close(self):
+        for partition in list(self._buffers):
+            self._flush(partition)
+        for writer in self._writers.values():
+            writer.close()
+        self._writers.clear()
+
+
+def export_posters(collection, output_dir: str, full: bool = False, batch_size: int = 5000,
+                   safety_lag_seconds: float = 60.0, **writer_options) -> Dict[str, Any]:
+    """
+    Выгружает posters в output_dir. Инкрементально - документы с (updated_at, _id) после водяного знака
+    и не позже now - safety_lag_seconds (запись, начатая до запуска, может закоммититься с меньшим updated_at).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    upper_bound = datetime.utcnow() - timedelta(seconds=safety_lag_seconds)
+    state = None if full else load_state(output_dir)
+
+    if state is None:
+        query: Dict[str, Any] = {}
+        sort = [("_id", ASCENDING)]
+    else:
+        watermark, last_id = state["watermark"], state.get("last_id")
+        after = [{"updated_at": {"$gt": watermark}}]
+        if last_id is not None:
+            # В Parquet и в состоянии _id - строка; в запросе нужен исходный ObjectId
+            after.append({"updated_at": watermark, "_id": {"$gt": ObjectId(last_id) if ObjectId.is_valid(last_id) else last_id}})
+        query = {"$or": after, "updated_at": {"$lte": upper_bound}}
+        sort = [("updated_at", ASCENDING), ("_id", ASCENDING)]
+
+    run_id = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+    writer = PartitionedParquetWriter(output_dir, run_id, **writer_options)
+    exported = 0
+    max_seen: Tuple[Optional[datetime], Optional[str]] = (state["watermark"], state.get("last_id")) if state else (None, None)
+    cursor = collection.find(query, sort=sort, batch_size=batch_size)
+    try:
+        for document in cursor:
+            document["_id"] = str(document["_id"]) # ObjectId -> строка: и для Parquet, и для водяного знака
+            writer.add(document)
+            exported += 1
+            updated_at = document.get("updated_at")
+            if isinstance(updated_at, datetime) and updated_at <= upper_bound and \
+                    (max_seen[0] is None or (updated_at, document["_id"]) > (max_seen[0], max_seen[1] or "")):
+                max_seen = (updated_at, document["_id"])
+            if exported % 100000 == 0:
+                print(f"  [ExportParquet] Выгружено документов: {exported}")
+    finally:
+        cursor.close()
+        writer.close()
+
+    # Полная выгрузка без updated_at (старые документы) начинает инкремент с момента запуска
+    watermark, last_id = max_seen if max_seen[0] is not None else (upper_bound, None)
+    save_state(output_dir, watermark, last_id, exported)
+    stats = {"exported": exported, "files": writer.files_written, "mode": "full" if state is None else "incremental",
+             "watermark": watermark.isoformat()}
+    print(f"  [ExportParquet] Готово: {stats}")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Потоковый экспорт коллекции posters в партиционированный Parquet")
+    parser.add_argument("--output", required=True, help="Каталог выгрузки (партиции region=/month=)")
+    parser.add_argument("--mongo-uri", default=os.getenv("MONGO_URI", "mongodb://localhost:27017/"))
+    parser.add_argument("--db", default=os.getenv("MONGO_DB_NAME", "real_estate_db"))
+    parser.add_argument("--collection", default=os.getenv("MONGO_COLLECTION_NAME", "posters"))
+    parser.add_argument("--full", action="store_true", help="Выгрузить всю коллекцию, игнорируя водяной знак")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--row-group-rows", type=int, default=50000)
+    parser.add_argument("--max-buffered-rows", type=int, default=200000)
+    parser.add_argument("--max-open-files", type=int, default=64)
+    args = parser.parse_args()
+
+    client = MongoClient(args.mongo_uri)
+    try:
+        export_posters(client[args.db][args.collection], args.output, full=args.full, batch_size=args.batch_size,
+                       row_group_rows=args.row_group_rows, max_buffered_rows=args.max_buffered_rows,
+                       max_open_files=args.max_open_files)
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, List, Sequence
+
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
+
+
+def period_of(moment: datetime) -> str:
+    """Период бакета - ISO-неделя: '2025-W38'."""
+    iso_year, iso_week, _ = moment.isocalendar()
+    return f"{iso_year}-W{iso_week:02d}"
+
+
+def period_start(moment: datetime) -> datetime:
+    monday = moment - timedelta(days=moment.isoweekday() - 1)
+    return monday.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class PriceHistoryStore:
+    """
+    История цены и статуса объявлений: один документ-бакет на объявление за неделю.
+    Бакет хранит массив точек {t, p, s} (время, цена, статус); точка дописывается только
+    если цена или статус отличаются от последней точки бакета. Первое наблюдение недели
+    всегда открывает бакет, поэтому open_price/drop_pct считаются в пределах недели.
+    Вся логика сравнения и дописывания выполняется на стороне MongoDB одним pipeline-update
+    (без чтения перед записью), наблюдения пачки пишутся одним неупорядоченным bulk_write.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def ensure_indexes(self):
+        # "последние N изменений объявления": бакеты объявления от новых к старым
+        await self.collection.create_index([("ad_id", ASCENDING), ("period", DESCENDING)], unique=True)
+        # "объявления, подешевевшие на X% за неделю"
+        await self.collection.create_index([("period", ASCENDING), ("drop_pct", DESCENDING)])
+        print(f"  [PriceHistory] Индексы коллекции '{self.collection.name}' проверены.")
+
+    @staticmethod
+    def _bucket_update(ad_id: str, price: Optional[int], status: str, observed_at: datetime) -> UpdateOne:
+        period = period_of(observed_at)
+        point = {"t": observed_at, "p": price, "s": status}
+        pipeline = [
+            {"$set": {"_last": {"$arrayElemAt": [{"$ifNull": ["$points", []]}, -1]}}},
+            {"$set": {"_changed": {"$or": [
+                {"$eq": [{"$size": {"$ifNull": ["$points", []]}}, 0]},
+                {"$ne": ["$_last.p", price]},
+                {"$ne": ["$_last.s", {"$literal": status}]},
+            ]}}},
+            {"$set": {
+                "ad_id": {"$literal": ad_id},
+                "period": period,
+                "period_start": period_start(observed_at),
+                "points": {"$cond": [
+                    "$_changed", {"$concatArrays": [{"$ifNull": ["$points", []]}, {"$literal": [point]}]}, "$points"
+                ]},
+                "changes": {"$cond": ["$_changed", {"$add": [{"$ifNull": ["$changes", 0]}, 1]}, "$changes"]},
+                "open_price": {"$ifNull": ["$open_price", price]},
+                "last_price": price,
+                "last_status": {"$literal": status},
+                "last_seen": observed_at,
+            }},
+            {"$set": {
+                "min_price": {"$min": [{"$ifNull": ["$min_price", price]}, price]},
+                # Процент снижения от первой цены недели до текущей (0, если цена выросла или неизвестна)
+                "drop_pct": {"$cond": [
+                    {"$and": [{"$gt": ["$open_price", 0]}, {"$ne": [price, None]}]},
+                    {"$max": [0, {"$multiply": [{"$divide": [{"$subtract": ["$open_price", price]}, "$open_price"]}, 100]}]},
+                    0,
+                ]},
+            }},
+            {"$unset": ["_last", "_changed"]},
+        ]
+        return UpdateOne({"ad_id": ad_id, "period": period}, pipeline, upsert=True)
+
+    async def record_many(self, observations: Sequence[Dict[str, Any]], observed_at: Optional[datetime] = None) -> Dict[str, int]:
+        """
+        observations: [{"id": ..., "price": ..., "status": "active"}] - обычно документы, только что сохраненные DB-воркером.
+        Возвращает счетчики bulk_write; ошибки отдельных операций не прерывают остальные.
+        """
+        observed_at = observed_at or datetime.utcnow()
+        operations = [
+            self._bucket_update(item["id"], item.get("price"), item.get("status") or "active", observed_at)
+            for item in observations if item.get("id")
+        ]
+        if not operations:
+            return {"buckets_created": 0, "buckets_touched": 0, "errors": 0}
+        try:
+            result = await self.collection.bulk_write(operations, ordered=False)
+            return {"buckets_created": result.upserted_count, "buckets_touched": result.matched_count, "errors": 0}
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            print(f"  [PriceHistory] Ошибок записи истории цен: {len(errors)} из {len(operations)}: {errors[:1]}")
+            return {"buckets_created": e.details.get("nUpserted", 0), "buckets_touched": e.details.get("nMatched", 0),
+                    "errors": len(errors)}
+
+    async def record(self, ad_id: str, price: Optional[int], status: str = "active",
+                     observed_at: Optional[datetime] = None) -> None:
+        await self.collection.bulk_write([self._bucket_update(ad_id, price, status, observed_at or datetime.utcnow())])
+
+    async def latest_changes(self, ad_id: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Последние limit точек истории объявления (от новых к старым)."""
+        changes: List[Dict[str, Any]] = []
+        cursor = self.collection.find({"ad_id": ad_id}, {"points": 1, "_id": 0}).sort("period", DESCENDING)
+        async for bucket in cursor:
+            changes.extend(reversed(bucket.get("points", [])))
+            if len(changes) >= limit:
+                break
+        return changes[:limit]
+
+    async def dropped_in_period(self, min_drop_pct: float, period: Optional[str] = None,
+                                limit: int = 100) -> List[Dict[str, Any]]:
+        """Объявления, чья цена за неделю period (по умолчанию текущая) снизилась не менее чем на min_drop_pct процентов."""
+        cursor = self.collection.find(
+            {"period": period or period_of(datetime.utcnow()), "drop_pct": {"$gte": min_drop_pct}},
+            {"_id": 0, "ad_id": 1, "open_price": 1, "last_price": 1, "drop_pct": 1, "last_seen": 1},
+        ).sort("drop_pct", DESCENDING).limit(limit)
+        return [doc async for doc in cursor]
@@ -32,6 +32,11 @@ class MessageQueueManager:
                 print(f"Ошибка подключения к RabbitMQ: {e}")
                 raise
 
+    async def set_prefetch(self, prefetch_count: int):
+        """Ограничивает число неподтвержденных сообщений, которые брокер отдает этому каналу."""
+        await self._channel.set_qos(prefetch_count=prefetch_count)
+        print(f"Prefetch канала: {prefetch_count}")
+
     async def declare_exchange(self, name: str, type: ExchangeType = ExchangeType.DIRECT, durable: bool = True):
         """Объявляет exchange."""
         if name not in self._exchanges:
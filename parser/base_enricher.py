@@ -0,0 +1,24 @@
+from abc import ABC, abstractmethod
+from typing import Tuple
+
+from posterData import PosterData
+
+
+class BaseEnricher(ABC):
+    """
+    Шаг обогащения объявления. Каждый шаг дописывает свои поля в PosterData на месте.
+    name       - уникальное имя шага, на которое ссылаются зависимости других шагов;
+    depends_on - имена шагов, которые должны завершиться до запуска этого;
+    timeout    - лимит времени шага в секундах (по истечении шаг считается неуспешным).
+    """
+    name: str = ""
+    depends_on: Tuple[str, ...] = ()
+    timeout: float = 5.0
+
+    @abstractmethod
+    async def enrich(self, poster_data: PosterData, request_id: str = "N/A") -> bool:
+        """
+        Обогащает poster_data. Возвращает True, если данные были добавлены.
+        Шаг должен сам переживать отсутствие данных от зависимостей (они могли упасть или не успеть).
+        """
+        pass
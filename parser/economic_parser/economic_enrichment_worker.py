@@ -1,47 +1,73 @@
 import asyncio
 import json
+from datetime import date
 from typing import Dict, Any, Optional
 
 import aio_pika
 from aio_pika.abc import IncomingMessage
 
+from _config import economic_snapshot_path, economic_reload_interval_seconds
 from message_queue_manager import MessageQueueManager
 from posterData import PosterData, EconomicData
+from parser.base_enricher import BaseEnricher
+from parser.economic_parser.economic_store import EconomicReferenceStore
 
 class EconomicDataService:
-    async def get_economic_data(self, region_name: str) -> Optional[EconomicData]:
-        print(f"  [EcoService] Запрос экономических данных для региона: '{region_name}'")
-        if "Санкт-Петербург" in region_name:
-            return EconomicData(
-                region_name=region_name,
-                avg_life_expectancy=74.5,
-                key_interest_rate=16.0, 
-                credit_approval_rate=0.65,
-                avg_earnings=100000.0, 
-                gdp_per_capita=25000.0, 
-                unemployment_rate=3.0
-            )
-        elif "Москва" in region_name:
-            return EconomicData(
-                region_name=region_name,
-                avg_life_expectancy=78.0,
-                key_interest_rate=16.0,
-                credit_approval_rate=0.70,
-                avg_earnings=150000.0,
-                gdp_per_capita=40000.0,
-                unemployment_rate=2.5
-            )
-        elif "Ленинградская область" in region_name:
-            return EconomicData(
-                region_name=region_name,
-                avg_life_expectancy=72.0,
-                key_interest_rate=16.0,
-                credit_approval_rate=0.60,
-                avg_earnings=70000.0,
-                gdp_per_capita=18000.0,
-                unemployment_rate=4.0
-            )
-        return None
+    """
+    Экономические показатели региона на дату публикации объявления.
+    Данные берутся из EconomicReferenceStore, загруженного из локального снимка.
+    """
+    def __init__(self, store: Optional[EconomicReferenceStore] = None,
+                 snapshot_path: str = economic_snapshot_path):
+        self.store = store if store is not None else EconomicReferenceStore(snapshot_path)
+
+    async def get_economic_data(self, region_name: str, on_date: Optional[date] = None) -> Optional[EconomicData]:
+        print(f"  [EcoService] Запрос экономических данных для региона: '{region_name}' на дату {on_date or 'сегодня'}")
+        return self.store.get_by_name(region_name, on_date)
+
+    @staticmethod
+    def parse_date(value: Optional[str]) -> Optional[date]:
+        """Дата публикации из PosterData.published_at (ISO дата или дата-время)."""
+        if not value:
+            return None
+        try:
+            return date.fromisoformat(str(value)[:10])
+        except ValueError:
+            return None
+
+
+class EconomicEnricher(BaseEnricher):
+    """Шаг обогащения: макроэкономика региона на дату публикации. Регион берется из шага geo."""
+    name = "economic"
+    depends_on = ("geo",)
+    timeout = 1.0
+
+    def __init__(self, economic_service: EconomicDataService):
+        self.economic_service = economic_service
+
+    async def enrich(self, poster_data: PosterData, request_id: str = "N/A") -> bool:
+        region_name_for_eco = None
+        if poster_data.district_info and poster_data.district_info.region_name:
+            region_name_for_eco = poster_data.district_info.region_name
+        elif poster_data.address: 
+            if "Санкт-Петербург" in poster_data.address:
+                region_name_for_eco = "Санкт-Петербург"
+            elif "Москва" in poster_data.address:
+                region_name_for_eco = "Москва"
+
+        if not region_name_for_eco:
+            print(f"[{request_id}] [EcoEnrich] Нет информации о регионе для экономического обогащения для ID: {poster_data.id}")
+            return False
+
+        economic_data = await self.economic_service.get_economic_data(
+            region_name_for_eco, self.economic_service.parse_date(poster_data.published_at)
+        )
+        if not economic_data:
+            print(f"[{request_id}] [EcoEnrich] Не удалось получить экономические данные для региона: {region_name_for_eco}")
+            return False
+        poster_data.economic_data = economic_data
+        print(f"[{request_id}] [EcoEnrich] Экономические данные обогащены для ID: {poster_data.id}")
+        return True
 
 
 class EconomicEnrichmentWorker:
@@ -55,6 +81,7 @@ class EconomicEnrichmentWorker:
         self.db_save_routing_key = "data.save"
         
         self.economic_service = EconomicDataService()
+        self.economic_enricher = EconomicEnricher(self.economic_service)
 
     async def initialize(self):
         await self.mq_manager.connect()
@@ -77,29 +104,12 @@ class EconomicEnrichmentWorker:
                 request_id = msg_body.get("request_id", "N/A")
                 chat_id = msg_body.get("chat_id") # <- Извлекаем chat_id
                 
-                poster_data = PosterData(**msg_body) 
+                poster_data = PosterData.from_trusted_dict(msg_body)
 
                 print(f"[{request_id}] [EcoEnrich] Получены данные для ID: {poster_data.id}, URL: {poster_data.url} (chat_id: {chat_id})")
 
-                region_name_for_eco = None
-                if poster_data.district_info and poster_data.district_info.region_name:
-                    region_name_for_eco = poster_data.district_info.region_name
-                elif poster_data.address: 
-                    if "Санкт-Петербург" in poster_data.address:
-                        region_name_for_eco = "Санкт-Петербург"
-                    elif "Москва" in poster_data.address:
-                        region_name_for_eco = "Москва"
-
-                if region_name_for_eco:
-                    economic_data = await self.economic_service.get_economic_data(region_name_for_eco)
-                    if economic_data:
-                        poster_data.economic_data = economic_data
-                        print(f"[{request_id}] [EcoEnrich] Экономические данные обогащены для ID: {poster_data.id}")
-                    else:
-                        print(f"[{request_id}] [EcoEnrich] Не удалось получить экономические данные для региона: {region_name_for_eco}")
-                else:
-                    print(f"[{request_id}] [EcoEnrich] Нет информации о регионе для экономического обогащения для ID: {poster_data.id}")
-                
+                await self.economic_enricher.enrich(poster_data, request_id)
+
                 enriched_data_dict = poster_data.to_dict()
                 enriched_data_dict["request_id"] = request_id 
                 if chat_id is not None: # <- Добавляем chat_id, если он есть
@@ -118,6 +128,7 @@ class EconomicEnrichmentWorker:
     async def start_consuming(self):
         await self.mq_manager.consume_messages(self.economic_enrichment_queue_name, self.process_message)
         print(f"Экономический обогатитель слушает очередь '{self.economic_enrichment_queue_name}'...")
+        reload_task = asyncio.create_task(self.economic_service.store.watch(economic_reload_interval_seconds))
         try:
             while True:
                 await asyncio.sleep(3600) 
@@ -126,6 +137,7 @@ class EconomicEnrichmentWorker:
         except KeyboardInterrupt:
             print("Экономический обогатитель остановлен (KeyboardInterrupt).")
         finally:
+            reload_task.cancel()
             await self.mq_manager.close()
 
 
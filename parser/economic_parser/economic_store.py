@@ -0,0 +1,141 @@
+import asyncio
+import json
+import os
+from array import array
+from bisect import bisect_right
+from dataclasses import fields
+from datetime import date
+from typing import Dict, Any, Optional, Tuple
+
+from posterData import EconomicData
+
+INDICATORS = tuple(f.name for f in fields(EconomicData) if f.name != "region_name")
+
+
+class _RegionSeries:
+    """Временные ряды показателей одного региона: даты (ordinal) и значения в компактных массивах."""
+    __slots__ = ("code", "name", "series")
+
+    def __init__(self, code: str, name: str, raw_series: Dict[str, Any]):
+        self.code = code
+        self.name = name
+        self.series: Dict[str, Tuple[array, array]] = {}
+        for indicator, points in raw_series.items():
+            if indicator not in INDICATORS:
+                print(f"  [EcoStore] Неизвестный показатель '{indicator}' у региона {code}, пропущен.")
+                continue
+            points = sorted((date.fromisoformat(day).toordinal(), float(value)) for day, value in points)
+            self.series[indicator] = (array("i", (p[0] for p in points)), array("d", (p[1] for p in points)))
+
+    def value_at(self, indicator: str, day: int) -> Optional[float]:
+        series = self.series.get(indicator)
+        if series is None:
+            return None
+        days, values = series
+        pos = bisect_right(days, day) - 1
+        return values[pos] if pos >= 0 else None
+
+
+class _Snapshot:
+    __slots__ = ("version", "national_code", "regions", "aliases")
+
+    def __init__(self, raw: Dict[str, Any]):
+        self.version = str(raw.get("version", ""))
+        self.national_code = raw.get("national_region", "RU")
+        self.regions: Dict[str, _RegionSeries] = {}
+        self.aliases: Dict[str, str] = {}
+        for code, region in raw.get("regions", {}).items():
+            self.regions[code] = _RegionSeries(code, region.get("name", code), region.get("series", {}))
+            for alias in [region.get("name", code), *region.get("aliases", [])]:
+                self.aliases[alias.lower().replace("ё", "е")] = code
+
+
+class EconomicReferenceStore:
+    """
+    Справочник макроэкономических показателей в памяти процесса.
+    Загружается из локального снимка (JSON) при старте, ключ - код региона,
+    для каждого показателя хранится ряд (дата, значение); поиск на дату - бинарный.
+    Показатели, отсутствующие у региона, берутся из общероссийского ряда (например, ключевая ставка).
+    При изменении файла снимок перечитывается и подменяется целиком без перезапуска воркера.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._snapshot: Optional[_Snapshot] = None
+        self._mtime_ns: Optional[int] = None
+        self._region_memo: Dict[str, Optional[str]] = {}
+        self.reload_if_changed()
+
+    @property
+    def version(self) -> Optional[str]:
+        return self._snapshot.version if self._snapshot else None
+
+    def reload_if_changed(self) -> bool:
+        """Перечитывает снимок, если файл изменился. Ошибочный файл не заменяет рабочий снимок."""
+        try:
+            mtime_ns = os.stat(self.path).st_mtime_ns
+        except OSError:
+            if self._snapshot is None:
+                print(f"  [EcoStore] Снимок экономических данных '{self.path}' не найден.")
+            return False
+        if mtime_ns == self._mtime_ns:
+            return False
+
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                snapshot = _Snapshot(json.load(f))
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            print(f"  [EcoStore] Не удалось загрузить снимок '{self.path}': {e}")
+            return False
+
+        self._snapshot = snapshot
+        self._mtime_ns = mtime_ns
+        self._region_memo = {}
+        print(f"  [EcoStore] Загружен снимок версии '{snapshot.version}', регионов: {len(snapshot.regions)}")
+        return True
+
+    async def watch(self, interval_seconds: float = 30.0):
+        """Фоновая задача: периодически проверяет файл снимка и подгружает новую версию."""
+        while True:
+            await asyncio.sleep(interval_seconds)
+            self.reload_if_changed()
+
+    def resolve_region_code(self, region_name: str) -> Optional[str]:
+        """Код региона по названию: точное совпадение с алиасом, затем вхождение алиаса в строку."""
+        snapshot = self._snapshot
+        if snapshot is None or not region_name:
+            return None
+        if region_name in self._region_memo:
+            return self._region_memo[region_name]
+
+        key = region_name.lower().replace("ё", "е").strip()
+        code = snapshot.aliases.get(key)
+        if code is None:
+            matches = [(len(alias), c) for alias, c in snapshot.aliases.items()
+                       if alias in key and c != snapshot.national_code]
+            code = max(matches)[1] if matches else None
+        self._region_memo[region_name] = code
+        return code
+
+    def get(self, region_code: str, on_date: Optional[date] = None) -> Optional[EconomicData]:
+        """Значения показателей региона, действовавшие на дату on_date (по умолчанию - сегодня)."""
+        snapshot = self._snapshot
+        if snapshot is None:
+            return None
+        region = snapshot.regions.get(region_code)
+        if region is None:
+            return None
+        national = snapshot.regions.get(snapshot.national_code)
+        day = (on_date or date.today()).toordinal()
+
+        values = {}
+        for indicator in INDICATORS:
+            value = region.value_at(indicator, day)
+            if value is None and national is not None:
+                value = national.value_at(indicator, day)
+            values[indicator] = value
+        return EconomicData(region_name=region.name, **values)
+
+    def get_by_name(self, region_name: str, on_date: Optional[date] = None) -> Optional[EconomicData]:
+        code = self.resolve_region_code(region_name)
+        return self.get(code, on_date) if code else None
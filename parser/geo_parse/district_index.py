@@ -0,0 +1,183 @@
+import json
+import math
+from typing import Dict, Any, Optional, List, Tuple, Sequence
+
+import numpy as np
+
+from posterData import DistrictInfo
+
+
+def read_geojson_polygons(path: str) -> List[Tuple[Dict[str, Any], List[np.ndarray]]]:
+    """
+    Читает Polygon/MultiPolygon фичи GeoJSON: [(properties, кольца)], кольца - массивы (n, 2) [lon, lat],
+    замкнутые. Остальные типы геометрий пропускаются.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        collection = json.load(f)
+
+    polygons = []
+    for feature in collection.get("features", []):
+        properties = feature.get("properties") or {}
+        geometry = feature.get("geometry") or {}
+        if geometry.get("type") == "Polygon":
+            parts = [geometry["coordinates"]]
+        elif geometry.get("type") == "MultiPolygon":
+            parts = geometry["coordinates"]
+        else:
+            print(f"  [GeoJSON] Пропущена фича с геометрией {geometry.get('type')}: {properties}")
+            continue
+
+        rings = []
+        for part in parts:
+            for ring in part:
+                ring_array = np.asarray(ring, dtype=np.float64)[:, :2]
+                if len(ring_array) < 3:
+                    continue
+                if not np.array_equal(ring_array[0], ring_array[-1]):
+                    ring_array = np.vstack((ring_array, ring_array[:1]))
+                rings.append(ring_array)
+        if rings:
+            polygons.append((properties, rings))
+    return polygons
+
+
+class DistrictPolygon:
+    """
+    Полигон района, подготовленный для быстрой проверки "точка внутри".
+    Ребра всех колец (включая дыры и части MultiPolygon) разложены по строкам сетки,
+    поэтому при проверке точки просматриваются только ребра ее строки (правило чет-нечет).
+    """
+    __slots__ = ("index", "properties", "bbox", "area", "row_edges")
+
+    def __init__(self, index: int, properties: Dict[str, Any], rings: List[np.ndarray], cell_size: float):
+        self.index = index
+        self.properties = properties
+
+        points = np.concatenate(rings)
+        min_lon, min_lat = points.min(axis=0)
+        max_lon, max_lat = points.max(axis=0)
+        self.bbox = (float(min_lon), float(min_lat), float(max_lon), float(max_lat))
+        self.area = (max_lon - min_lon) * (max_lat - min_lat)
+
+        edges = []
+        for ring in rings:
+            x1, y1 = ring[:-1, 0], ring[:-1, 1]
+            x2, y2 = ring[1:, 0], ring[1:, 1]
+            not_horizontal = y1 != y2 # Горизонтальные ребра никогда не пересекают горизонтальный луч
+            x1, y1, x2, y2 = x1[not_horizontal], y1[not_horizontal], x2[not_horizontal], y2[not_horizontal]
+            edges.append(np.column_stack((x1, y1, y2, (x2 - x1) / (y2 - y1))))
+        edges = np.concatenate(edges) if edges else np.empty((0, 4))
+
+        # Раскладываем ребра по строкам сетки, которые они пересекают по широте
+        row_lo = np.floor(np.minimum(edges[:, 1], edges[:, 2]) / cell_size).astype(np.int64)
+        row_hi = np.floor(np.maximum(edges[:, 1], edges[:, 2]) / cell_size).astype(np.int64)
+        buckets: Dict[int, List[int]] = {}
+        for edge_idx, (lo, hi) in enumerate(zip(row_lo.tolist(), row_hi.tolist())):
+            for row in range(lo, hi + 1):
+                buckets.setdefault(row, []).append(edge_idx)
+        self.row_edges: Dict[int, np.ndarray] = {
+            row: np.ascontiguousarray(edges[idx].T) for row, idx in buckets.items()
+        }
+
+    def contains(self, lat: float, lon: float, row: int) -> bool:
+        edges = self.row_edges.get(row)
+        if edges is None:
+            return False
+        x1, y1, y2, dxdy = edges
+        crosses = (y1 > lat) != (y2 > lat)
+        return bool(np.count_nonzero(crosses & (lon < x1 + (lat - y1) * dxdy)) & 1)
+
+    def contains_many(self, lats: np.ndarray, lons: np.ndarray, row: int) -> np.ndarray:
+        edges = self.row_edges.get(row)
+        if edges is None:
+            return np.zeros(len(lats), dtype=bool)
+        x1, y1, y2, dxdy = edges
+        lat_col = lats[:, None]
+        crosses = (y1 > lat_col) != (y2 > lat_col)
+        hits = crosses & (lons[:, None] < x1 + (lat_col - y1) * dxdy)
+        return (np.count_nonzero(hits, axis=1) & 1).astype(bool)
+
+
+class DistrictIndex:
+    """
+    Пространственный индекс районов: равномерная сетка по (широта, долгота),
+    в каждой ячейке - список полигонов, чей bbox ее задевает.
+    Полигоны загружаются из локального GeoJSON (FeatureCollection из Polygon/MultiPolygon),
+    свойства фичи должны совпадать с полями DistrictInfo (region_name обязателен).
+    """
+
+    def __init__(self, polygons: Sequence[Tuple[Dict[str, Any], List[np.ndarray]]], cell_size: float = 0.02):
+        self.cell_size = cell_size
+        self.polygons: List[DistrictPolygon] = [
+            DistrictPolygon(i, props, rings, cell_size) for i, (props, rings) in enumerate(polygons)
+        ]
+        self._grid: Dict[Tuple[int, int], Tuple[DistrictPolygon, ...]] = {}
+
+        cells: Dict[Tuple[int, int], List[DistrictPolygon]] = {}
+        for polygon in self.polygons:
+            min_lon, min_lat, max_lon, max_lat = polygon.bbox
+            for row in range(math.floor(min_lat / cell_size), math.floor(max_lat / cell_size) + 1):
+                for col in range(math.floor(min_lon / cell_size), math.floor(max_lon / cell_size) + 1):
+                    cells.setdefault((row, col), []).append(polygon)
+        # Меньшие полигоны проверяем первыми: при перекрытии (район внутри города) побеждает более точный
+        for key, candidates in cells.items():
+            self._grid[key] = tuple(sorted(candidates, key=lambda p: p.area))
+
+        print(f"  [DistrictIndex] Загружено полигонов: {len(self.polygons)}, ячеек сетки: {len(self._grid)}")
+
+    @classmethod
+    def from_geojson(cls, path: str, cell_size: float = 0.02) -> "DistrictIndex":
+        polygons = []
+        for properties, rings in read_geojson_polygons(path):
+            if not properties.get("region_name"):
+                print(f"  [DistrictIndex] Пропущена фича без region_name: {properties}")
+                continue
+            polygons.append((properties, rings))
+        return cls(polygons, cell_size=cell_size)
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return math.floor(lat / self.cell_size), math.floor(lon / self.cell_size)
+
+    def lookup(self, lat: float, lon: float) -> Optional[DistrictPolygon]:
+        """Возвращает полигон района, содержащий точку, или None."""
+        key = self._cell(lat, lon)
+        for polygon in self._grid.get(key, ()):
+            min_lon, min_lat, max_lon, max_lat = polygon.bbox
+            if min_lon <= lon <= max_lon and min_lat <= lat <= max_lat and polygon.contains(lat, lon, key[0]):
+                return polygon
+        return None
+
+    def lookup_many(self, lats: Sequence[float], lons: Sequence[float]) -> np.ndarray:
+        """
+        Пакетный поиск: возвращает массив индексов полигонов (-1, если точка вне всех районов).
+        Точки группируются по ячейкам сетки, и каждый кандидат проверяется сразу для всей группы.
+        """
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        result = np.full(len(lats), -1, dtype=np.int64)
+        if len(lats) == 0:
+            return result
+
+        rows = np.floor(lats / self.cell_size).astype(np.int64)
+        cols = np.floor(lons / self.cell_size).astype(np.int64)
+        cell_keys = np.stack((rows, cols), axis=1)
+        unique_cells, inverse = np.unique(cell_keys, axis=0, return_inverse=True)
+        order = np.argsort(inverse.ravel(), kind="stable")
+        boundaries = np.searchsorted(inverse.ravel()[order], np.arange(len(unique_cells) + 1))
+
+        for cell_idx, (row, col) in enumerate(unique_cells.tolist()):
+            candidates = self._grid.get((row, col))
+            if not candidates:
+                continue
+            point_idx = order[boundaries[cell_idx]:boundaries[cell_idx + 1]]
+            for polygon in candidates:
+                pending = point_idx[result[point_idx] == -1]
+                if len(pending) == 0:
+                    break
+                inside = polygon.contains_many(lats[pending], lons[pending], row)
+                result[pending[inside]] = polygon.index
+        return result
+
+    def district_info(self, polygon_index: int) -> DistrictInfo:
+        """Собирает новый DistrictInfo из свойств полигона (лишние ключи GeoJSON отбрасываются)."""
+        return DistrictInfo.from_dict(self.polygons[polygon_index].properties)
@@ -0,0 +1,33 @@
+from typing import Dict, Any, Optional, Tuple
+import math
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def extract_lat_lon(coordinates: Optional[Dict[str, Any]]) -> Optional[Tuple[float, float]]:
+    """
+    Достает (широта, долгота) из словаря координат PosterData.
+    Поддерживает ключи latitude/longitude и lat/lon. Возвращает None, если координат нет
+    или они не похожи на реальные.
+    """
+    if not coordinates:
+        return None
+    lat = coordinates.get("latitude", coordinates.get("lat"))
+    lon = coordinates.get("longitude", coordinates.get("lon"))
+    try:
+        lat = float(lat)
+        lon = float(lon)
+    except (TypeError, ValueError):
+        return None
+    if not (-90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0):
+        return None
+    return lat, lon
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Расстояние по большой окружности в километрах."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
@@ -0,0 +1,178 @@
+import hashlib
+import os
+import re
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, Optional, Tuple, Sequence
+
+from parser.geo_parse.geo_base import extract_lat_lon
+from parser.geo_parse.geocoder import normalize_address
+
+CACHE_MISS = object() # Маркер промаха: None - допустимое закешированное значение
+_NON_WORD_RE = re.compile(r"[^\w]+")
+
+
+def reference_data_version(paths: Sequence[Optional[str]]) -> str:
+    """
+    Версия справочных данных: хеш от (путь, размер, mtime) всех существующих файлов.
+    Меняется при любой замене файла, что автоматически инвалидирует ключи кеша.
+    """
+    digest = hashlib.sha1()
+    for path in paths:
+        if path and os.path.exists(path):
+            stat = os.stat(path)
+            digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns};".encode("utf-8"))
+        else:
+            digest.update(f"{path}:missing;".encode("utf-8"))
+    return digest.hexdigest()[:12]
+
+
+def normalize_address_key(address: Optional[str]) -> str:
+    """Каноническая форма адреса ("ул. Дыбенко, 21К2" и "Дыбенко улица, д. 21 корп. 2" дают один ключ)."""
+    if not address:
+        return ""
+    parsed = normalize_address(address)
+    if parsed.street_name:
+        return parsed.key
+    return _NON_WORD_RE.sub(" ", address.lower().replace("ё", "е")).strip()
+
+
+class LRUTTLCache:
+    """Внутрипроцессный LRU-кеш с ограничением размера и временем жизни записей."""
+
+    def __init__(self, max_size: int = 50000, ttl_seconds: float = 24 * 3600):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self.evictions = 0
+
+    def get(self, key: str) -> Any:
+        item = self._data.get(key, CACHE_MISS)
+        if item is CACHE_MISS:
+            return CACHE_MISS
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return CACHE_MISS
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any):
+        self._data[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class MongoCacheTier:
+    """
+    Постоянный уровень кеша, общий для всех реплик: коллекция MongoDB,
+    устаревшие записи удаляет TTL-индекс по полю expires_at.
+    """
+
+    def __init__(self, collection, ttl_seconds: float = 7 * 24 * 3600):
+        self.collection = collection
+        self.ttl_seconds = ttl_seconds
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    async def get(self, key: str) -> Any:
+        doc = await self.collection.find_one(
+            {"_id": key, "expires_at": {"$gt": datetime.now(timezone.utc)}}, {"value": 1}
+        )
+        return doc["value"] if doc else CACHE_MISS
+
+    async def set(self, key: str, value: Any):
+        await self.collection.update_one(
+            {"_id": key},
+            {"$set": {"value": value, "expires_at": datetime.now(timezone.utc) + timedelta(seconds=self.ttl_seconds)}},
+            upsert=True,
+        )
+
+
+class GeoCache:
+    """
+    Двухуровневый кеш результатов гео-обогащения.
+    Ключ - версия справочных данных + квантованные координаты + нормализованный адрес.
+    Первый уровень - LRU с TTL в памяти процесса, второй (необязательный) - MongoCacheTier.
+    Ошибки постоянного уровня не ломают обогащение: запись просто считается промахом.
+    """
+
+    def __init__(self, version: str, memory_size: int = 50000, ttl_seconds: float = 24 * 3600,
+                 persistent_tier: Optional[MongoCacheTier] = None, coordinate_precision: int = 4):
+        self.version = version
+        self.memory = LRUTTLCache(memory_size, ttl_seconds)
+        self.persistent_tier = persistent_tier
+        self.coordinate_precision = coordinate_precision # 4 знака ~ 11 м: одно здание - один ключ
+
+        self.memory_hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self.persistent_errors = 0
+
+    def set_version(self, version: str):
+        """Переключает версию справочных данных; при смене версии сбрасывает память процесса."""
+        if version != self.version:
+            if self.version:
+                print(f"  [GeoCache] Версия справочных данных изменилась: {self.version} -> {version}, кеш сброшен.")
+            self.version = version
+            self.memory.clear()
+
+    def make_key(self, address: Optional[str], coordinates: Optional[Dict[str, float]]) -> str:
+        lat_lon = extract_lat_lon(coordinates)
+        coords_part = f"{lat_lon[0]:.{self.coordinate_precision}f},{lat_lon[1]:.{self.coordinate_precision}f}" if lat_lon else "-"
+        return f"geo:{self.version}:{coords_part}:{normalize_address_key(address)}"
+
+    async def get(self, key: str) -> Any:
+        """Возвращает закешированное значение (может быть None - закешированный промах) или CACHE_MISS."""
+        value = self.memory.get(key)
+        if value is not CACHE_MISS:
+            self.memory_hits += 1
+            return value
+
+        if self.persistent_tier is not None:
+            try:
+                value = await self.persistent_tier.get(key)
+            except Exception as e:
+                self.persistent_errors += 1
+                print(f"  [GeoCache] Ошибка чтения постоянного кеша: {e}")
+                value = CACHE_MISS
+            if value is not CACHE_MISS:
+                self.persistent_hits += 1
+                self.memory.set(key, value)
+                return value
+
+        self.misses += 1
+        return CACHE_MISS
+
+    async def set(self, key: str, value: Any):
+        self.memory.set(key, value)
+        if self.persistent_tier is not None:
+            try:
+                await self.persistent_tier.set(key, value)
+            except Exception as e:
+                self.persistent_errors += 1
+                print(f"  [GeoCache] Ошибка записи постоянного кеша: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.memory_hits + self.persistent_hits + self.misses
+        return {
+            "version": self.version,
+            "memory_size": len(self.memory),
+            "memory_hits": self.memory_hits,
+            "persistent_hits": self.persistent_hits,
+            "misses": self.misses,
+            "evictions": self.memory.evictions,
+            "persistent_errors": self.persistent_errors,
+            "hit_rate": (self.memory_hits + self.persistent_hits) / lookups if lookups > 0 else 0,
+        }
+
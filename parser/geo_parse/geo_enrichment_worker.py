@@ -1,17 +1,199 @@
 import asyncio
 import json
-from typing import Dict, Any, Optional
+import os
+from typing import Dict, Any, Optional, List, Sequence
 from urllib.parse import urlparse # Для парсинга URL, если потребуется
 
 import aio_pika
 from aio_pika.abc import IncomingMessage
+from motor.motor_asyncio import AsyncIOMotorClient
 
+from _config import (
+    geo_districts_path, geo_metro_stations_path, metro_walk_radius_km, geo_gazetteer_path,
+    geo_metro_travel_table_path, metro_walk_speed_kmh, metro_commute_candidates,
+    geo_poi_tiles_dir, geo_poi_window_cell_km,
+    geo_cache_size, geo_cache_ttl_seconds, geo_cache_mongo_ttl_seconds, geo_cache_mongo_uri, geo_cache_db_name,
+)
 from message_queue_manager import MessageQueueManager
 from posterData import PosterData, DistrictInfo # Импортируем PosterData и DistrictInfo
+from parser.base_enricher import BaseEnricher
+from parser.geo_parse.geo_base import extract_lat_lon
+from parser.geo_parse.district_index import DistrictIndex
+from parser.geo_parse.metro_index import MetroIndex
+from parser.geo_parse.metro_graph import MetroTravelTable
+from parser.geo_parse.geocoder import OfflineGeocoder
+from parser.geo_parse.poi_tiles import PoiTileSet
+from parser.geo_parse.geo_cache import GeoCache, MongoCacheTier, CACHE_MISS, reference_data_version
 
 class GeolocationService:
-    async def get_district_info(self, address: str, coordinates: Optional[Dict[str, float]]) -> Optional[DistrictInfo]:
-        print(f"  [GeoService] Запрос гео-данных для адреса: '{address}'")
+    """
+    Определяет район объявления. Основной путь - поиск полигона района по координатам
+    через DistrictIndex; если индекса нет или точка вне полигонов - грубая догадка по адресу.
+    По координатам также считается близость к метро через MetroIndex и, при наличии
+    предрасчитанной таблицы MetroTravelTable, время в пути до центра и деловых районов.
+    Объявления без координат геокодируются локально через OfflineGeocoder.
+    Школы, больницы, доля зелени и коммерческая плотность вокруг точки берутся из тайлов POI.
+    Если передан GeoCache, результаты кешируются по версии справочных данных.
+    """
+    def __init__(self, district_index: Optional[DistrictIndex] = None,
+                 metro_index: Optional[MetroIndex] = None,
+                 geocoder: Optional[OfflineGeocoder] = None,
+                 cache: Optional[GeoCache] = None,
+                 districts_path: Optional[str] = geo_districts_path,
+                 metro_stations_path: Optional[str] = geo_metro_stations_path,
+                 gazetteer_path: Optional[str] = geo_gazetteer_path,
+                 metro_radius_km: float = metro_walk_radius_km,
+                 travel_table_path: Optional[str] = geo_metro_travel_table_path,
+                 poi_tiles: Optional[PoiTileSet] = None,
+                 poi_tiles_dir: Optional[str] = geo_poi_tiles_dir):
+        self.district_index = district_index
+        if self.district_index is None and districts_path and os.path.exists(districts_path):
+            self.district_index = DistrictIndex.from_geojson(districts_path)
+        elif self.district_index is None:
+            print(f"  [GeoService] Файл полигонов районов '{districts_path}' не найден, используется поиск по адресу.")
+
+        self.metro_index = metro_index
+        if self.metro_index is None and metro_stations_path and os.path.exists(metro_stations_path):
+            self.metro_index = MetroIndex.from_csv(metro_stations_path)
+        elif self.metro_index is None:
+            print(f"  [GeoService] Файл станций метро '{metro_stations_path}' не найден, расстояние до метро не рассчитывается.")
+        self.metro_radius_km = metro_radius_km
+
+        self.travel_table: Optional[MetroTravelTable] = None
+        if self.metro_index and travel_table_path and os.path.exists(travel_table_path):
+            self.travel_table = MetroTravelTable(travel_table_path, self.metro_index)
+        elif self.metro_index:
+            print(f"  [GeoService] Таблица времени в пути '{travel_table_path}' не найдена, время до центра не рассчитывается.")
+        self.metro_candidates = max(1, metro_commute_candidates) if self.travel_table else 1
+
+        self.geocoder = geocoder
+        if self.geocoder is None and gazetteer_path and os.path.exists(gazetteer_path):
+            self.geocoder = OfflineGeocoder.from_csv(gazetteer_path)
+        elif self.geocoder is None:
+            print(f"  [GeoService] Справочник адресов '{gazetteer_path}' не найден, геокодирование отключено.")
+
+        self.poi_tiles = poi_tiles
+        if self.poi_tiles is None and poi_tiles_dir and os.path.isdir(poi_tiles_dir):
+            self.poi_tiles = PoiTileSet.from_directory(poi_tiles_dir, cell_km=geo_poi_window_cell_km)
+        elif self.poi_tiles is None:
+            print(f"  [GeoService] Каталог тайлов POI '{poi_tiles_dir}' не найден, признаки окрестности берутся из полигонов.")
+
+        self.data_version = reference_data_version(
+            [districts_path, metro_stations_path, travel_table_path, gazetteer_path, *(self.poi_tiles.paths if self.poi_tiles else [])]
+        )
+        self.cache = cache
+        if self.cache is not None:
+            self.cache.set_version(self.data_version)
+
+    async def get_district_info(self, address: Optional[str], coordinates: Optional[Dict[str, float]]) -> Optional[DistrictInfo]:
+        print(f"  [GeoService] Запрос гео-данных для адреса: '{address}', координаты: {coordinates}")
+        if self.cache is None:
+            return self._resolve_district_info(address, coordinates)
+
+        key = self.cache.make_key(address, coordinates)
+        cached = await self.cache.get(key)
+        if cached is None:
+            return None
+        if cached is not CACHE_MISS:
+            try:
+                return DistrictInfo.from_trusted_dict(cached)
+            except TypeError as e: # Запись от другой версии схемы DistrictInfo - пересчитываем
+                print(f"  [GeoService] Некорректная запись кеша {key}: {e}")
+
+        district_info = self._resolve_district_info(address, coordinates)
+        await self.cache.set(key, district_info.to_dict() if district_info else None)
+        return district_info
+
+    def resolve_coordinates(self, address: Optional[str], coordinates: Optional[Dict[str, float]]) -> Optional[Dict[str, float]]:
+        """Возвращает координаты объявления: исходные, если они есть, иначе результат локального геокодирования."""
+        if extract_lat_lon(coordinates):
+            return coordinates
+        if address and self.geocoder:
+            result = self.geocoder.geocode(address)
+            if result:
+                return result.to_coordinates()
+        return None
+
+    def reverse_geocode(self, coordinates: Optional[Dict[str, float]]) -> Optional[Dict[str, Any]]:
+        lat_lon = extract_lat_lon(coordinates)
+        if lat_lon and self.geocoder:
+            return self.geocoder.reverse(*lat_lon)
+        return None
+
+    def _resolve_district_info(self, address: Optional[str], coordinates: Optional[Dict[str, float]]) -> Optional[DistrictInfo]:
+        lat_lon = extract_lat_lon(coordinates)
+        district_info = None
+        if lat_lon and self.district_index:
+            polygon = self.district_index.lookup(*lat_lon)
+            if polygon:
+                district_info = self.district_index.district_info(polygon.index)
+        if district_info is None and address:
+            district_info = self._guess_by_address(address)
+
+        if district_info and lat_lon and self.metro_index:
+            distances, station_indices, counts = self.metro_index.query_many(
+                [lat_lon[0]], [lat_lon[1]], k=self.metro_candidates, radius_km=self.metro_radius_km
+            )
+            commute = self._commute_minutes(distances, station_indices)
+            self._apply_metro(district_info, distances[0], station_indices[0], counts[0], commute[0] if commute is not None else None)
+        if district_info and lat_lon and self.poi_tiles:
+            features = self.poi_tiles.district_features(*lat_lon)
+            if features:
+                for name, value in features.items():
+                    setattr(district_info, name, value)
+        return district_info
+
+    def _commute_minutes(self, distances, station_indices):
+        if self.travel_table is None:
+            return None
+        return self.travel_table.commute_minutes_many(distances, station_indices, metro_walk_speed_kmh)
+
+    def _apply_metro(self, district_info: DistrictInfo, distances, station_indices, count, commute_row):
+        """Заполняет поля метро: ближайшая станция (первая из k), число станций рядом и время в пути."""
+        district_info.metro_distance = round(float(distances[0]), 3)
+        district_info.nearest_metro_station = self.metro_index.stations[station_indices[0]].name
+        district_info.metro_stations_nearby = int(count)
+        if commute_row is not None:
+            for name, value in self.travel_table.to_district_fields(commute_row.tolist()).items():
+                setattr(district_info, name, value)
+
+    def get_district_info_many(self, coordinates_list: Sequence[Optional[Dict[str, float]]]) -> List[Optional[DistrictInfo]]:
+        """Пакетное определение районов и близости к метро по координатам (без догадок по адресу)."""
+        results: List[Optional[DistrictInfo]] = [None] * len(coordinates_list)
+        if not self.district_index:
+            return results
+
+        positions, lats, lons = [], [], []
+        for pos, coordinates in enumerate(coordinates_list):
+            lat_lon = extract_lat_lon(coordinates)
+            if lat_lon:
+                positions.append(pos)
+                lats.append(lat_lon[0])
+                lons.append(lat_lon[1])
+        if not positions:
+            return results
+
+        polygon_indices = self.district_index.lookup_many(lats, lons).tolist()
+        if self.metro_index:
+            distances, station_indices, counts = self.metro_index.query_many(
+                lats, lons, k=self.metro_candidates, radius_km=self.metro_radius_km
+            )
+            commute = self._commute_minutes(distances, station_indices)
+        poi_features = self.poi_tiles.district_features_many(lats, lons) if self.poi_tiles else None
+
+        for i, (pos, polygon_index) in enumerate(zip(positions, polygon_indices)):
+            if polygon_index < 0:
+                continue
+            district_info = self.district_index.district_info(polygon_index)
+            if self.metro_index:
+                self._apply_metro(district_info, distances[i], station_indices[i], counts[i], commute[i] if commute is not None else None)
+            if poi_features and poi_features[i]:
+                for name, value in poi_features[i].items():
+                    setattr(district_info, name, value)
+            results[pos] = district_info
+        return results
+
+    def _guess_by_address(self, address: str) -> Optional[DistrictInfo]:
         if "Санкт-Петербург" in address:
             region_name = "Санкт-Петербург"
             city_name = "Санкт-Петербург"
@@ -39,7 +221,6 @@ class GeolocationService:
                 city_name=city_name,
                 district_name=district_name,
                 population=population,
-                avg_price_per_sqm=150000.0, 
                 schools_count=20,
                 hospitals_count=5,
                 crime_rate=crime_rate,
@@ -54,7 +235,6 @@ class GeolocationService:
                 city_name="Москва",
                 district_name="Центральный АО", 
                 population=1000000,
-                avg_price_per_sqm=300000.0,
                 schools_count=50,
                 hospitals_count=10,
                 crime_rate=0.04,
@@ -66,6 +246,46 @@ class GeolocationService:
         return None
 
 
+class GeoEnricher(BaseEnricher):
+    """Шаг обогащения: координаты (с геокодированием при отсутствии), район и близость к метро."""
+    name = "geo"
+    timeout = 2.0
+
+    def __init__(self, geolocation_service: GeolocationService):
+        self.geolocation_service = geolocation_service
+
+    async def enrich(self, poster_data: PosterData, request_id: str = "N/A") -> bool:
+        if not (poster_data.address or poster_data.coordinates):
+            print(f"[{request_id}] [GeoEnrich] Нет адреса и координат для гео-обогащения для ID: {poster_data.id}")
+            return False
+
+        coordinates = self.geolocation_service.resolve_coordinates(poster_data.address, poster_data.coordinates)
+        if coordinates and coordinates is not poster_data.coordinates:
+            poster_data.coordinates = coordinates
+            print(f"[{request_id}] [GeoEnrich] Координаты получены геокодированием адреса для ID: {poster_data.id}")
+        district_info = await self.geolocation_service.get_district_info(poster_data.address, coordinates)
+        if not district_info:
+            print(f"[{request_id}] [GeoEnrich] Не удалось получить гео-данные для адреса: {poster_data.address}")
+            return False
+        poster_data.district_info = district_info
+        print(f"[{request_id}] [GeoEnrich] Гео-данные обогащены для ID: {poster_data.id}")
+        return True
+
+
+def build_geolocation_service() -> GeolocationService:
+    """GeolocationService с кешем по настройкам из _config (общий уровень в MongoDB - если задан GEO_CACHE_MONGO_URI)."""
+    persistent_tier = None
+    if geo_cache_mongo_uri:
+        cache_db_client = AsyncIOMotorClient(geo_cache_mongo_uri)
+        persistent_tier = MongoCacheTier(cache_db_client[geo_cache_db_name]["geo_cache"],
+                                         ttl_seconds=geo_cache_mongo_ttl_seconds)
+    geo_cache = GeoCache(
+        version="", memory_size=geo_cache_size, ttl_seconds=geo_cache_ttl_seconds,
+        persistent_tier=persistent_tier,
+    )
+    return GeolocationService(cache=geo_cache)
+
+
 class GeoEnrichmentWorker:
     def __init__(self, amqp_url: str,
                  geo_enrichment_queue_name: str = "geo_enrichment_queue",
@@ -76,10 +296,14 @@ class GeoEnrichmentWorker:
         self.enrichment_exchange_name = "enrichment_exchange"
         self.economic_enrichment_routing_key = "enrich.economic" 
         
-        self.geolocation_service = GeolocationService()
+        self.geolocation_service = build_geolocation_service()
+        self.geo_cache = self.geolocation_service.cache
+        self.geo_enricher = GeoEnricher(self.geolocation_service)
 
     async def initialize(self):
         await self.mq_manager.connect()
+        if self.geo_cache.persistent_tier is not None:
+            await self.geo_cache.persistent_tier.ensure_indexes()
         await self.mq_manager.declare_queue(self.geo_enrichment_queue_name)
         await self.mq_manager.declare_exchange(self.enrichment_exchange_name, type=aio_pika.ExchangeType.TOPIC)
         await self.mq_manager.bind_queue_to_exchange(
@@ -99,22 +323,12 @@ class GeoEnrichmentWorker:
                 request_id = msg_body.get("request_id", "N/A")
                 chat_id = msg_body.get("chat_id") # <- Извлекаем chat_id
 
-                poster_data = PosterData(**msg_body) 
+                poster_data = PosterData.from_trusted_dict(msg_body)
 
                 print(f"[{request_id}] [GeoEnrich] Получены данные для ID: {poster_data.id}, URL: {poster_data.url} (chat_id: {chat_id})")
 
-                if poster_data.address:
-                    district_info = await self.geolocation_service.get_district_info(
-                        poster_data.address, poster_data.coordinates
-                    )
-                    if district_info:
-                        poster_data.district_info = district_info
-                        print(f"[{request_id}] [GeoEnrich] Гео-данные обогащены для ID: {poster_data.id}")
-                    else:
-                        print(f"[{request_id}] [GeoEnrich] Не удалось получить гео-данные для адреса: {poster_data.address}")
-                else:
-                    print(f"[{request_id}] [GeoEnrich] Нет адреса для гео-обогащения для ID: {poster_data.id}")
-                
+                await self.geo_enricher.enrich(poster_data, request_id)
+
                 enriched_data_dict = poster_data.to_dict()
                 enriched_data_dict["request_id"] = request_id 
                 if chat_id is not None: # <- Добавляем chat_id, если он есть
@@ -135,7 +349,8 @@ class GeoEnrichmentWorker:
         print(f"Гео-обогатитель слушает очередь '{self.geo_enrichment_queue_name}'...")
         try:
             while True:
-                await asyncio.sleep(3600) 
+                await asyncio.sleep(60)
+                print(f"Статистика гео-кеша: {self.geo_cache.get_stats()}")
         except asyncio.CancelledError:
             print("Гео-обогатитель остановлен.")
         except KeyboardInterrupt:
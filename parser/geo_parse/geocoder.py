@@ -0,0 +1,279 @@
+import csv
+import re
+from dataclasses import dataclass
+from typing import Dict, Any, Optional, List, Tuple, Sequence, Set
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from parser.geo_parse.metro_index import to_unit_xyz, chord_to_km, km_to_chord
+
+# Сокращения типов улиц -> полная форма
+_STREET_TYPES: Dict[str, str] = {
+    "ул": "улица", "улица": "улица",
+    "пр-т": "проспект", "пр": "проспект", "просп": "проспект", "пр-кт": "проспект", "проспект": "проспект",
+    "пер": "переулок", "переулок": "переулок",
+    "наб": "набережная", "набережная": "набережная",
+    "ш": "шоссе", "шоссе": "шоссе",
+    "б-р": "бульвар", "бул": "бульвар", "бульвар": "бульвар",
+    "пл": "площадь", "площадь": "площадь",
+    "пр-д": "проезд", "проезд": "проезд",
+    "туп": "тупик", "тупик": "тупик",
+    "ал": "аллея", "аллея": "аллея",
+    "лин": "линия", "линия": "линия",
+    "кв-л": "квартал", "квартал": "квартал",
+    "мкр": "микрорайон", "мкрн": "микрорайон", "микрорайон": "микрорайон",
+}
+# Части адреса, которые не участвуют в геокодировании (районы, округа, метро, регион)
+_SKIP_PART_RE = re.compile(r"^(р-н\b|район\b|мо$|м\.|метро\b|[а-я]{1,2}ао$|.*\bобл(асть)?$|.*\bао$|.*\bрайон$|.*\bр-н$|россия$)")
+_CITY_PREFIX_RE = re.compile(r"^(г\.?|город)\s+")
+_TOKEN_RE = re.compile(r"[а-яa-z0-9-]+")
+_HOUSE_RE = re.compile(
+    r"^(?:(?:д|дом)\.?\s*)?(\d+[а-я]?)(?:\s*/\s*\d+[а-я]?)?"
+    r"\s*(?:(?:к|корп|корпус)\.?\s*(\d+))?"
+    r"\s*(?:(?:с|стр|строение)\.?\s*(\d+))?"
+    r"\s*(?:(?:лит|литер|литера)\.?\s*([а-я]))?$"
+)
+# Корпус/строение/литера, вынесенные после дома через запятую: "д. 5, корп. 2"
+_HOUSE_SUFFIX_RE = re.compile(r"^(к|корп|корпус|с|стр|строение|лит|литер|литера)\.?\s*([0-9а-я]+)$")
+
+
+@dataclass
+class NormalizedAddress:
+    city: Optional[str] = None
+    street_name: Optional[str] = None      # "тверская", "2-я советская"
+    street_type: Optional[str] = None      # "улица", "проспект" ...
+    house: Optional[str] = None            # "21"
+    korpus: Optional[str] = None
+    stroenie: Optional[str] = None
+    litera: Optional[str] = None
+
+    @property
+    def house_key(self) -> Optional[str]:
+        if not self.house:
+            return None
+        key = self.house
+        if self.korpus:
+            key += f"к{self.korpus}"
+        if self.stroenie:
+            key += f"с{self.stroenie}"
+        if self.litera:
+            key += f"л{self.litera}"
+        return key
+
+    @property
+    def key(self) -> str:
+        """Каноническая строка адреса: одинакова для всех написаний одного дома."""
+        return " ".join(part for part in (self.city, self.street_name, self.street_type, self.house_key) if part)
+
+
+def _parse_house(part: str) -> Optional[Tuple[str, Optional[str], Optional[str], Optional[str]]]:
+    match = _HOUSE_RE.match(part)
+    if not match:
+        return None
+    return match.group(1), match.group(2), match.group(3), match.group(4)
+
+
+def _parse_street(part: str) -> Tuple[Optional[str], Optional[str]]:
+    """'ул. Дыбенко' / 'Невский пр-т' -> ('дыбенко', 'улица') / ('невский', 'проспект')."""
+    street_type = None
+    name_tokens = []
+    for token in _TOKEN_RE.findall(part.replace(".", " ")):
+        full = _STREET_TYPES.get(token)
+        if full and street_type is None:
+            street_type = full
+        else:
+            name_tokens.append(token)
+    return (" ".join(name_tokens) or None), street_type
+
+
+def normalize_address(address: str, known_cities: Optional[Set[str]] = None) -> NormalizedAddress:
+    """
+    Разбирает русский адрес на город, улицу и дом, раскрывая сокращения
+    ("ул.", "пр-т", "д.", "корп.", "стр.", "лит.") и отбрасывая районы, округа и метро.
+    """
+    result = NormalizedAddress()
+    text = re.sub(r"\s+", " ", address.lower().replace("ё", "е"))
+    street_candidates = []
+
+    for raw_part in text.split(","):
+        part = raw_part.strip(" .")
+        if not part:
+            continue
+
+        if result.house is None:
+            house = _parse_house(part)
+            if house:
+                result.house, result.korpus, result.stroenie, result.litera = house
+                continue
+        else:
+            suffix = _HOUSE_SUFFIX_RE.match(part)
+            if suffix:
+                kind, value = suffix.groups()
+                if kind.startswith("к"):
+                    result.korpus = value
+                elif kind.startswith("с"):
+                    result.stroenie = value
+                else:
+                    result.litera = value
+                continue
+
+        city_match = _CITY_PREFIX_RE.match(part)
+        if city_match or (known_cities and part in known_cities) or part in ("москва", "санкт-петербург"):
+            if result.city is None:
+                result.city = part[city_match.end():] if city_match else part
+            continue
+
+        if _SKIP_PART_RE.match(part):
+            continue
+
+        name, street_type = _parse_street(part)
+        if name:
+            street_candidates.append((street_type is not None, name, street_type))
+
+    # Предпочитаем часть с явным типом улицы; иначе последнюю часть перед домом ("Дыбенко, 21к2")
+    typed = [c for c in street_candidates if c[0]]
+    chosen = typed[-1] if typed else (street_candidates[-1] if street_candidates else None)
+    if chosen:
+        result.street_name, result.street_type = chosen[1], chosen[2]
+    return result
+
+
+@dataclass
+class GeocodeResult:
+    latitude: float
+    longitude: float
+    precision: str                 # house / street
+    address: str                   # нормализованный адрес найденного объекта
+
+    def to_coordinates(self) -> Dict[str, float]:
+        return {"latitude": self.latitude, "longitude": self.longitude}
+
+
+class OfflineGeocoder:
+    """
+    Локальный геокодер по справочнику улиц и домов (CSV: city, street, house, latitude, longitude).
+    Прямое геокодирование - точный поиск (город, улица, тип) с откатом на инвертированный
+    индекс токенов названия улицы; обратное - KD-дерево по всем домам справочника.
+    Внешние сервисы геокодирования не используются.
+    """
+
+    def __init__(self, rows: Sequence[Tuple[str, str, str, float, float]]):
+        self._streets: Dict[Tuple[str, str, Optional[str]], Dict[str, int]] = {}
+        self._tokens: Dict[str, Set[Tuple[str, str, Optional[str]]]] = {}
+        self._labels: List[str] = []
+        lats, lons = [], []
+
+        for city, street, house, lat, lon in rows:
+            city_key = city.lower().replace("ё", "е").strip()
+            name, street_type = _parse_street(street.lower().replace("ё", "е"))
+            parsed_house = _parse_house(house.lower().replace("ё", "е").strip())
+            if not name or not parsed_house:
+                continue
+            house_key = NormalizedAddress(house=parsed_house[0], korpus=parsed_house[1],
+                                          stroenie=parsed_house[2], litera=parsed_house[3]).house_key
+            street_key = (city_key, name, street_type)
+            houses = self._streets.setdefault(street_key, {})
+            if house_key in houses:
+                continue
+            houses[house_key] = len(self._labels)
+            self._labels.append(f"{city}, {street}, {house}")
+            lats.append(lat)
+            lons.append(lon)
+            for token in name.split():
+                self._tokens.setdefault(token, set()).add(street_key)
+
+        self.cities: Set[str] = {key[0] for key in self._streets}
+        self.latitudes = np.asarray(lats, dtype=np.float64)
+        self.longitudes = np.asarray(lons, dtype=np.float64)
+        self._street_centroids: Dict[Tuple[str, str, Optional[str]], Tuple[float, float]] = {
+            key: (float(self.latitudes[list(houses.values())].mean()), float(self.longitudes[list(houses.values())].mean()))
+            for key, houses in self._streets.items()
+        }
+        self._tree = cKDTree(to_unit_xyz(self.latitudes, self.longitudes)) if self._labels else None
+        print(f"  [Geocoder] Загружено домов: {len(self._labels)}, улиц: {len(self._streets)}")
+
+    @classmethod
+    def from_csv(cls, path: str) -> "OfflineGeocoder":
+        rows = []
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                try:
+                    rows.append((row["city"], row["street"], row["house"], float(row["latitude"]), float(row["longitude"])))
+                except (KeyError, TypeError, ValueError) as e:
+                    print(f"  [Geocoder] Пропущена некорректная строка {row}: {e}")
+        return cls(rows)
+
+    def normalize(self, address: str) -> NormalizedAddress:
+        return normalize_address(address, self.cities)
+
+    def _find_street(self, parsed: NormalizedAddress) -> Optional[Tuple[str, str, Optional[str]]]:
+        if parsed.city and (parsed.city, parsed.street_name, parsed.street_type) in self._streets:
+            return parsed.city, parsed.street_name, parsed.street_type
+
+        # Откат: пересечение постинг-листов по токенам названия, фильтр по городу, затем по типу улицы
+        candidates: Optional[Set[Tuple[str, str, Optional[str]]]] = None
+        for token in parsed.street_name.split():
+            postings = self._tokens.get(token)
+            if not postings:
+                return None
+            candidates = set(postings) if candidates is None else candidates & postings
+        if not candidates:
+            return None
+        candidates = {c for c in candidates if c[1] == parsed.street_name} or candidates
+        if parsed.city:
+            candidates = {c for c in candidates if c[0] == parsed.city}
+        if parsed.street_type and len(candidates) > 1:
+            candidates = {c for c in candidates if c[2] == parsed.street_type} or candidates
+        return next(iter(candidates)) if len(candidates) == 1 else None
+
+    def geocode(self, address: str) -> Optional[GeocodeResult]:
+        parsed = self.normalize(address)
+        if not parsed.street_name:
+            return None
+        street_key = self._find_street(parsed)
+        if street_key is None:
+            return None
+
+        houses = self._streets[street_key]
+        point_idx = houses.get(parsed.house_key) if parsed.house_key else None
+        if point_idx is None and parsed.house:
+            point_idx = houses.get(parsed.house) # Без корпуса/строения - тот же участок
+        if point_idx is not None:
+            return GeocodeResult(float(self.latitudes[point_idx]), float(self.longitudes[point_idx]),
+                                 "house", self._labels[point_idx])
+
+        lat, lon = self._street_centroids[street_key]
+        return GeocodeResult(lat, lon, "street", " ".join(part for part in street_key if part))
+
+    def geocode_many(self, addresses: Sequence[Optional[str]]) -> List[Optional[GeocodeResult]]:
+        """Пакетное геокодирование; повторяющиеся адреса разбираются один раз."""
+        memo: Dict[str, Optional[GeocodeResult]] = {}
+        results = []
+        for address in addresses:
+            if not address:
+                results.append(None)
+                continue
+            if address not in memo:
+                memo[address] = self.geocode(address)
+            results.append(memo[address])
+        return results
+
+    def reverse_many(self, lats: Sequence[float], lons: Sequence[float],
+                     max_distance_km: float = 0.2) -> List[Optional[Dict[str, Any]]]:
+        """Координаты -> ближайший дом справочника не дальше max_distance_km."""
+        if self._tree is None:
+            return [None] * len(lats)
+        points = to_unit_xyz(np.asarray(lats, dtype=np.float64), np.asarray(lons, dtype=np.float64))
+        chords, indices = self._tree.query(points, k=1, distance_upper_bound=km_to_chord(max_distance_km))
+        results = []
+        for chord, point_idx in zip(np.atleast_1d(chords).tolist(), np.atleast_1d(indices).tolist()):
+            if point_idx >= len(self._labels):
+                results.append(None)
+            else:
+                results.append({"address": self._labels[point_idx],
+                                "distance_km": round(float(chord_to_km(np.asarray(chord))), 3)})
+        return results
+
+    def reverse(self, lat: float, lon: float, max_distance_km: float = 0.2) -> Optional[Dict[str, Any]]:
+        return self.reverse_many([lat], [lon], max_distance_km)[0]
@@ -0,0 +1,186 @@
+"""
+Граф метро/МЦД и предрасчитанная таблица времени в пути до ключевых точек (центр, деловые районы).
+
+Офлайн-сборка (python -m parser.geo_parse.metro_graph build ...) строит граф из станций
+(тот же CSV, что у MetroIndex), перегонов и пересадок и для каждой ключевой точки запускает
+Дейкстру от всех ее станций сразу. Результат - матрица минут (станция x ключевая точка) в .npz.
+На обогащении граф не обходится: время до точки = min по k ближайшим станциям (пешком + таблица).
+"""
+import argparse
+import csv
+import json
+import os
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Any, List, Sequence, Tuple
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+from parser.geo_parse.geo_base import haversine_km
+from parser.geo_parse.metro_index import MetroIndex, MetroStation
+
+DEFAULT_TRANSFER_MINUTES = 4.0
+AVERAGE_TRAIN_SPEED_KMH = 40.0  # С учетом разгона и торможения
+DWELL_MINUTES = 0.5             # Стоянка на станции
+
+
+def read_edges(path: str) -> List[Dict[str, Any]]:
+    """CSV перегонов и пересадок: from_id, to_id, minutes (может быть пустым), kind (ride/transfer)."""
+    edges = []
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            if not row.get("from_id") or not row.get("to_id"):
+                print(f"  [MetroGraph] Пропущен перегон без станций: {row}")
+                continue
+            minutes = row.get("minutes")
+            edges.append({
+                "from_id": row["from_id"],
+                "to_id": row["to_id"],
+                "minutes": float(minutes) if minutes else None,
+                "kind": row.get("kind") or "ride",
+            })
+    return edges
+
+
+def build_graph(stations: Sequence[MetroStation], edges: Sequence[Dict[str, Any]],
+                transfer_minutes: float = DEFAULT_TRANSFER_MINUTES) -> csr_matrix:
+    """
+    Неориентированный граф станций. Перегон без времени оценивается по расстоянию и средней скорости.
+    Станции с одинаковым названием на разных линиях (пересадочные узлы) связываются пересадкой,
+    если она не задана явно.
+    """
+    position = {station.id: i for i, station in enumerate(stations)}
+    weights: Dict[Tuple[int, int], float] = {}
+
+    def add(a: int, b: int, minutes: float):
+        key = (min(a, b), max(a, b))
+        weights[key] = min(minutes, weights.get(key, float("inf")))
+
+    for edge in edges:
+        a, b = position.get(edge["from_id"]), position.get(edge["to_id"])
+        if a is None or b is None or a == b:
+            print(f"  [MetroGraph] Перегон с неизвестной станцией пропущен: {edge['from_id']} - {edge['to_id']}")
+            continue
+        minutes = edge["minutes"]
+        if minutes is None:
+            if edge["kind"] == "transfer":
+                minutes = transfer_minutes
+            else:
+                distance = haversine_km(stations[a].latitude, stations[a].longitude, stations[b].latitude, stations[b].longitude)
+                minutes = distance / AVERAGE_TRAIN_SPEED_KMH * 60 + DWELL_MINUTES
+        add(a, b, minutes)
+
+    by_name: Dict[Tuple[str, str], List[int]] = defaultdict(list)
+    for i, station in enumerate(stations):
+        by_name[(station.city or "", station.name.lower().replace("ё", "е"))].append(i)
+    for members in by_name.values():
+        for i, a in enumerate(members):
+            for b in members[i + 1:]:
+                if (min(a, b), max(a, b)) not in weights and stations[a].line != stations[b].line:
+                    add(a, b, transfer_minutes)
+
+    n = len(stations)
+    if not weights:
+        return csr_matrix((n, n))
+    rows, cols = zip(*weights.keys())
+    values = list(weights.values())
+    return csr_matrix((values + values, (rows + cols, cols + rows)), shape=(n, n))
+
+
+def build_travel_table(stations_csv_path: str, edges_csv_path: str, hubs_json_path: str, output_path: str,
+                       transfer_minutes: float = DEFAULT_TRANSFER_MINUTES) -> Dict[str, Any]:
+    """
+    Считает минуты от каждой станции до каждой ключевой точки и сохраняет таблицу.
+    hubs_json: {"centre": ["station_id", ...], "moscow_city": [...]} - порядок ключей задает порядок колонок,
+    первая точка считается "центром".
+    """
+    stations = MetroIndex.from_csv(stations_csv_path).stations
+    graph = build_graph(stations, read_edges(edges_csv_path), transfer_minutes)
+    with open(hubs_json_path, "r", encoding="utf-8") as f:
+        hubs: Dict[str, List[str]] = json.load(f)
+
+    position = {station.id: i for i, station in enumerate(stations)}
+    minutes = np.full((len(stations), len(hubs)), np.inf, dtype=np.float64)
+    for column, (hub_name, station_ids) in enumerate(hubs.items()):
+        sources = [position[s] for s in station_ids if s in position]
+        if not sources:
+            print(f"  [MetroGraph] У точки '{hub_name}' нет известных станций, колонка пустая.")
+            continue
+        # Мультиисточниковая Дейкстра: расстояние до ближайшей станции точки
+        minutes[:, column] = dijkstra(graph, directed=False, indices=sources, min_only=True)
+
+    tmp_path = output_path + ".tmp.npz"
+    np.savez(
+        tmp_path,
+        station_ids=np.array([s.id for s in stations]),
+        hub_names=np.array(list(hubs.keys())),
+        minutes=minutes.astype(np.float32),
+        created_at=np.array(datetime.now().isoformat()),
+    )
+    os.replace(tmp_path, output_path)
+    reachable = np.isfinite(minutes).all(axis=1).sum()
+    print(f"  [MetroGraph] Записана таблица '{output_path}': станций {len(stations)} (достижимы все точки: {reachable}), точек {len(hubs)}")
+    return {"stations": len(stations), "hubs": list(hubs.keys()), "fully_reachable": int(reachable)}
+
+
+class MetroTravelTable:
+    """
+    Таблица минут (станция x ключевая точка), выровненная по порядку станций MetroIndex.
+    Время до точки для объявления = min по ближайшим станциям (пешком до станции + по таблице).
+    """
+
+    def __init__(self, path: str, metro_index: MetroIndex):
+        self.path = path
+        with np.load(path) as data:
+            station_ids = data["station_ids"].tolist()
+            self.hub_names: List[str] = data["hub_names"].tolist()
+            table = data["minutes"].astype(np.float64)
+
+        row_of = {station_id: i for i, station_id in enumerate(station_ids)}
+        self.minutes = np.full((len(metro_index.stations), len(self.hub_names)), np.inf, dtype=np.float64)
+        missing = 0
+        for i, station in enumerate(metro_index.stations):
+            row = row_of.get(station.id)
+            if row is None:
+                missing += 1
+            else:
+                self.minutes[i] = table[row]
+        if missing:
+            print(f"  [MetroGraph] {missing} станций MetroIndex отсутствуют в таблице '{path}' и не участвуют в расчете.")
+        print(f"  [MetroGraph] Загружена таблица времени в пути: точек {len(self.hub_names)}, станций {len(station_ids)}")
+
+    def commute_minutes_many(self, distances_km: np.ndarray, station_indices: np.ndarray,
+                             walk_speed_kmh: float) -> np.ndarray:
+        """
+        distances_km/station_indices - (n, k) результат MetroIndex.query_many.
+        Возвращает (n, число точек): минуты до каждой точки, inf - если недостижимо.
+        """
+        walk_minutes = np.asarray(distances_km) / walk_speed_kmh * 60.0
+        totals = walk_minutes[:, :, None] + self.minutes[np.asarray(station_indices)]
+        return totals.min(axis=1)
+
+    def to_district_fields(self, minutes_row: Sequence[float]) -> Dict[str, Any]:
+        commute = {name: round(value, 1) for name, value in zip(self.hub_names, minutes_row) if np.isfinite(value)}
+        return {
+            "minutes_to_centre": commute.get(self.hub_names[0]) if self.hub_names else None,
+            "commute_minutes": commute or None,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Предрасчет времени в пути по метро до ключевых точек")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build = subparsers.add_parser("build", help="Собрать таблицу времени в пути")
+    build.add_argument("--stations", required=True, help="CSV станций (id, name, line, kind, city, latitude, longitude)")
+    build.add_argument("--edges", required=True, help="CSV перегонов и пересадок (from_id, to_id, minutes, kind)")
+    build.add_argument("--hubs", required=True, help='JSON {"centre": [station_id, ...], ...}')
+    build.add_argument("--output", required=True, help="Путь к выходному .npz файлу")
+    build.add_argument("--transfer-minutes", type=float, default=DEFAULT_TRANSFER_MINUTES)
+    args = parser.parse_args()
+    build_travel_table(args.stations, args.edges, args.hubs, args.output, args.transfer_minutes)
+
+
+if __name__ == "__main__":
+    main()
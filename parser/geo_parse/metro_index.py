@@ -0,0 +1,121 @@
+import csv
+from dataclasses import dataclass, field
+from typing import Dict, Any, Optional, List, Sequence, Tuple
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from parser.geo_parse.geo_base import EARTH_RADIUS_KM
+
+
+def to_unit_xyz(lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Переводит широты/долготы в точки единичной сферы: евклидово расстояние между ними монотонно по haversine."""
+    phi = np.radians(lats)
+    lmb = np.radians(lons)
+    cos_phi = np.cos(phi)
+    return np.column_stack((cos_phi * np.cos(lmb), cos_phi * np.sin(lmb), np.sin(phi)))
+
+
+def chord_to_km(chord: np.ndarray) -> np.ndarray:
+    """Длина хорды единичной сферы -> расстояние по большой окружности в км (та же величина, что дает haversine)."""
+    return 2.0 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / 2.0, 0.0, 1.0))
+
+
+def km_to_chord(distance_km: float) -> float:
+    return 2.0 * np.sin(distance_km / (2.0 * EARTH_RADIUS_KM))
+
+
+@dataclass
+class MetroStation:
+    id: str
+    name: str
+    line: Optional[str] = None
+    kind: str = "metro"                 # metro / mcd
+    city: Optional[str] = None
+    latitude: float = 0.0
+    longitude: float = 0.0
+
+
+@dataclass
+class MetroProximity:
+    nearest_station: Optional[str] = None
+    nearest_line: Optional[str] = None
+    nearest_distance_km: Optional[float] = None
+    stations: List[Dict[str, Any]] = field(default_factory=list)  # k ближайших: {"id", "station", "line", "kind", "distance_km"}
+    count_within_radius: int = 0
+
+
+class MetroIndex:
+    """
+    KD-дерево по всем станциям метро и МЦД из локального набора данных.
+    Станции хранятся как точки единичной сферы, поэтому расстояние хорды монотонно по haversine
+    и переводится в километры без приближений. Все запросы векторизованы по точкам.
+    """
+
+    def __init__(self, stations: Sequence[MetroStation]):
+        if not stations:
+            raise ValueError("MetroIndex требует хотя бы одну станцию.")
+        self.stations: List[MetroStation] = list(stations)
+        self.latitudes = np.array([s.latitude for s in self.stations], dtype=np.float64)
+        self.longitudes = np.array([s.longitude for s in self.stations], dtype=np.float64)
+        self._tree = cKDTree(to_unit_xyz(self.latitudes, self.longitudes))
+        print(f"  [MetroIndex] Загружено станций: {len(self.stations)}")
+
+    @classmethod
+    def from_csv(cls, path: str) -> "MetroIndex":
+        """CSV с колонками: id, name, line, kind, city, latitude, longitude."""
+        stations = []
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                try:
+                    stations.append(MetroStation(
+                        id=row.get("id") or row["name"],
+                        name=row["name"],
+                        line=row.get("line") or None,
+                        kind=row.get("kind") or "metro",
+                        city=row.get("city") or None,
+                        latitude=float(row["latitude"]),
+                        longitude=float(row["longitude"]),
+                    ))
+                except (KeyError, TypeError, ValueError) as e:
+                    print(f"  [MetroIndex] Пропущена некорректная строка {row}: {e}")
+        return cls(stations)
+
+    def query_many(self, lats: Sequence[float], lons: Sequence[float],
+                   k: int = 3, radius_km: float = 1.0) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Пакетный запрос. Возвращает:
+          distances_km - (n, k) расстояния до k ближайших станций,
+          indices      - (n, k) индексы станций в self.stations,
+          counts       - (n,) число станций в радиусе radius_km.
+        """
+        k = min(k, len(self.stations))
+        points = to_unit_xyz(np.asarray(lats, dtype=np.float64), np.asarray(lons, dtype=np.float64))
+        chords, indices = self._tree.query(points, k=k)
+        chords = np.asarray(chords).reshape(len(points), k)
+        indices = np.asarray(indices).reshape(len(points), k)
+        counts = np.asarray(
+            self._tree.query_ball_point(points, r=km_to_chord(radius_km), return_length=True),
+            dtype=np.int64,
+        )
+        return chord_to_km(chords), indices, counts
+
+    def query(self, lat: float, lon: float, k: int = 3, radius_km: float = 1.0) -> MetroProximity:
+        distances, indices, counts = self.query_many([lat], [lon], k=k, radius_km=radius_km)
+        nearest = []
+        for distance, station_idx in zip(distances[0].tolist(), indices[0].tolist()):
+            station = self.stations[station_idx]
+            nearest.append({
+                "id": station.id,
+                "station": station.name,
+                "line": station.line,
+                "kind": station.kind,
+                "distance_km": round(distance, 3),
+            })
+        return MetroProximity(
+            nearest_station=nearest[0]["station"],
+            nearest_line=nearest[0]["line"],
+            nearest_distance_km=nearest[0]["distance_km"],
+            stations=nearest,
+            count_within_radius=int(counts[0]),
+        )
@@ -0,0 +1,339 @@
+"""
+Предрасчитанные тайлы плотности POI для признаков района.
+
+Офлайн-сборка (python -m parser.geo_parse.poi_tiles build ...) агрегирует локальный набор POI
+(CSV: latitude, longitude, category) и, при наличии, полигоны зеленых зон (GeoJSON) в
+иерархическую квадратную сетку: базовый уровень cell_km и уровни x2, x4, ... Результат - один
+файл, который читается через np.memmap; признаки объявления - несколько обращений к массивам.
+"""
+import argparse
+import csv
+import json
+import math
+import os
+from datetime import datetime
+from typing import Dict, Any, Optional, List, Sequence, Tuple
+
+import numpy as np
+
+from parser.geo_parse.district_index import DistrictIndex, read_geojson_polygons
+
+_MAGIC = b"FFTILES1"
+_ALIGN = 64
+_KM_PER_DEG_LAT = 110.574
+_KM_PER_DEG_LON_EQUATOR = 111.320
+
+CHANNELS = ("schools", "hospitals", "commercial", "green_fraction")
+_COUNT_CHANNELS = CHANNELS[:3]
+# Категории POI из исходного набора -> канал тайла
+CATEGORY_CHANNELS: Dict[str, str] = {
+    "school": "schools",
+    "hospital": "hospitals", "clinic": "hospitals",
+    "shop": "commercial", "supermarket": "commercial", "mall": "commercial", "marketplace": "commercial",
+    "cafe": "commercial", "restaurant": "commercial", "fast_food": "commercial", "office": "commercial",
+}
+
+
+class _Projection:
+    """Локальная равнопромежуточная проекция тайла: (широта, долгота) -> км от юго-западного угла."""
+
+    def __init__(self, lat_min: float, lon_min: float, lat0: float):
+        self.lat_min = lat_min
+        self.lon_min = lon_min
+        self.lat0 = lat0
+        self.km_per_deg_lon = _KM_PER_DEG_LON_EQUATOR * math.cos(math.radians(lat0))
+
+    def to_km(self, lats, lons):
+        return (np.asarray(lats) - self.lat_min) * _KM_PER_DEG_LAT, (np.asarray(lons) - self.lon_min) * self.km_per_deg_lon
+
+    def to_latlon(self, y_km, x_km):
+        return self.lat_min + np.asarray(y_km) / _KM_PER_DEG_LAT, self.lon_min + np.asarray(x_km) / self.km_per_deg_lon
+
+
+def _pool2(grid: np.ndarray) -> np.ndarray:
+    """Следующий уровень иерархии: счетчики суммируются по блокам 2x2, доля зелени - усредняется."""
+    ny, nx, _ = grid.shape
+    padded = np.zeros(((ny + 1) // 2 * 2, (nx + 1) // 2 * 2, grid.shape[2]), dtype=np.float64)
+    padded[:ny, :nx] = grid
+    blocks = padded.reshape(padded.shape[0] // 2, 2, padded.shape[1] // 2, 2, grid.shape[2])
+    pooled = blocks.sum(axis=(1, 3))
+    pooled[..., CHANNELS.index("green_fraction")] /= 4.0
+    return pooled
+
+
+def build_tiles(poi_csv_path: str, output_path: str,
+                bbox: Optional[Tuple[float, float, float, float]] = None,
+                green_geojson_path: Optional[str] = None,
+                cell_km: float = 0.25, levels: int = 4, green_supersample: int = 4,
+                chunk_size: int = 200000) -> Dict[str, Any]:
+    """
+    Собирает файл тайлов. bbox = (lat_min, lon_min, lat_max, lon_max); если не задан,
+    берется по данным POI (один дополнительный проход по CSV). POI читаются потоково, чанками.
+    """
+    def iter_chunks():
+        with open(poi_csv_path, "r", encoding="utf-8", newline="") as f:
+            lats, lons, channels = [], [], []
+            for row in csv.DictReader(f):
+                channel = CATEGORY_CHANNELS.get((row.get("category") or "").strip().lower())
+                if channel is None:
+                    continue
+                try:
+                    lats.append(float(row["latitude"]))
+                    lons.append(float(row["longitude"]))
+                except (KeyError, TypeError, ValueError):
+                    continue
+                channels.append(_COUNT_CHANNELS.index(channel))
+                if len(lats) >= chunk_size:
+                    yield np.array(lats), np.array(lons), np.array(channels)
+                    lats, lons, channels = [], [], []
+            if lats:
+                yield np.array(lats), np.array(lons), np.array(channels)
+
+    if bbox is None:
+        lat_min = lon_min = math.inf
+        lat_max = lon_max = -math.inf
+        for lats, lons, _ in iter_chunks():
+            lat_min, lat_max = min(lat_min, lats.min()), max(lat_max, lats.max())
+            lon_min, lon_max = min(lon_min, lons.min()), max(lon_max, lons.max())
+        if lat_min is math.inf:
+            raise ValueError(f"В '{poi_csv_path}' нет POI известных категорий, bbox определить нельзя.")
+        bbox = (lat_min, lon_min, lat_max, lon_max)
+
+    lat_min, lon_min, lat_max, lon_max = bbox
+    projection = _Projection(lat_min, lon_min, (lat_min + lat_max) / 2)
+    height_km, width_km = projection.to_km(lat_max, lon_max)
+    ny, nx = int(math.ceil(height_km / cell_km)) + 1, int(math.ceil(width_km / cell_km)) + 1
+    base = np.zeros((ny, nx, len(CHANNELS)), dtype=np.float64)
+
+    for lats, lons, channels in iter_chunks():
+        y_km, x_km = projection.to_km(lats, lons)
+        rows, cols = np.floor(y_km / cell_km).astype(np.int64), np.floor(x_km / cell_km).astype(np.int64)
+        inside = (rows >= 0) & (rows < ny) & (cols >= 0) & (cols < nx)
+        np.add.at(base, (rows[inside], cols[inside], channels[inside]), 1.0)
+
+    if green_geojson_path:
+        green_index = DistrictIndex(read_geojson_polygons(green_geojson_path))
+        offsets = (np.arange(green_supersample) + 0.5) / green_supersample * cell_km
+        green_channel = CHANNELS.index("green_fraction")
+        for row in range(ny): # Построчно, чтобы память не зависела от размера bbox
+            sub_y = row * cell_km + offsets
+            sub_x = (np.arange(nx)[:, None] * cell_km + offsets[None, :]).ravel()
+            yy, xx = np.meshgrid(sub_y, sub_x, indexing="ij")
+            sample_lats, sample_lons = projection.to_latlon(yy.ravel(), xx.ravel())
+            inside = (green_index.lookup_many(sample_lats, sample_lons) >= 0).reshape(green_supersample, nx, green_supersample)
+            base[row, :, green_channel] = inside.mean(axis=(0, 2))
+
+    grids = [base]
+    for _ in range(1, levels):
+        grids.append(_pool2(grids[-1]))
+
+    header = {
+        "format": 1,
+        "created_at": datetime.now().isoformat(),
+        "lat_min": lat_min, "lon_min": lon_min, "lat_max": lat_max, "lon_max": lon_max,
+        "lat0": projection.lat0,
+        "channels": list(CHANNELS),
+        "dtype": "float32",
+        "levels": [],
+    }
+    # Заголовок пишется с резервом места под смещения уровней, затем массивы с выравниванием
+    for level, grid in enumerate(grids):
+        header["levels"].append({"cell_km": cell_km * 2 ** level, "ny": grid.shape[0], "nx": grid.shape[1], "offset": 0})
+    data_start = _align(len(_MAGIC) + 4 + len(json.dumps(header).encode("utf-8")) + 32 * levels)
+    offset = data_start
+    for level_meta, grid in zip(header["levels"], grids):
+        level_meta["offset"] = offset
+        offset = _align(offset + grid.size * 4)
+    header_bytes = json.dumps(header).encode("utf-8")
+    if len(_MAGIC) + 4 + len(header_bytes) > data_start:
+        raise RuntimeError("Заголовок файла тайлов не помещается в зарезервированное место")
+
+    tmp_path = output_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_MAGIC)
+        f.write(len(header_bytes).to_bytes(4, "little"))
+        f.write(header_bytes)
+        for level_meta, grid in zip(header["levels"], grids):
+            f.seek(level_meta["offset"])
+            f.write(np.ascontiguousarray(grid, dtype="<f4").tobytes())
+        f.truncate(offset)
+    os.replace(tmp_path, output_path)
+    print(f"  [PoiTiles] Записан '{output_path}': уровней {levels}, базовая сетка {ny}x{nx} по {cell_km} км")
+    return header
+
+
+def _align(value: int) -> int:
+    return (value + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+class PoiTiles:
+    """Чтение файла тайлов через memmap. Данные не копируются в память процесса."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(len(_MAGIC)) != _MAGIC:
+                raise ValueError(f"'{path}' не является файлом тайлов POI")
+            header_len = int.from_bytes(f.read(4), "little")
+            self.header = json.loads(f.read(header_len).decode("utf-8"))
+
+        self.channels: List[str] = self.header["channels"]
+        self.bbox = (self.header["lat_min"], self.header["lon_min"], self.header["lat_max"], self.header["lon_max"])
+        self.projection = _Projection(self.header["lat_min"], self.header["lon_min"], self.header["lat0"])
+        self.levels: List[Dict[str, Any]] = self.header["levels"]
+        self.grids: List[np.ndarray] = [
+            np.memmap(path, dtype="<f4", mode="r", offset=level["offset"], shape=(level["ny"], level["nx"], len(self.channels)))
+            for level in self.levels
+        ]
+
+    def covers(self, lat: float, lon: float) -> bool:
+        lat_min, lon_min, lat_max, lon_max = self.bbox
+        return lat_min <= lat <= lat_max and lon_min <= lon <= lon_max
+
+    def level_for(self, cell_km: float) -> int:
+        """Уровень с ближайшим к cell_km размером ячейки."""
+        return min(range(len(self.levels)), key=lambda i: abs(self.levels[i]["cell_km"] - cell_km))
+
+    def _cells(self, lats, lons, level: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Строка и столбец ячейки уровня level для точек (могут быть вне сетки)."""
+        cell_km = self.levels[level]["cell_km"]
+        y_km, x_km = self.projection.to_km(np.asarray(lats, dtype=np.float64), np.asarray(lons, dtype=np.float64))
+        return np.floor(y_km / cell_km).astype(np.int64), np.floor(x_km / cell_km).astype(np.int64)
+
+    def features_many(self, lats: Sequence[float], lons: Sequence[float],
+                      level: int = 0, neighbourhood: int = 1) -> np.ndarray:
+        """
+        Для каждой точки - суммы каналов в окне (2*neighbourhood+1)^2 ячеек уровня level
+        (доля зелени - среднее по окну). Возвращает массив (n, len(channels)); вне тайла - NaN.
+        """
+        grid = self.grids[level]
+        rows, cols = self._cells(lats, lons, level)
+        valid = (rows >= 0) & (rows < grid.shape[0]) & (cols >= 0) & (cols < grid.shape[1])
+
+        result = np.full((len(rows), len(self.channels)), np.nan, dtype=np.float64)
+        if not valid.any():
+            return result
+        window_sum = np.zeros((int(valid.sum()), len(self.channels)), dtype=np.float64)
+        window_cells = np.zeros(int(valid.sum()), dtype=np.float64)
+        for dy in range(-neighbourhood, neighbourhood + 1):
+            for dx in range(-neighbourhood, neighbourhood + 1):
+                r, c = rows[valid] + dy, cols[valid] + dx
+                ok = (r >= 0) & (r < grid.shape[0]) & (c >= 0) & (c < grid.shape[1])
+                window_sum[ok] += grid[r[ok], c[ok]]
+                window_cells += ok
+        green = self.channels.index("green_fraction")
+        window_sum[:, green] /= np.maximum(window_cells, 1)
+        result[valid] = window_sum
+        return result
+
+    def features(self, lat: float, lon: float, level: int = 0, neighbourhood: int = 1) -> Optional[List[float]]:
+        """То же, что features_many, для одной точки: срез окна без векторной обвязки. Вне тайла - None."""
+        grid = self.grids[level]
+        cell_km = self.levels[level]["cell_km"]
+        row = math.floor((lat - self.projection.lat_min) * _KM_PER_DEG_LAT / cell_km)
+        col = math.floor((lon - self.projection.lon_min) * self.projection.km_per_deg_lon / cell_km)
+        if not (0 <= row < grid.shape[0] and 0 <= col < grid.shape[1]):
+            return None
+        r0, r1 = max(row - neighbourhood, 0), min(row + neighbourhood + 1, grid.shape[0])
+        c0, c1 = max(col - neighbourhood, 0), min(col + neighbourhood + 1, grid.shape[1])
+        window = grid[r0:r1, c0:c1].reshape(-1, grid.shape[2])
+        values = window.sum(axis=0, dtype=np.float64).tolist()
+        green = self.channels.index("green_fraction")
+        values[green] /= len(window)
+        return values
+
+    def window_area_km2(self, lats, lons, level: int = 0, neighbourhood: int = 1) -> np.ndarray:
+        """
+        Площадь окна features/features_many для точек, км2: только ячейки, которые есть в сетке.
+        У края тайла окно обрезано, и плотность на полную площадь (2*neighbourhood+1)^2 ячеек была бы занижена.
+        Вне тайла - NaN.
+        """
+        ny, nx = self.grids[level].shape[:2]
+        cell_km = self.levels[level]["cell_km"]
+        rows, cols = self._cells(lats, lons, level)
+        valid = (rows >= 0) & (rows < ny) & (cols >= 0) & (cols < nx)
+        n_rows = np.minimum(rows + neighbourhood, ny - 1) - np.maximum(rows - neighbourhood, 0) + 1
+        n_cols = np.minimum(cols + neighbourhood, nx - 1) - np.maximum(cols - neighbourhood, 0) + 1
+        return np.where(valid, n_rows * n_cols * cell_km * cell_km, np.nan)
+
+
+class PoiTileSet:
+    """Набор файлов тайлов (например, по агломерациям); для точки выбирается покрывающий ее тайл."""
+
+    def __init__(self, tiles: Sequence[PoiTiles], cell_km: float = 1.0, neighbourhood: int = 1):
+        self.tiles = list(tiles)
+        self.cell_km = cell_km
+        self.neighbourhood = neighbourhood
+
+    @classmethod
+    def from_directory(cls, directory: str, cell_km: float = 1.0, neighbourhood: int = 1) -> "PoiTileSet":
+        tiles = [PoiTiles(os.path.join(directory, name)) for name in sorted(os.listdir(directory)) if name.endswith(".tiles")]
+        print(f"  [PoiTiles] Загружено файлов тайлов: {len(tiles)} из '{directory}'")
+        return cls(tiles, cell_km, neighbourhood)
+
+    def _to_district_fields(self, tiles: PoiTiles, values: Sequence[float], area_km2: float) -> Dict[str, Any]:
+        channel = dict(zip(tiles.channels, values))
+        return {
+            "schools_count": int(channel["schools"]),
+            "hospitals_count": int(channel["hospitals"]),
+            "green_area_percentage": round(channel["green_fraction"], 4),
+            "commercial_density": round(channel["commercial"] / area_km2, 3), # объектов на км2
+        }
+
+    def district_features(self, lat: float, lon: float) -> Optional[Dict[str, Any]]:
+        """Признаки окрестности в терминах DistrictInfo или None, если точка не покрыта тайлами."""
+        for tiles in self.tiles:
+            if tiles.covers(lat, lon):
+                level = tiles.level_for(self.cell_km)
+                values = tiles.features(lat, lon, level, self.neighbourhood)
+                if values is not None:
+                    area_km2 = float(tiles.window_area_km2(lat, lon, level, self.neighbourhood))
+                    return self._to_district_fields(tiles, values, area_km2)
+        return None
+
+    def district_features_many(self, lats: Sequence[float], lons: Sequence[float]) -> List[Optional[Dict[str, Any]]]:
+        """Пакетный вариант district_features: точки обрабатываются векторно по каждому файлу тайлов."""
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        results: List[Optional[Dict[str, Any]]] = [None] * len(lats)
+        pending = np.arange(len(lats))
+        for tiles in self.tiles:
+            if len(pending) == 0:
+                break
+            lat_min, lon_min, lat_max, lon_max = tiles.bbox
+            lat_p, lon_p = lats[pending], lons[pending]
+            covered = (lat_p >= lat_min) & (lat_p <= lat_max) & (lon_p >= lon_min) & (lon_p <= lon_max)
+            if not covered.any():
+                continue
+            level = tiles.level_for(self.cell_km)
+            values = tiles.features_many(lat_p[covered], lon_p[covered], level, self.neighbourhood)
+            areas = tiles.window_area_km2(lat_p[covered], lon_p[covered], level, self.neighbourhood)
+            for pos, row, area_km2 in zip(pending[covered].tolist(), values.tolist(), areas.tolist()):
+                results[pos] = self._to_district_fields(tiles, row, area_km2)
+            pending = pending[~covered]
+        return results
+
+    @property
+    def paths(self) -> List[str]:
+        return [tiles.path for tiles in self.tiles]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сборка тайлов плотности POI")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build = subparsers.add_parser("build", help="Собрать файл тайлов из CSV POI и GeoJSON зеленых зон")
+    build.add_argument("--poi", required=True, help="CSV с колонками latitude, longitude, category")
+    build.add_argument("--green", help="GeoJSON с полигонами зеленых зон (парки, леса)")
+    build.add_argument("--output", required=True, help="Путь к выходному .tiles файлу")
+    build.add_argument("--bbox", help="lat_min,lon_min,lat_max,lon_max (по умолчанию - по данным)")
+    build.add_argument("--cell-km", type=float, default=0.25)
+    build.add_argument("--levels", type=int, default=4)
+    args = parser.parse_args()
+
+    bbox = tuple(float(v) for v in args.bbox.split(",")) if args.bbox else None
+    build_tiles(args.poi, args.output, bbox=bbox, green_geojson_path=args.green,
+                cell_km=args.cell_km, levels=args.levels)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from _config import district_stats_mongo_uri, district_stats_db_name
+from bd.district_stats import DistrictStatsReader
+from posterData import PosterData
+from parser.base_enricher import BaseEnricher
+
+
+def build_district_stats_reader(collection_name: str = "district_stats") -> DistrictStatsReader:
+    client = AsyncIOMotorClient(district_stats_mongo_uri)
+    return DistrictStatsReader(client[district_stats_db_name][collection_name])
+
+
+class MarketStatsEnricher(BaseEnricher):
+    """
+    Шаг обогащения: рыночная цена за м² района (средняя, медиана, размер выборки) из снимка статистики.
+    Берется самый узкий ключ (район + комнатность, затем район, затем регион) с достаточной выборкой.
+    """
+    name = "market"
+    depends_on = ("geo",)
+    timeout = 0.5
+
+    def __init__(self, reader: DistrictStatsReader):
+        self.reader = reader
+
+    async def enrich(self, poster_data: PosterData, request_id: str = "N/A") -> bool:
+        district_info = poster_data.district_info
+        if district_info is None:
+            return False
+        stats = self.reader.lookup(district_info.region_name,
+                                   district_info.district_name or district_info.city_name,
+                                   poster_data.rooms, poster_data.section)
+        if stats is None:
+            print(f"[{request_id}] [MarketEnrich] Нет статистики цен для района объявления ID: {poster_data.id}")
+            return False
+        district_info.avg_price_per_sqm = stats["mean"]
+        district_info.median_price_per_sqm = stats.get("median")
+        district_info.market_sample_size = stats["count"]
+        print(f"[{request_id}] [MarketEnrich] Статистика цен ({stats['key']}, {stats['window']}) добавлена для ID: {poster_data.id}")
+        return True
@@ -15,6 +15,7 @@ from bs4 import BeautifulSoup
 
 from posterData import PosterData, ProcessingStatus
 from message_queue_manager import MessageQueueManager
+from result_cache import ad_id_from_url
 from parser.poster_parse.cian_parser import CianFlatRentParser
 
 logger = logging.getLogger(__name__)
@@ -211,12 +212,9 @@ class ParserWorker:
     
     async def _extract_ad_id(self, url: str) -> str:
         try:
-            cian_match = re.search(r'/(\d+)/?', url)
-            if cian_match :
-                return cian_match.group(1)
-            avito_match = re.search(r'_(\d+)', url)
-            if avito_match:
-                return avito_match.group(1)
+            ad_id = ad_id_from_url(url) # Тот же ID, по которому бот ищет готовый результат в кеше
+            if ad_id:
+                return ad_id
             
             # Fallback - хеш URL
             return str(abs(hash(url)))
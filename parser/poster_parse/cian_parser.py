@@ -2,9 +2,48 @@ from parser.poster_parse.base_parser import BaseParser
 from bs4 import BeautifulSoup
 from typing import Dict, Any, List, Optional
 from posterData import *
+from datetime import date, datetime, timedelta, timezone
 import re
 import json 
 
+# Дата публикации в данных страницы: unix-время (publicationDate/addedTimestamp) или ISO-строка (creationDate)
+_PUBLICATION_TIMESTAMP_RE = re.compile(r'"(?:publicationDate|addedTimestamp)"\s*:\s*(\d{9,10})\b')
+_CREATION_DATE_RE = re.compile(r'"creationDate"\s*:\s*"(\d{4}-\d{2}-\d{2})')
+# Подпись с датой на карточке (общая для обоих вариантов разметки ниже)
+_PUBLISHED_DATE_SELECTOR = "div[data-testid='metadata-added-date'] span"
+# Дата на странице: "сегодня, 12:30", "вчера, 09:15", "12 мар, 14:05", "12 марта 2023"
+_RU_DATE_RE = re.compile(r'(\d{1,2})\s+([а-я]{3})[а-я]*\.?(?:\s+(\d{4}))?')
+_RU_MONTHS = {"янв": 1, "фев": 2, "мар": 3, "апр": 4, "мая": 5, "май": 5, "июн": 6,
+              "июл": 7, "авг": 8, "сен": 9, "окт": 10, "ноя": 11, "дек": 12}
+
+
+def parse_publication_date(text: Optional[str], today: Optional[date] = None) -> Optional[str]:
+    """
+    Дата с карточки объявления в ISO (YYYY-MM-DD). Без года - последняя такая дата, не позже сегодняшней.
+    """
+    if not text:
+        return None
+    today = today or date.today()
+    text = text.lower()
+    if "сегодня" in text:
+        return today.isoformat()
+    if "вчера" in text:
+        return (today - timedelta(days=1)).isoformat()
+    match = _RU_DATE_RE.search(text)
+    if not match or match.group(2) not in _RU_MONTHS:
+        return None
+    day, month = int(match.group(1)), _RU_MONTHS[match.group(2)]
+    try:
+        if match.group(3):
+            return date(int(match.group(3)), month, day).isoformat()
+        published = date(today.year, month, day)
+        if published > today:
+            published = date(today.year - 1, month, day)
+    except ValueError:
+        return None
+    return published.isoformat()
+
+
 class CianFlatRentParser(BaseParser):
     """
     Парсер для детальных страниц объявлений об аренде квартир на Циане.
@@ -87,6 +126,23 @@ class CianFlatRentParser(BaseParser):
                 return None
         return None
 
+    def _extract_published_at(self, soup: BeautifulSoup) -> Optional[str]:
+        """
+        Дата публикации (ISO): из данных объявления в скриптах страницы, иначе из подписи с датой на карточке.
+        Нужна экономическому обогащению - показатели берутся на дату публикации, а не на дату разбора.
+        """
+        for script in soup.find_all('script'):
+            text = script.string
+            if not text:
+                continue
+            match = _PUBLICATION_TIMESTAMP_RE.search(text)
+            if match:
+                return datetime.fromtimestamp(int(match.group(1)), tz=timezone.utc).date().isoformat()
+            match = _CREATION_DATE_RE.search(text)
+            if match:
+                return match.group(1)
+        return parse_publication_date(self._get_text(soup, _PUBLISHED_DATE_SELECTOR))
+
     def parse(self, soup: BeautifulSoup) -> Dict[str, Any]:
         """
         Парсит HTML-содержимое страницы объявления об аренде квартиры на Циане
@@ -98,6 +154,7 @@ class CianFlatRentParser(BaseParser):
         data['price'] = self._extract_and_clean_price(soup, self._SELECTORS["price"])
         data['address'] = self._get_text(soup, self._SELECTORS["address"])
         data['description'] = self._get_text(soup, self._SELECTORS["description"])
+        data['published_at'] = self._extract_published_at(soup)
         
         # 2. Площади и их очистка (используем новый вспомогательный метод _get_info_from_summary_or_factoids)
         data['area_total'] = self._extract_and_clean_area(self._get_info_from_summary_or_factoids(soup, 'Общая площадь'))
@@ -419,6 +476,7 @@ class CianFlatRentParser(BaseParser):
         data['price'] = self._extract_and_clean_price(soup, self._SELECTORS["price"])
         data['address'] = self._get_text(soup, self._SELECTORS["address"])
         data['description'] = self._get_text(soup, self._SELECTORS["description"])
+        data['published_at'] = self._extract_published_at(soup)
         
         # 2. Площади и их очистка (используем новый вспомогательный метод _get_info_from_summary_or_factoids)
         data['area_total'] = self._extract_and_clean_area(self._get_info_from_summary_or_factoids(soup, 'Общая площадь'))
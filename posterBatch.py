@@ -0,0 +1,336 @@
+from dataclasses import fields, is_dataclass
+from typing import Optional, Dict, Any, List, Sequence, Iterable, Union, Tuple, get_args, get_origin
+
+import numpy as np
+
+from posterData import PosterData
+
+# Строковые поля с небольшим числом различных значений - хранятся кодами словаря
+CATEGORICAL_COLUMNS = frozenset({
+    "section", "property_type", "repair_type", "building_type",
+    "district_info.region_name", "district_info.city_name", "district_info.district_name",
+    "district_info.nearest_metro_station", "economic_data.region_name",
+})
+_COORDINATE_KEYS = {"latitude": ("latitude", "lat"), "longitude": ("longitude", "lon")}
+
+
+class Categorical:
+    """Словарное кодирование: codes[i] - индекс в categories, -1 - значение отсутствует."""
+    __slots__ = ("codes", "categories")
+
+    def __init__(self, codes: np.ndarray, categories: List[str]):
+        self.codes = codes
+        self.categories = categories
+
+    @classmethod
+    def from_values(cls, values: Iterable[Optional[str]]) -> "Categorical":
+        lookup: Dict[str, int] = {}
+        codes = np.fromiter(
+            (-1 if v is None else lookup.setdefault(v, len(lookup)) for v in values), dtype=np.int32
+        )
+        return cls(codes, list(lookup))
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def to_list(self) -> List[Optional[str]]:
+        categories = self.categories
+        return [None if c < 0 else categories[c] for c in self.codes.tolist()]
+
+    def take(self, indices: np.ndarray) -> "Categorical":
+        return Categorical(self.codes[indices], self.categories)
+
+    def code_of(self, value: str) -> int:
+        """Код значения (-1, если его нет в словаре) - для векторных фильтров вида batch.codes == code."""
+        try:
+            return self.categories.index(value)
+        except ValueError:
+            return -1
+
+    @staticmethod
+    def concat(parts: Sequence["Categorical"]) -> "Categorical":
+        """Объединение с общим словарем: коды частей перекодируются таблицей, без прохода по строкам."""
+        lookup: Dict[str, int] = {}
+        recoded = []
+        for part in parts:
+            remap = np.array([lookup.setdefault(c, len(lookup)) for c in part.categories] + [-1], dtype=np.int32)
+            recoded.append(remap[part.codes]) # код -1 попадает на последний элемент remap
+        codes = np.concatenate(recoded) if recoded else np.empty(0, dtype=np.int32)
+        return Categorical(codes, list(lookup))
+
+
+def _scalar_kind(field_type) -> Union[str, type]:
+    candidates = get_args(field_type) if get_origin(field_type) is Union else (field_type,)
+    for candidate in candidates:
+        if is_dataclass(candidate):
+            return candidate
+        if candidate is bool:
+            return "bool"
+        if candidate is int:
+            return "int"
+        if candidate is float:
+            return "float"
+        if candidate is str:
+            return "str"
+    return "object"
+
+
+def _build_columns(record_cls, prefix: str = "") -> List[Tuple[str, Tuple[str, ...], str]]:
+    """Плоская схема колонок: (имя колонки, путь к значению, вид: int/float/bool/categorical/object)."""
+    columns = []
+    for f in fields(record_cls):
+        name = prefix + f.name
+        kind = _scalar_kind(f.type)
+        if is_dataclass(kind):
+            columns.extend((col, (f.name, *path), k) for col, path, k in _build_columns(kind, name + "."))
+        elif f.name == "coordinates" and not prefix:
+            columns.extend((f"coordinates.{key}", ("coordinates", key), "float") for key in _COORDINATE_KEYS)
+        elif kind == "str":
+            columns.append((name, (f.name,), "categorical" if name in CATEGORICAL_COLUMNS else "object"))
+        else:
+            columns.append((name, (f.name,), kind))
+    return columns
+
+
+COLUMNS = _build_columns(PosterData)
+
+
+def _field_type(path: Tuple[str, ...]):
+    record_cls, field_type = PosterData, None
+    for part in path:
+        field_type = next(f.type for f in fields(record_cls) if f.name == part)
+        record_cls = _scalar_kind(field_type)
+    return field_type
+
+
+def arrow_schema():
+    """Постоянная схема pyarrow для COLUMNS: одинаковая для любой пачки (в том числе со сплошными None)."""
+    import pyarrow as pa
+
+    types = {"categorical": pa.dictionary(pa.int32(), pa.string()), "int": pa.int64(),
+             "float": pa.float64(), "bool": pa.bool_()}
+    schema_fields = []
+    for name, path, kind in COLUMNS:
+        if kind in types:
+            arrow_type = types[kind]
+        else:
+            field_type = _field_type(path)
+            candidates = get_args(field_type) if get_origin(field_type) is Union else (field_type,)
+            origins = {get_origin(candidate) or candidate for candidate in candidates}
+            if list in origins:
+                arrow_type = pa.list_(pa.string())
+            elif dict in origins:
+                arrow_type = pa.map_(pa.string(), pa.float64())
+            else:
+                arrow_type = pa.string()
+        schema_fields.append(pa.field(name, arrow_type))
+    return pa.schema(schema_fields)
+
+
+def _document_value(document: Dict[str, Any], path: Tuple[str, ...]):
+    if len(path) == 1:
+        return document.get(path[0])
+    nested = document.get(path[0])
+    if nested is None:
+        return None
+    if path[0] == "coordinates":
+        for key in _COORDINATE_KEYS[path[1]]:
+            if nested.get(key) is not None:
+                return nested[key]
+        return None
+    return nested.get(path[1]) if isinstance(nested, dict) else getattr(nested, path[1], None)
+
+
+def _poster_value(poster: PosterData, path: Tuple[str, ...]):
+    value = getattr(poster, path[0])
+    if len(path) == 1 or value is None:
+        return value
+    if path[0] == "coordinates":
+        return _document_value({"coordinates": value}, path)
+    return getattr(value, path[1])
+
+
+class PosterBatch:
+    """
+    Колоночное представление набора объявлений для пакетной аналитики и скоринга.
+    Числовые поля (включая вложенные district_info.* и economic_data.*) - массивы float64 с NaN вместо None,
+    булевы - int8 с -1 вместо None, категориальные строки - Categorical, остальное - object-массивы.
+    Имена колонок вложенных полей - пути MongoDB ("district_info.metro_distance").
+    """
+
+    def __init__(self, columns: Dict[str, Union[np.ndarray, Categorical]], size: int):
+        self.columns = columns
+        self.size = size
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getitem__(self, column: str) -> Union[np.ndarray, Categorical]:
+        return self.columns[column]
+
+    def _layout(self) -> List[Tuple[str, Tuple[str, ...], str]]:
+        """Схема COLUMNS, ограниченная колонками пачки (пачка из from_documents(names=...) хранит не все)."""
+        return [column for column in COLUMNS if column[0] in self.columns]
+
+    @classmethod
+    def _from_rows(cls, rows: Sequence[Any], getter, names: Optional[Iterable[str]] = None) -> "PosterBatch":
+        names = None if names is None else frozenset(names)
+        columns: Dict[str, Union[np.ndarray, Categorical]] = {}
+        for name, path, kind in COLUMNS:
+            if names is not None and name not in names:
+                continue
+            values = [getter(row, path) for row in rows]
+            if kind in ("int", "float"):
+                columns[name] = np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+            elif kind == "bool":
+                columns[name] = np.array([-1 if v is None else int(bool(v)) for v in values], dtype=np.int8)
+            elif kind == "categorical":
+                columns[name] = Categorical.from_values(values)
+            else:
+                column = np.empty(len(values), dtype=object)
+                for i, value in enumerate(values): # Поэлементно: списки одной длины numpy развернул бы в 2D
+                    column[i] = value
+                columns[name] = column
+        return cls(columns, len(rows))
+
+    @classmethod
+    def from_posters(cls, posters: Sequence[PosterData]) -> "PosterBatch":
+        return cls._from_rows(posters, _poster_value)
+
+    @classmethod
+    def from_documents(cls, documents: Sequence[Dict[str, Any]], names: Optional[Iterable[str]] = None) -> "PosterBatch":
+        """Из документов MongoDB или сообщений очереди (формат PosterData.to_dict); лишние ключи игнорируются."""
+        return cls._from_rows(documents, _document_value, names)
+
+    @classmethod
+    def from_features(cls, rows: Sequence[Dict[str, Any]], names: Optional[Iterable[str]] = None) -> "PosterBatch":
+        """
+        Из плоских словарей {имя колонки: значение} (ML.feature_store); отсутствующие колонки - None.
+        names - только эти колонки (например, входные колонки ML.featurizer).
+        """
+        return cls._from_rows(rows, lambda row, path: row.get(".".join(path)), names)
+
+    @classmethod
+    def from_arrow(cls, table) -> "PosterBatch":
+        """
+        Из pyarrow.Table (выгрузка bd/export_parquet.py) колоночными преобразованиями, без прохода по строкам.
+        Берутся только колонки COLUMNS, которые есть в таблице.
+        """
+        import pyarrow as pa
+
+        columns: Dict[str, Union[np.ndarray, Categorical]] = {}
+        for name, _, kind in COLUMNS:
+            if name not in table.column_names:
+                continue
+            column = table[name]
+            if kind == "categorical":
+                encoded = column.cast(pa.string()).combine_chunks().dictionary_encode()
+                columns[name] = Categorical(encoded.indices.fill_null(-1).to_numpy(zero_copy_only=False).astype(np.int32),
+                                            encoded.dictionary.to_pylist())
+            elif kind in ("int", "float"):
+                columns[name] = column.cast(pa.float64()).fill_null(np.nan).to_numpy()
+            elif kind == "bool":
+                columns[name] = column.cast(pa.int8()).fill_null(-1).to_numpy()
+            else:
+                values = column.to_pylist()
+                if pa.types.is_map(column.type): # map приходит списком пар (ключ, значение)
+                    values = [None if value is None else dict(value) for value in values]
+                columns[name] = np.empty(len(values), dtype=object)
+                for i, value in enumerate(values):
+                    columns[name][i] = value
+        return cls(columns, table.num_rows)
+
+    def to_documents(self) -> List[Dict[str, Any]]:
+        """
+        Обратно в формат PosterData.to_dict (вложенные записи без значений -> None).
+        У пачки с частью колонок в документах только поля этих колонок.
+        """
+        layout = self._layout()
+        lists = {}
+        for name, _, kind in layout:
+            column = self.columns[name]
+            if kind == "categorical":
+                lists[name] = column.to_list()
+            elif kind == "int":
+                lists[name] = [None if v != v else int(v) for v in column.tolist()]
+            elif kind == "float":
+                lists[name] = [None if v != v else v for v in column.tolist()]
+            elif kind == "bool":
+                lists[name] = [None if v < 0 else bool(v) for v in column.tolist()]
+            else:
+                lists[name] = column.tolist()
+
+        documents = []
+        for i in range(self.size):
+            document: Dict[str, Any] = {}
+            nested: Dict[str, Dict[str, Any]] = {}
+            for name, path, _ in layout:
+                if len(path) == 1:
+                    document[name] = lists[name][i]
+                else:
+                    nested.setdefault(path[0], {})[path[1]] = lists[name][i]
+            for key, values in nested.items():
+                if key == "coordinates":
+                    document[key] = values if values.get("latitude") is not None and values.get("longitude") is not None else None
+                else: # Вложенная запись существовала, если у нее есть хоть одно значение
+                    document[key] = values if any(v is not None for v in values.values()) else None
+            if document.get("_id") is None:
+                document.pop("_id", None)
+            documents.append(document)
+        return documents
+
+    def to_posters(self) -> List[PosterData]:
+        return [PosterData.from_trusted_dict(document) for document in self.to_documents()]
+
+    def take(self, indices: Union[np.ndarray, Sequence[int]]) -> "PosterBatch":
+        """Подвыборка по индексам или булевой маске."""
+        indices = np.asarray(indices)
+        if indices.dtype == bool:
+            indices = np.flatnonzero(indices)
+        columns = {name: column.take(indices) if isinstance(column, Categorical) else column[indices]
+                   for name, column in self.columns.items()}
+        return PosterBatch(columns, len(indices))
+
+    @classmethod
+    def concat(cls, batches: Sequence["PosterBatch"]) -> "PosterBatch":
+        """Объединение пачек с одинаковым набором колонок."""
+        if not batches:
+            raise ValueError("Нет пачек для объединения")
+        names = set(batches[0].columns)
+        for batch in batches[1:]:
+            if set(batch.columns) != names:
+                raise ValueError(f"Разный набор колонок в пачках: {sorted(names ^ set(batch.columns))}")
+        columns: Dict[str, Union[np.ndarray, Categorical]] = {}
+        for name, _, kind in batches[0]._layout():
+            parts = [batch.columns[name] for batch in batches]
+            columns[name] = Categorical.concat(parts) if kind == "categorical" else np.concatenate(parts)
+        return cls(columns, sum(len(batch) for batch in batches))
+
+    def to_arrow(self):
+        """
+        pyarrow.Table со схемой arrow_schema() (у пачки с частью колонок - только их поля) и DictionaryArray
+        для категориальных колонок (pyarrow нужен только здесь).
+        """
+        import pyarrow as pa
+
+        layout = self._layout()
+        schema = arrow_schema()
+        if len(layout) < len(COLUMNS):
+            schema = pa.schema([schema.field(name) for name, _, _ in layout])
+        arrays = []
+        for name, _, kind in layout:
+            column = self.columns[name]
+            if kind == "categorical":
+                codes = pa.array(column.codes, mask=column.codes < 0)
+                arrays.append(pa.DictionaryArray.from_arrays(codes, pa.array(column.categories, type=pa.string())))
+            elif kind == "int":
+                arrays.append(pa.array(column, mask=np.isnan(column), type=pa.float64()).cast(pa.int64(), safe=False))
+            elif kind == "float":
+                arrays.append(pa.array(column, mask=np.isnan(column)))
+            elif kind == "bool":
+                arrays.append(pa.array(column == 1, mask=column < 0))
+            elif name == "_id": # ObjectId MongoDB
+                arrays.append(pa.array([None if v is None else str(v) for v in column.tolist()], type=pa.string()))
+            else:
+                arrays.append(pa.array(column.tolist(), type=schema.field(name).type))
+        return pa.Table.from_arrays(arrays, schema=schema)
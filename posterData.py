@@ -1,7 +1,112 @@
-from dataclasses import dataclass, field, asdict
-from typing import Optional, Dict, Any, List
+from dataclasses import dataclass, field, fields, is_dataclass, MISSING
+from typing import Optional, Dict, Any, List, Union, get_args, get_origin
 import re
 
+_NON_DIGITS_RE = re.compile(r'\D')
+_ROOMS_RE = re.compile(r'(\d+)-комн')
+
+
+def _field_kind(field_type) -> tuple:
+    """Как копировать поле при сериализации: ("nested", класс), ("list", None), ("dict", None) или ("plain", None)."""
+    candidates = get_args(field_type) if get_origin(field_type) is Union else (field_type,)
+    for candidate in candidates:
+        if is_dataclass(candidate):
+            return "nested", candidate
+        if get_origin(candidate) is list or candidate is list:
+            return "list", None
+        if get_origin(candidate) is dict or candidate is dict:
+            return "dict", None
+    return "plain", None
+
+
+def _slotted(cls):
+    """Пересоздает dataclass с __slots__ (как dataclass(slots=True), который есть только с Python 3.10)."""
+    names = tuple(f.name for f in fields(cls))
+    namespace = {k: v for k, v in cls.__dict__.items() if k not in names and k not in ("__dict__", "__weakref__")}
+    namespace["__slots__"] = names
+    slotted_cls = type(cls)(cls.__name__, cls.__bases__, namespace)
+    slotted_cls.__qualname__ = cls.__qualname__
+    return slotted_cls
+
+
+def _install_codec(cls, omit_if_none: tuple = ()):
+    """
+    Генерирует для dataclass плоские методы (вместо рекурсивного asdict с deepcopy):
+      to_dict()               - словарь для JSON/MongoDB; вложенные записи - через их to_dict, списки и словари копируются;
+      from_dict(data)         - конструктор через __init__ (с очисткой в __post_init__), лишние ключи игнорируются;
+      from_trusted_dict(data) - без __init__/__post_init__, для данных, уже очищенных на предыдущей стадии.
+    """
+    namespace: Dict[str, Any] = {"_new": object.__new__}
+    to_items, init_args, trusted_lines = [], [], []
+    for f in fields(cls):
+        name = f.name
+        kind, nested_cls = _field_kind(f.type)
+        value = f"self.{name}"
+        if kind == "nested":
+            namespace[f"_N_{name}"] = nested_cls
+            to_items.append(f"        {name!r}: None if {value} is None else {value}.to_dict(),")
+        elif kind in ("list", "dict"):
+            to_items.append(f"        {name!r}: None if {value} is None else {kind}({value}),")
+        else:
+            to_items.append(f"        {name!r}: {value},")
+
+        if f.default is not MISSING:
+            namespace[f"_d_{name}"] = f.default
+            read = f"get({name!r}, _d_{name})"
+        elif f.default_factory is not MISSING:
+            namespace[f"_f_{name}"] = f.default_factory
+            read = f"data[{name!r}] if {name!r} in data else _f_{name}()"
+        else:
+            read = f"data[{name!r}]"
+        init_args.append(f"            {name}={read},")
+        if kind == "nested":
+            trusted_lines.append(f"        value = {read}")
+            trusted_lines.append(f"        self.{name} = _N_{name}.from_trusted_dict(value) if value.__class__ is dict else value")
+        else:
+            trusted_lines.append(f"        self.{name} = {read}")
+
+    omit_lines = [f"    if data[{name!r}] is None:\n        del data[{name!r}]" for name in omit_if_none]
+    source = "\n".join([
+        "def to_dict(self):",
+        "    data = {",
+        *to_items,
+        "    }",
+        *omit_lines,
+        "    return data",
+        "",
+        "def from_dict(cls, data):",
+        "    get = data.get",
+        "    try:",
+        "        return cls(",
+        *init_args,
+        "        )",
+        "    except KeyError as e:",
+        f"        raise TypeError(f'{cls.__name__}: отсутствует обязательное поле {{e}}') from None",
+        "",
+        "def from_trusted_dict(cls, data):",
+        "    get = data.get",
+        "    self = _new(cls)",
+        "    try:",
+        *trusted_lines,
+        "    except KeyError as e:",
+        f"        raise TypeError(f'{cls.__name__}: отсутствует обязательное поле {{e}}') from None",
+        "    return self",
+    ])
+    exec(compile(source, f"<codec {cls.__name__}>", "exec"), namespace)
+    cls.to_dict = namespace["to_dict"]
+    cls.from_dict = classmethod(namespace["from_dict"])
+    cls.from_trusted_dict = classmethod(namespace["from_trusted_dict"])
+    return cls
+
+
+def _fast_record(cls=None, *, omit_if_none: tuple = ()):
+    """Декоратор поверх @dataclass: __slots__ и сгенерированные to_dict/from_dict/from_trusted_dict."""
+    def wrap(dataclass_cls):
+        return _install_codec(_slotted(dataclass_cls), omit_if_none)
+    return wrap(cls) if cls is not None else wrap
+
+
+@_fast_record
 @dataclass
 class ResidentialComplex:
     name: Optional[str] = None
@@ -13,10 +118,8 @@ class ResidentialComplex:
     parking_complex: Optional[str] = None    # Тип паркинга в ЖК (подземный, наземный и т.д.)
     infrastructure_features: Optional[List[str]] = field(default_factory=list) # Особенности инфраструктуры ЖК
 
-    def to_dict(self) -> Dict[str, Any]:
-        return asdict(self)
-
 
+@_fast_record
 @dataclass
 class DistrictInfo:
     region_name: str
@@ -24,18 +127,22 @@ class DistrictInfo:
     district_name: Optional[str] = None
     population: Optional[int] = None
     avg_price_per_sqm: Optional[float] = None              # Средняя цена за кв.м в районе
+    median_price_per_sqm: Optional[float] = None           # Медианная цена за кв.м (статистика района, bd/district_stats.py)
+    market_sample_size: Optional[int] = None               # Объявлений, по которым посчитана статистика цены
     schools_count: Optional[int] = None                     # Количество школ в районе
     hospitals_count: Optional[int] = None                   # Количество больниц или крупных медицинских учреждений в районе
     crime_rate: Optional[float] = None                      # Уровень преступности в районе (например, на 1000 жителей, или индекс)
     metro_distance: Optional[float] = None                  # Расстояние до метро в км
+    nearest_metro_station: Optional[str] = None             # Ближайшая станция метро/МЦД
+    metro_stations_nearby: Optional[int] = None             # Количество станций в радиусе пешей доступности
+    minutes_to_centre: Optional[float] = None               # Минут до центра: пешком до станции + по метро
+    commute_minutes: Optional[Dict[str, float]] = None      # Минут до каждой ключевой точки (центр, деловые районы)
     public_transport_accessibility: Optional[float] = None  # Индекс доступности общественного транспорта
     green_area_percentage: Optional[float] = None           # Процент зеленых зон
     commercial_density: Optional[float] = None              # Плотность коммерческой недвижимости/объектов
 
-    def to_dict(self) -> Dict[str, Any]:
-        return asdict(self)
-
 
+@_fast_record
 @dataclass
 class EconomicData:
     region_name: str
@@ -46,10 +153,8 @@ class EconomicData:
     gdp_per_capita: Optional[float] = None              # ВВП на душу населения
     unemployment_rate: Optional[float] = None           # Уровень безработицы
 
-    def to_dict(self) -> Dict[str, Any]:
-        return asdict(self)
-
 
+@_fast_record(omit_if_none=("_id",))
 @dataclass
 class PosterData:
     """
@@ -83,6 +188,7 @@ class PosterData:
     elevator: Optional[bool] = False            # Наличие лифта
     image_urls: Optional[List[str]] = field(default_factory=list) # Список URL изображений
     coordinates: Optional[Dict[str, float]] = None # Географические координаты {"latitude": ..., "longitude": ...}
+    published_at: Optional[str] = None          # Дата публикации объявления (ISO, YYYY-MM-DD)
 
     # Вложенные dataclass
     residential_complex: Optional[ResidentialComplex] = None
@@ -91,13 +197,14 @@ class PosterData:
 
     def __post_init__(self):
         # Приведение типов и очистка данных после инициализации
-        if self.price is not None:
+        # (уже приведенные значения пропускаются; данные из очереди - см. from_trusted_dict)
+        if self.price is not None and self.price.__class__ is not int:
             try:
-                self.price = int(re.sub(r'\D', '', str(self.price)))
+                self.price = int(_NON_DIGITS_RE.sub('', str(self.price)))
             except (ValueError, TypeError):
                 self.price = None
 
-        if self.area_total is not None:
+        if self.area_total is not None and self.area_total.__class__ is not float:
             try:
                 self.area_total = float(str(self.area_total).replace(',', '.'))
             except (ValueError, TypeError):
@@ -108,7 +215,7 @@ class PosterData:
             if "студия" in self.rooms.lower():
                 self.rooms = 0
             else:
-                match = re.search(r'(\d+)-комн', self.rooms)
+                match = _ROOMS_RE.search(self.rooms)
                 if match:
                     self.rooms = int(match.group(1))
                 else:
@@ -136,13 +243,8 @@ class PosterData:
                 print(f"Ошибка при создании EconomicData из словаря: {e} -> {self.economic_data}")
                 self.economic_data = None
 
-    def to_dict(self) -> Dict[str, Any]:
-        data_dict = asdict(self)
-
-        if data_dict.get('_id') is None:
-            data_dict.pop('_id', None)
-            
-        return data_dict
+    # to_dict / from_dict / from_trusted_dict генерируются декоратором _fast_record;
+    # в to_dict поле _id опускается, если оно не задано
 
 
 # Добавляем enum для совместимости (если используется в улучшенной версии)
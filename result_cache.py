@@ -0,0 +1,142 @@
+import re
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
+
+from _config import (
+    result_cache_mongo_uri, result_cache_db_name, result_cache_ttl_seconds, result_cache_max_stale_seconds,
+)
+
+_CIAN_ID_RE = re.compile(r'/(\d+)/?')
+_AVITO_ID_RE = re.compile(r'_(\d+)')
+
+# request_id фонового обновления: у такого запроса нет chat_id, уведомление никому не отправляется
+REFRESH_REQUEST_PREFIX = "refresh_"
+_ACTIVE_VERSION_ID = "__active_model_version__"
+
+
+def ad_id_from_url(url: str) -> Optional[str]:
+    """ID объявления из ссылки ЦИАН (/123/) или Авито (_123); None, если ID в ссылке нет."""
+    match = _CIAN_ID_RE.search(url) or _AVITO_ID_RE.search(url)
+    return match.group(1) if match else None
+
+
+class CachedResult:
+    __slots__ = ("ad_id", "result", "age_seconds", "stale", "model_version")
+
+    def __init__(self, ad_id: str, result: Dict[str, Any], age_seconds: float, stale: bool, model_version: str):
+        self.ad_id = ad_id
+        self.result = result
+        self.age_seconds = age_seconds
+        self.stale = stale
+        self.model_version = model_version
+
+
+class ResultCache:
+    """
+    Кеш готовых результатов анализа по (ID объявления, версия модели) в MongoDB.
+    Свежий результат (моложе ttl) отдается без запуска пайплайна; устаревший (моложе max_stale)
+    отдается сразу, а вызывающий запускает фоновое обновление - claim_refresh гарантирует,
+    что обновление запросит только один из одновременных запросов.
+    Активную версию модели пишет AnalysisWorker; читатели держат ее в памяти и перечитывают раз в version_refresh_seconds.
+    """
+
+    def __init__(self, collection,
+                 ttl_seconds: float = result_cache_ttl_seconds,
+                 max_stale_seconds: float = result_cache_max_stale_seconds,
+                 version_refresh_seconds: float = 30.0,
+                 refresh_claim_seconds: float = 300.0):
+        self.collection = collection
+        self.ttl_seconds = ttl_seconds
+        self.max_stale_seconds = max(max_stale_seconds, ttl_seconds)
+        self.version_refresh_seconds = version_refresh_seconds
+        self.refresh_claim_seconds = refresh_claim_seconds
+        self._active_version: Optional[str] = None
+        self._version_checked_at = 0.0
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_config(cls, collection_name: str = "result_cache") -> "ResultCache":
+        client = AsyncIOMotorClient(result_cache_mongo_uri)
+        return cls(client[result_cache_db_name][collection_name])
+
+    async def ensure_indexes(self):
+        # Записи удаляются MongoDB после окончания окна устаревания
+        await self.collection.create_index("expires_at", expireAfterSeconds=0)
+
+    @staticmethod
+    def _key(ad_id: str, model_version: str) -> str:
+        return f"{ad_id}:{model_version}"
+
+    async def set_active_version(self, model_version: str):
+        """Вызывается аналитическим воркером при загрузке (или смене) модели."""
+        await self.collection.update_one(
+            {"_id": _ACTIVE_VERSION_ID}, {"$set": {"version": model_version, "updated_at": datetime.utcnow()}}, upsert=True
+        )
+        self._active_version = model_version
+        self._version_checked_at = time.monotonic()
+
+    async def active_version(self) -> Optional[str]:
+        now = time.monotonic()
+        if self._active_version is None or now - self._version_checked_at > self.version_refresh_seconds:
+            document = await self.collection.find_one({"_id": _ACTIVE_VERSION_ID}, {"version": 1})
+            self._active_version = document.get("version") if document else None
+            self._version_checked_at = now
+        return self._active_version
+
+    async def lookup(self, url: str) -> Optional[CachedResult]:
+        """Результат для ссылки по текущей версии модели или None (промах, нет ID в ссылке, нет активной версии)."""
+        ad_id = ad_id_from_url(url)
+        model_version = await self.active_version() if ad_id else None
+        if not model_version:
+            self.misses += 1
+            return None
+
+        document = await self.collection.find_one({"_id": self._key(ad_id, model_version)}, {"result": 1, "computed_at": 1})
+        if document is None:
+            self.misses += 1
+            return None
+        age_seconds = (datetime.utcnow() - document["computed_at"]).total_seconds()
+        if age_seconds > self.max_stale_seconds: # Еще не удалена TTL-индексом
+            self.misses += 1
+            return None
+        stale = age_seconds > self.ttl_seconds
+        if stale:
+            self.stale_hits += 1
+        else:
+            self.hits += 1
+        return CachedResult(ad_id, document["result"], age_seconds, stale, model_version)
+
+    async def claim_refresh(self, cached: CachedResult) -> bool:
+        """True, если этот вызов первым взялся обновлять устаревшую запись (остальные просто отдают кеш)."""
+        now = datetime.utcnow()
+        document = await self.collection.find_one_and_update(
+            {"_id": self._key(cached.ad_id, cached.model_version),
+             "$or": [{"refresh_claimed_until": {"$exists": False}}, {"refresh_claimed_until": {"$lt": now}}]},
+            {"$set": {"refresh_claimed_until": now + timedelta(seconds=self.refresh_claim_seconds)}},
+            projection={"_id": 1},
+            return_document=ReturnDocument.AFTER,
+        )
+        return document is not None
+
+    async def store(self, ad_id: str, model_version: str, result: Dict[str, Any]):
+        """Сохраняет результат анализа (без полей конкретного запроса: chat_id, request_id)."""
+        now = datetime.utcnow()
+        payload = {k: v for k, v in result.items() if k not in ("chat_id", "request_id")}
+        await self.collection.update_one(
+            {"_id": self._key(ad_id, model_version)},
+            {"$set": {"ad_id": ad_id, "model_version": model_version, "result": payload, "computed_at": now,
+                      "expires_at": now + timedelta(seconds=self.max_stale_seconds)},
+             "$unset": {"refresh_claimed_until": ""}},
+            upsert=True,
+        )
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"hits": self.hits, "stale_hits": self.stale_hits, "misses": self.misses,
+                "active_version": self._active_version}
@@ -0,0 +1,33 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("telegram")
+
+from result_cache import CachedResult
+from tg_bot import handlers
+
+
+class FailingRefreshCache:
+    async def lookup(self, url):
+        return CachedResult("123", {"predicted_price": 50000}, 100.0, True, "v1")
+
+    async def claim_refresh(self, cached):
+        raise ConnectionError("MongoDB недоступна")
+
+
+class FakeMQ:
+    def __init__(self):
+        self.published = []
+
+    async def publish_message(self, exchange, routing_key, body):
+        self.published.append((routing_key, body))
+
+
+def test_refresh_failure_after_answer_does_not_fall_back(monkeypatch):
+    mq = FakeMQ()
+    monkeypatch.setattr(handlers, "mq_manager_instance", mq)
+    monkeypatch.setattr(handlers, "result_cache_instance", FailingRefreshCache())
+    answered = asyncio.run(handlers._answer_from_cache("https://www.cian.ru/rent/flat/123/", 1, "1_1"))
+    assert answered # Иначе вызывающий код запустил бы пайплайн и пользователь получил бы второй ответ
+    assert [routing_key for routing_key, _ in mq.published] == ["notify.user"]
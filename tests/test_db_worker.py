@@ -0,0 +1,186 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+from bd import db_worker
+from bd.db_worker import DatabaseService, DatabaseWorker
+
+
+class FakeCollection:
+    """bulk_write из UpdateOne-upsert по полю id; объявления из fail_ids получают ошибку записи."""
+
+    name = "posters"
+
+    def __init__(self, fail_ids=(), unavailable=False):
+        self.documents = {}
+        self.fail_ids = set(fail_ids)
+        self.unavailable = unavailable
+        self.calls = []
+
+    async def bulk_write(self, operations, ordered=True):
+        if self.unavailable:
+            raise ConnectionError("MongoDB недоступна")
+        self.calls.append(operations)
+        upserted, errors, matched = [], [], 0
+        for index, operation in enumerate(operations):
+            ad_id = operation._filter["id"]
+            if ad_id in self.fail_ids:
+                errors.append({"index": index, "code": 11000, "errmsg": f"E11000 duplicate key: {ad_id}"})
+                continue
+            document = self.documents.get(ad_id)
+            if document is None:
+                document = self.documents[ad_id] = {"_id": ObjectId(), "id": ad_id,
+                                                    **operation._doc.get("$setOnInsert", {})}
+                upserted.append({"index": index, "_id": document["_id"]})
+            else:
+                matched += 1
+            document.update(operation._doc["$set"])
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "upserted": upserted, "nUpserted": len(upserted),
+                                  "nModified": matched, "nMatched": matched})
+        return SimpleNamespace(upserted_ids={item["index"]: item["_id"] for item in upserted},
+                               upserted_count=len(upserted), modified_count=matched, matched_count=matched)
+
+
+class FakePriceHistory:
+    def __init__(self):
+        self.recorded = []
+
+    async def record_many(self, documents):
+        self.recorded.extend(document["id"] for document in documents)
+
+
+class FakeDedupIndex:
+    def __init__(self, clusters=None):
+        self.clusters = dict(clusters or {})
+
+    async def upsert_many(self, documents):
+        return {document["id"]: self.clusters.setdefault(document["id"], document["id"]) for document in documents}
+
+    def cluster_of(self, ad_id):
+        return self.clusters.get(ad_id)
+
+
+class FakeDistrictStats:
+    def __init__(self):
+        self.observed = []
+
+    async def observe_many(self, documents):
+        self.observed.extend(document["id"] for document in documents)
+
+
+def _service(collection, clusters=None) -> DatabaseService:
+    service = DatabaseService.__new__(DatabaseService)
+    service.collection = collection
+    service.price_history = FakePriceHistory()
+    service.dedup_index = FakeDedupIndex(clusters)
+    service.district_stats = FakeDistrictStats()
+    return service
+
+
+def test_new_and_updated_documents():
+    collection = FakeCollection()
+    service = _service(collection)
+    asyncio.run(service.save_many([{"id": "1", "price": 50000}]))
+    first_seen_at = collection.documents["1"]["first_seen_at"]
+
+    results = asyncio.run(service.save_many([{"id": "1", "price": 45000, "chat_id": 7}, {"id": "2", "price": 60000}]))
+    assert results[0] == (True, None, None) # Обновленный документ: mongo_id не читается
+    assert results[1] == (True, str(collection.documents["2"]["_id"]), None)
+    assert collection.documents["1"]["price"] == 45000 and "chat_id" not in collection.documents["1"]
+    # first_seen_at пишется только при вставке
+    assert collection.documents["1"]["first_seen_at"] == first_seen_at
+    assert collection.documents["2"]["first_seen_at"] == collection.documents["2"]["updated_at"]
+    assert service.district_stats.observed == ["1", "2"] # Только вставки, по одной на объявление
+
+
+def test_duplicate_id_in_batch_collapses_to_last():
+    collection = FakeCollection()
+    service = _service(collection)
+    results = asyncio.run(service.save_many([{"id": "1", "price": 100}, {"id": "2", "price": 300},
+                                             {"id": "1", "price": 200}]))
+    assert len(collection.calls[0]) == 2
+    assert collection.documents["1"]["price"] == 200
+    assert results[0] == results[2] == (True, str(collection.documents["1"]["_id"]), None)
+    assert sorted(service.price_history.recorded) == ["1", "2"]
+
+
+def test_write_error_maps_to_its_document():
+    collection = FakeCollection(fail_ids={"2"})
+    service = _service(collection, clusters={"3": "1"})
+    results = asyncio.run(service.save_many([{"id": "1"}, {"id": "2"}, {"price": 10}, {"id": "3"}]))
+    assert results[0] == (True, str(collection.documents["1"]["_id"]), None)
+    assert not results[1][0] and results[1][2].startswith("E11000")
+    assert not results[2][0] and "id" in results[2][2] # Нет id: в bulk_write не попадает
+    assert results[3] == (True, str(collection.documents["3"]["_id"]), None)
+    assert service.price_history.recorded == ["1", "3"]
+    assert service.district_stats.observed == ["1"] # "3" - копия уже виденной квартиры
+
+
+def test_single_save_goes_through_save_many():
+    collection = FakeCollection()
+    service = _service(collection)
+    assert asyncio.run(service.save_poster_data({"id": "1", "price": 50000})) == \
+        (True, str(collection.documents["1"]["_id"]), None)
+    assert service.price_history.recorded == ["1"] and service.district_stats.observed == ["1"]
+    assert asyncio.run(service.save_poster_data({"price": 1}))[0] is False
+
+
+class FakeMQ:
+    def __init__(self, *args, **kwargs):
+        self.published = []
+
+    async def publish_message(self, exchange, routing_key, body):
+        self.published.append(body)
+
+
+class FakeMessage:
+    def __init__(self, body):
+        self.body = json.dumps(body).encode("utf-8")
+        self.acked = False
+        self.requeued = None
+
+    async def ack(self):
+        self.acked = True
+
+    async def nack(self, requeue=True):
+        self.requeued = requeue
+
+
+def _worker(monkeypatch, collection) -> DatabaseWorker:
+    service = _service(collection)
+    monkeypatch.setattr(db_worker, "MessageQueueManager", FakeMQ)
+    monkeypatch.setattr(db_worker, "DatabaseService", lambda *args, **kwargs: service)
+    return DatabaseWorker("amqp://unused", "mongodb://unused", "db", "posters", batch_size=3)
+
+
+def _consume(worker, bodies):
+    messages = [FakeMessage(body) for body in bodies]
+
+    async def run():
+        for message in messages:
+            await worker.process_message(message)
+
+    asyncio.run(run())
+    return messages
+
+
+def test_worker_acks_written_batch_and_publishes_saved(monkeypatch):
+    worker = _worker(monkeypatch, FakeCollection(fail_ids={"2"}))
+    messages = _consume(worker, [{"id": "1", "request_id": "r1", "chat_id": 5}, {"id": "2"}, {"id": "3"}])
+    # Ошибка записи одного документа не возвращает сообщение в очередь: повтор дал бы ту же ошибку
+    assert all(message.acked and message.requeued is None for message in messages)
+    published = worker.mq_manager.published
+    assert [body["ad_id"] for body in published] == ["1", "3"]
+    assert published[0]["chat_id"] == 5 and published[0]["mongo_id"] is not None
+    assert (worker.saved_count, worker.error_count) == (2, 1)
+
+
+def test_worker_requeues_batch_when_database_unavailable(monkeypatch):
+    worker = _worker(monkeypatch, FakeCollection(unavailable=True))
+    messages = _consume(worker, [{"id": "1"}, {"id": "2"}, {"id": "3"}])
+    assert all(not message.acked and message.requeued for message in messages)
+    assert not worker.mq_manager.published and worker.error_count == 3
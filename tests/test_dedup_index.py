@@ -0,0 +1,117 @@
+import asyncio
+
+import numpy as np
+
+from bd.dedup_index import DedupIndex, MinHasher, listing_shingles
+
+DESCRIPTION = ("Сдается светлая двухкомнатная квартира с евроремонтом в пяти минутах от метро. "
+               "Во дворе детская площадка и парковка, рядом школа, парк и торговый центр. "
+               "В квартире вся необходимая мебель и техника, посудомоечная машина, кондиционер. "
+               "Без животных, только на длительный срок, залог по договоренности.")
+
+
+def _listing(ad_id, description=DESCRIPTION, **overrides):
+    document = {"id": ad_id, "description": description, "area_total": 54.3, "floor": 7,
+                "building_total_floors": 17, "rooms": 2, "coordinates": {"latitude": 55.7512, "longitude": 37.6184}}
+    document.update(overrides)
+    return document
+
+
+UNRELATED = _listing(
+    "other", "Продается уютная студия в новом жилом комплексе бизнес-класса с панорамными окнами и видом на реку, "
+             "чистовая отделка, подземный паркинг, охраняемая закрытая территория.",
+    area_total=28.0, floor=3, building_total_floors=25, rooms=0, coordinates={"latitude": 55.61, "longitude": 37.45},
+)
+
+
+class FakeCursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def batch_size(self, size):
+        return self
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for document in self.documents:
+            yield document
+
+
+class FakeCollection:
+    def __init__(self):
+        self.documents = {}
+
+    async def bulk_write(self, operations, ordered=True):
+        for operation in operations:
+            self.documents.setdefault(operation._filter["_id"], {"_id": operation._filter["_id"]}).update(operation._doc["$set"])
+
+    def find(self, query, projection):
+        return FakeCursor(list(self.documents.values()))
+
+
+def test_signature_estimates_jaccard():
+    hasher = MinHasher(num_perm=256)
+    first = {f"w{i}" for i in range(100)}
+    second = {f"w{i}" for i in range(20, 120)} # Жаккар 80 / 120
+    similarity = (hasher.signature(first) == hasher.signature(second)).mean()
+    assert abs(similarity - 80 / 120) < 0.1
+    np.testing.assert_array_equal(hasher.signature(first), MinHasher(num_perm=256).signature(sorted(first)))
+
+
+def test_near_duplicates_share_cluster():
+    index = DedupIndex()
+    repost = _listing("2", DESCRIPTION.replace("по договоренности", "обсуждается"), area_total=54.0)
+    clusters = asyncio.run(index.upsert_many([_listing("1"), repost, UNRELATED]))
+    assert clusters == {"1": "1", "2": "1", "other": "other"}
+    assert index.cluster_of("2") == "1"
+    assert index.get_stats()["clusters"] == 2
+
+
+def test_same_template_for_different_flat_is_not_duplicate():
+    # Короткий шаблон агентства: различают атрибуты квартиры
+    index = DedupIndex()
+    template = "Сдается квартира от собственника, звоните"
+    other_flat = _listing("2", template, area_total=81.0, floor=12, rooms=3,
+                          coordinates={"latitude": 55.80, "longitude": 37.50})
+    clusters = asyncio.run(index.upsert_many([_listing("1", template), other_flat]))
+    assert clusters == {"1": "1", "2": "2"}
+
+
+def test_update_unlinks_old_signature():
+    index = DedupIndex()
+    original = _listing("1")
+    old_signature = index.signature_of(original)
+    asyncio.run(index.upsert_many([original]))
+    buckets = index.get_stats()["buckets"]
+
+    # Объявление "1" переписано под другую квартиру: старые полосы на него больше не указывают
+    asyncio.run(index.upsert_many([dict(UNRELATED, id="1")]))
+    assert len(index) == 1 and index.get_stats()["buckets"] == buckets
+    assert index.query(old_signature) == []
+    assert [ad_id for ad_id, _ in index.query(index.signature_of(UNRELATED))] == ["1"]
+    # Копия старого текста теперь не дубликат "1"
+    assert asyncio.run(index.upsert_many([_listing("2")])) == {"2": "2"}
+
+    index.remove("1")
+    assert index.cluster_of("1") is None and index.query(index.signature_of(UNRELATED)) == []
+
+
+def test_empty_listing_is_not_indexed():
+    index = DedupIndex()
+    assert listing_shingles({"id": "1"}) == set()
+    assert asyncio.run(index.upsert_many([{"id": "1"}, {"id": "2"}])) == {}
+    assert len(index) == 0
+
+
+def test_load_restores_clusters():
+    collection = FakeCollection()
+    repost = _listing("2", DESCRIPTION.replace("кондиционер", "кондиционер, утюг"))
+    asyncio.run(DedupIndex(collection).upsert_many([_listing("1"), repost, UNRELATED]))
+
+    restored = DedupIndex(collection)
+    assert asyncio.run(restored.load()) == 3
+    assert (restored.cluster_of("1"), restored.cluster_of("2"), restored.cluster_of("other")) == ("1", "1", "other")
+    # Новая копия после перезапуска попадает в тот же кластер
+    assert asyncio.run(restored.upsert_many([_listing("3", area_total=54.6)])) == {"3": "1"}
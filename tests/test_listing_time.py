@@ -0,0 +1,48 @@
+import os
+from datetime import datetime
+
+import pyarrow.parquet as pq
+
+from bd.export_parquet import PartitionedParquetWriter
+from ML.evaluate import time_splits
+from ML.train_model import load_dataset
+
+
+def _ms(*args) -> int:
+    return int((datetime(*args) - datetime(1970, 1, 1)).total_seconds() * 1000)
+
+
+def _listing(ad_id, price, updated_at, published_at=None, first_seen_at=None):
+    return {"id": ad_id, "url": f"https://www.cian.ru/rent/flat/{ad_id}/", "section": "rent", "property_type": "flat",
+            "price": price, "area_total": 40.0, "published_at": published_at, "updated_at": updated_at,
+            "first_seen_at": first_seen_at}
+
+
+def test_listing_time_ignores_rescrapes(tmp_path):
+    writer = PartitionedParquetWriter(str(tmp_path), "run1")
+    # Старое объявление, разобранное заново: updated_at самый поздний, но опубликовано раньше всех
+    writer.add(_listing("a", 50000, datetime(2025, 6, 1), published_at="2023-01-01", first_seen_at=datetime(2024, 12, 1)))
+    writer.add(_listing("b", 60000, datetime(2025, 5, 1), first_seen_at=datetime(2024, 3, 1)))
+    writer.add(_listing("c", 71000, datetime(2025, 7, 1))) # Сохранено до появления first_seen_at
+    writer.close()
+
+    # Файл ранней выгрузки без колонки first_seen_at: объявление c впервые выгружено в 2024-01
+    early = PartitionedParquetWriter(str(tmp_path), "run0")
+    early.add(_listing("c", 70000, datetime(2024, 1, 1)))
+    early.close()
+    for root, _, files in os.walk(tmp_path):
+        for name in files:
+            if name.startswith("part-run0"):
+                path = os.path.join(root, name)
+                pq.write_table(pq.read_table(path).drop_columns(["first_seen_at"]), path)
+
+    batch, y, listed_at = load_dataset(str(tmp_path), "rent")
+    by_price = dict(zip(y.tolist(), listed_at.tolist()))
+    assert sorted(by_price) == [50000, 60000, 71000] # По одной строке на объявление, цена из последней выгрузки
+    assert by_price[50000] == _ms(2023, 1, 1)  # Дата публикации
+    assert by_price[60000] == _ms(2024, 3, 1)  # Первое сохранение
+    assert by_price[71000] == _ms(2024, 1, 1)  # Самая ранняя выгрузка
+
+    (train_idx, test_idx), = time_splits(listed_at, 1)
+    assert y[test_idx].tolist() == [60000]
+    assert sorted(y[train_idx].tolist()) == [50000, 71000]
@@ -0,0 +1,53 @@
+import csv
+
+import numpy as np
+import pytest
+
+from parser.geo_parse.poi_tiles import PoiTiles, PoiTileSet, build_tiles
+
+BBOX = (55.70, 37.60, 55.72, 37.63)
+CELL_KM = 0.25
+
+
+@pytest.fixture
+def uniform_tiles(tmp_path):
+    """Тайл, в каждой ячейке базового уровня которого ровно один магазин."""
+    empty_csv = tmp_path / "empty.csv"
+    empty_csv.write_text("latitude,longitude,category\n", encoding="utf-8")
+    build_tiles(str(empty_csv), str(tmp_path / "layout.tiles"), bbox=BBOX, cell_km=CELL_KM, levels=1)
+    layout = PoiTiles(str(tmp_path / "layout.tiles"))
+    ny, nx = layout.grids[0].shape[:2]
+    rows, cols = np.meshgrid(np.arange(ny), np.arange(nx), indexing="ij")
+    lats, lons = layout.projection.to_latlon((rows.ravel() + 0.5) * CELL_KM, (cols.ravel() + 0.5) * CELL_KM)
+
+    poi_csv = tmp_path / "poi.csv"
+    with open(poi_csv, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["latitude", "longitude", "category"])
+        writer.writerows((lat, lon, "shop") for lat, lon in zip(lats, lons))
+    build_tiles(str(poi_csv), str(tmp_path / "poi.tiles"), bbox=BBOX, cell_km=CELL_KM, levels=1)
+    return PoiTiles(str(tmp_path / "poi.tiles"))
+
+
+def test_density_is_not_underestimated_at_tile_edge(uniform_tiles):
+    tile_set = PoiTileSet([uniform_tiles], cell_km=CELL_KM, neighbourhood=1)
+    centre = ((BBOX[0] + BBOX[2]) / 2, (BBOX[1] + BBOX[3]) / 2)
+    corner = (BBOX[0] + 1e-6, BBOX[1] + 1e-6)
+    edge = (centre[0], BBOX[1] + 1e-6)
+    expected = 1 / CELL_KM ** 2
+
+    for lat, lon in (centre, corner, edge):
+        assert tile_set.district_features(lat, lon)["commercial_density"] == pytest.approx(expected)
+    batch = tile_set.district_features_many([centre[0], corner[0], edge[0]], [centre[1], corner[1], edge[1]])
+    assert [features["commercial_density"] for features in batch] == pytest.approx([expected] * 3)
+    # В углу суммируются 2x2 ячейки из 3x3, на краю - 3x2
+    assert tile_set.district_features(*corner)["schools_count"] == 0
+    np.testing.assert_allclose(uniform_tiles.window_area_km2([centre[0], corner[0], edge[0]],
+                                                             [centre[1], corner[1], edge[1]]),
+                               np.array([9, 4, 6]) * CELL_KM ** 2)
+
+
+def test_outside_tile(uniform_tiles):
+    tile_set = PoiTileSet([uniform_tiles], cell_km=CELL_KM)
+    assert tile_set.district_features(55.0, 37.0) is None
+    assert np.isnan(uniform_tiles.window_area_km2([55.0], [37.0])).all()
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from posterBatch import PosterBatch, COLUMNS
+from posterData import PosterData, DistrictInfo
+
+DOCUMENTS = [
+    {"id": "1", "url": "u1", "section": "rent", "property_type": "flat", "price": 50000, "area_total": 42.5,
+     "rooms": 2, "balcony": True, "image_urls": ["a.jpg"], "coordinates": {"latitude": 55.75, "longitude": 37.61},
+     "district_info": {"region_name": "Москва", "metro_distance": 0.8, "commute_minutes": {"centre": 25.0}}},
+    {"id": "2", "url": "u2", "section": "purchase", "property_type": "flat", "price": None, "balcony": None,
+     "district_info": None},
+]
+SUBSET = ["id", "price", "rooms", "balcony", "section", "coordinates.latitude", "district_info.metro_distance",
+          "district_info.region_name"]
+
+
+def test_full_round_trip():
+    documents = [PosterData.from_dict(document).to_dict() for document in DOCUMENTS]
+    batch = PosterBatch.from_arrow(PosterBatch.from_documents(documents).to_arrow())
+    assert batch.to_documents() == documents
+
+
+def test_subset_round_trip():
+    batch = PosterBatch.from_documents(DOCUMENTS, SUBSET)
+    table = batch.to_arrow()
+    assert table.column_names == [name for name, _, _ in COLUMNS if name in SUBSET]
+    restored = PosterBatch.from_arrow(table).to_documents()
+    assert restored == [
+        {"id": "1", "price": 50000, "rooms": 2, "balcony": True, "section": "rent",
+         "coordinates": None, # Без долготы координаты неполные
+         "district_info": {"region_name": "Москва", "metro_distance": 0.8}},
+        {"id": "2", "price": None, "rooms": None, "balcony": None, "section": "purchase",
+         "coordinates": None, "district_info": None},
+    ]
+    assert restored == batch.to_documents()
+
+
+def test_subset_concat():
+    first, second = (PosterBatch.from_documents([document], SUBSET) for document in DOCUMENTS)
+    batch = PosterBatch.concat([first, second])
+    assert set(batch.columns) == set(SUBSET)
+    assert batch["section"].to_list() == ["rent", "purchase"]
+    np.testing.assert_array_equal(batch["price"], [50000, np.nan])
+    assert batch.to_documents() == PosterBatch.from_documents(DOCUMENTS, SUBSET).to_documents()
+    with pytest.raises(ValueError, match="колонок"):
+        PosterBatch.concat([first, PosterBatch.from_documents(DOCUMENTS)])
+
+
+def test_posters_from_full_batch():
+    posters = [PosterData.from_dict(document) for document in DOCUMENTS]
+    restored = PosterBatch.from_posters(posters).to_posters()
+    assert restored == posters and isinstance(restored[0].district_info, DistrictInfo)
@@ -0,0 +1,90 @@
+import copy
+import json
+import pickle
+from dataclasses import asdict
+
+import pytest
+
+from posterData import PosterData, DistrictInfo, ResidentialComplex, EconomicData
+
+
+def _poster(**overrides) -> PosterData:
+    values = dict(
+        id="123", url="https://www.cian.ru/rent/flat/123/", section="rent", property_type="flat",
+        price=50000, area_total=42.5, rooms=2, image_urls=["a.jpg", "b.jpg"],
+        coordinates={"latitude": 55.75, "longitude": 37.61}, published_at="2024-03-12",
+        residential_complex=ResidentialComplex(name="ЖК", infrastructure_features=["двор"]),
+        district_info=DistrictInfo(region_name="Москва", commute_minutes={"centre": 25.0}),
+        economic_data=EconomicData(region_name="Москва", key_interest_rate=16.0),
+    )
+    values.update(overrides)
+    return PosterData(**values)
+
+
+def _asdict_without_empty_id(poster: PosterData) -> dict:
+    expected = asdict(poster)
+    if expected["_id"] is None:
+        del expected["_id"]
+    return expected
+
+
+@pytest.mark.parametrize("poster", [
+    _poster(),
+    _poster(_id="65f0c0ffee", residential_complex=None, district_info=None, economic_data=None),
+    _poster(image_urls=None, coordinates=None, district_info=DistrictInfo(region_name="Москва")),
+])
+def test_to_dict_matches_asdict(poster):
+    assert poster.to_dict() == _asdict_without_empty_id(poster)
+
+
+def test_to_dict_copies_containers():
+    poster = _poster()
+    data = poster.to_dict()
+    data["image_urls"].append("c.jpg")
+    data["district_info"]["commute_minutes"]["centre"] = 0.0
+    assert poster.image_urls == ["a.jpg", "b.jpg"]
+    assert data["district_info"] is not poster.district_info # Вложенная запись - новый словарь
+
+
+@pytest.mark.parametrize("decode", [PosterData.from_dict, PosterData.from_trusted_dict])
+def test_round_trip_through_json(decode):
+    poster = _poster()
+    restored = decode(json.loads(json.dumps(poster.to_dict(), ensure_ascii=False)))
+    assert restored == poster
+    assert isinstance(restored.district_info, DistrictInfo)
+    assert isinstance(restored.residential_complex, ResidentialComplex)
+    assert restored.to_dict() == poster.to_dict()
+
+
+@pytest.mark.parametrize("decode", [PosterData.from_dict, PosterData.from_trusted_dict])
+def test_defaults_and_nested_none(decode):
+    data = {"id": "1", "url": "u", "section": "rent", "property_type": "flat", "district_info": None, "extra": 1}
+    first, second = decode(dict(data)), decode(dict(data))
+    assert first == PosterData("1", "u", "rent", "flat")
+    assert first.district_info is None and first.balcony is False
+    first.image_urls.append("x.jpg")
+    assert second.image_urls == [] # default_factory вызывается для каждого объекта
+
+
+def test_from_dict_cleans_untrusted_values():
+    poster = PosterData.from_dict({"id": "1", "url": "u", "section": "rent", "property_type": "flat",
+                                   "price": "50 000 ₽", "area_total": "42,5", "rooms": "2-комн. квартира"})
+    assert (poster.price, poster.area_total, poster.rooms) == (50000, 42.5, 2)
+
+
+@pytest.mark.parametrize("decode", [PosterData.from_dict, PosterData.from_trusted_dict])
+def test_missing_required_field(decode):
+    with pytest.raises(TypeError, match="url"):
+        decode({"id": "1", "section": "rent", "property_type": "flat"})
+    with pytest.raises(TypeError, match="region_name"):
+        DistrictInfo.from_dict({"city_name": "Москва"})
+
+
+def test_slotted_copy_and_pickle():
+    poster = _poster(_id="65f0c0ffee")
+    assert not hasattr(poster, "__dict__")
+    for restored in (pickle.loads(pickle.dumps(poster)), copy.deepcopy(poster)):
+        assert restored == poster and restored._id == "65f0c0ffee"
+        assert restored.district_info is not poster.district_info
+    clone = copy.copy(poster)
+    assert clone == poster and clone.image_urls is poster.image_urls
@@ -0,0 +1,48 @@
+import asyncio
+from datetime import date
+
+from bs4 import BeautifulSoup
+
+from parser.economic_parser.economic_enrichment_worker import EconomicDataService, EconomicEnricher
+from parser.economic_parser.economic_store import EconomicReferenceStore
+from parser.poster_parse.cian_parser import CianFlatRentParser, parse_publication_date
+from posterData import PosterData, DistrictInfo
+
+SNAPSHOT_PATH = "data/economic/economic_snapshot.json"
+
+
+def test_parse_publication_date_text():
+    today = date(2025, 2, 10)
+    assert parse_publication_date("сегодня, 12:30", today) == "2025-02-10"
+    assert parse_publication_date("вчера, 09:15", today) == "2025-02-09"
+    assert parse_publication_date("3 фев, 14:05", today) == "2025-02-03"
+    assert parse_publication_date("12 мар, 14:05", today) == "2024-03-12" # Без года - не в будущем
+    assert parse_publication_date("12 марта 2023", today) == "2023-03-12"
+    assert parse_publication_date("Обновлено", today) is None
+    assert parse_publication_date(None, today) is None
+
+
+def test_cian_published_at_from_page_data():
+    html = '<html><script>window._cianConfig = {"offerData": {"publicationDate": 1648771200}};</script></html>'
+    soup = BeautifulSoup(html, "html.parser")
+    assert CianFlatRentParser()._extract_published_at(soup) == "2022-04-01"
+
+    html = "<html><div data-testid='metadata-added-date'><span>15 марта 2022</span></div></html>"
+    assert CianFlatRentParser()._extract_published_at(BeautifulSoup(html, "html.parser")) == "2022-03-15"
+
+
+def _enrich(published_at):
+    enricher = EconomicEnricher(EconomicDataService(EconomicReferenceStore(SNAPSHOT_PATH)))
+    poster = PosterData(id="1", url="https://www.cian.ru/rent/flat/1/", section="rent", property_type="flat",
+                        published_at=published_at, district_info=DistrictInfo(region_name="Москва"))
+    assert asyncio.run(enricher.enrich(poster))
+    return poster.economic_data
+
+
+def test_old_listing_gets_key_rate_of_its_publication_date():
+    store = EconomicReferenceStore(SNAPSHOT_PATH)
+    latest = store.get_by_name("Москва").key_interest_rate
+    old = _enrich("2022-03-15")
+    assert old.key_interest_rate == 20.0 # Ставка с 2022-02-28 по 2022-04-10
+    assert old.key_interest_rate != latest
+    assert _enrich(None).key_interest_rate == latest
@@ -0,0 +1,69 @@
+import asyncio
+
+import request_service
+from request_service import RequestService
+from result_cache import CachedResult
+
+
+class FakeResultCache:
+    def __init__(self, stale: bool):
+        self.cached = CachedResult("123", {"predicted_price": 50000}, 100.0, stale, "v1")
+        self.claimed = False
+
+    async def lookup(self, url):
+        return self.cached
+
+    async def claim_refresh(self, cached):
+        if self.claimed:
+            return False
+        self.claimed = True
+        return True
+
+
+class FakeMQ:
+    def __init__(self, *args, **kwargs):
+        self.published = []
+
+    async def publish_message(self, exchange, routing_key, body):
+        self.published.append(body)
+
+
+def _service(monkeypatch, cache) -> RequestService:
+    monkeypatch.setattr(request_service, "MessageQueueManager", FakeMQ)
+    return RequestService("amqp://unused", result_cache=cache)
+
+
+def test_stale_result_refreshes_once(monkeypatch):
+    service = _service(monkeypatch, FakeResultCache(stale=True))
+
+    async def run():
+        return [await service.process_user_request("https://www.cian.ru/rent/flat/123/") for _ in range(5)]
+
+    responses = asyncio.run(run())
+    assert all(response["cached"] and response["result"] == {"predicted_price": 50000} for response in responses)
+    assert len(service.mq_manager.published) == 1
+
+
+def test_fresh_result_does_not_publish(monkeypatch):
+    service = _service(monkeypatch, FakeResultCache(stale=False))
+    response = asyncio.run(service.process_user_request("https://www.cian.ru/rent/flat/123/"))
+    assert response["cached"] and not service.mq_manager.published
+
+
+def test_initialize_ensures_cache_indexes(monkeypatch):
+    class IndexedCache(FakeResultCache):
+        indexed = False
+
+        async def ensure_indexes(self):
+            self.indexed = True
+
+    class ConnectingMQ(FakeMQ):
+        async def connect(self): pass
+        async def declare_exchange(self, *args, **kwargs): pass
+        async def declare_queue(self, *args, **kwargs): pass
+        async def bind_queue_to_exchange(self, *args, **kwargs): pass
+
+    monkeypatch.setattr(request_service, "MessageQueueManager", ConnectingMQ)
+    cache = IndexedCache(stale=False)
+    asyncio.run(RequestService("amqp://unused", result_cache=cache).initialize())
+    assert cache.indexed
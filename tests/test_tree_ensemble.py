@@ -0,0 +1,66 @@
+import numpy as np
+from sklearn.ensemble import HistGradientBoostingRegressor
+
+from ML import tree_ensemble
+from ML.tree_ensemble import TreeEnsemble
+
+
+def _data(n: int = 3000, seed: int = 0):
+    rng = np.random.RandomState(seed)
+    X = rng.normal(size=(n, 5))
+    y = 3 * X[:, 0] + np.where(X[:, 1] > 0, 2.0, -1.0) + X[:, 2] * X[:, 3] + rng.normal(scale=0.1, size=n)
+    # Пропуски с собственным сигналом: sklearn учит, в какую сторону их направлять
+    missing = rng.rand(n) < 0.2
+    X[missing, 0] = np.nan
+    y[missing] += 5.0
+    X[rng.rand(n) < 0.1, 4] = np.nan
+    return X, y
+
+
+def _fit() -> HistGradientBoostingRegressor:
+    X, y = _data()
+    return HistGradientBoostingRegressor(max_iter=60, max_leaf_nodes=15, random_state=0).fit(X, y)
+
+
+def test_export_matches_sklearn_including_missing_values():
+    estimator = _fit()
+    ensemble = TreeEnsemble.from_sklearn(estimator)
+    X, _ = _data(seed=1)
+    X[:50] = np.nan # Строки целиком из пропусков
+    np.testing.assert_allclose(ensemble.predict(X), estimator.predict(X), rtol=0, atol=1e-9)
+
+
+def test_state_round_trip():
+    estimator = _fit()
+    restored = TreeEnsemble.from_state(TreeEnsemble.from_sklearn(estimator).to_state())
+    X, _ = _data(seed=2)
+    np.testing.assert_allclose(restored.predict(X), estimator.predict(X), rtol=0, atol=1e-9)
+
+
+def test_chunked_predict(monkeypatch):
+    estimator = _fit()
+    ensemble = TreeEnsemble.from_sklearn(estimator)
+    X, _ = _data(n=1001, seed=3)
+    expected = estimator.predict(X)
+    monkeypatch.setattr(tree_ensemble, "ROW_CHUNK", 64) # Последний кусок неполный
+    np.testing.assert_allclose(ensemble.predict(X), expected, rtol=0, atol=1e-9)
+    np.testing.assert_allclose(ensemble.predict(X[:1]), expected[:1], rtol=0, atol=1e-9)
+
+
+def test_level_order_layout():
+    estimator = _fit()
+    ensemble = TreeEnsemble.from_sklearn(estimator)
+    nodes = np.arange(ensemble.n_nodes)
+    leaves = ensemble.left == nodes
+    assert leaves.sum() == sum(int(predictor.nodes["is_leaf"].sum()) for (predictor,) in estimator._predictors)
+    # Лист ссылается сам на себя с порогом +inf и пропуском "влево": лишние шаги его не покидают
+    assert np.isinf(ensemble.threshold[leaves]).all() and ensemble.missing_left[leaves].all()
+    # Потомки внутреннего узла - соседние элементы после него (right = left + 1), у каждого узла один родитель
+    inner = nodes[~leaves]
+    children = np.concatenate([ensemble.left[inner], ensemble.left[inner] + 1])
+    assert (ensemble.left[inner] > inner).all()
+    assert len(np.unique(children)) == len(children)
+    assert set(children.tolist()) | set(ensemble.roots.tolist()) == set(nodes.tolist())
+    # Разбиение "пропуск против всех значений" (порог +inf у внутреннего узла) сохранено
+    nan_splits = inner[np.isinf(ensemble.threshold[inner])]
+    assert len(nan_splits) and not ensemble.missing_left[nan_splits].any()
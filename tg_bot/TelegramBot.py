@@ -5,7 +5,8 @@ import os
 import json
 import aio_pika
 
-from handlers import start, handle_cian_link, initialize_mq_for_bot, format_prediction, mq_manager_instance 
+from handlers import start, handle_cian_link, initialize_mq_for_bot, initialize_result_cache, format_prediction, mq_manager_instance 
+from result_cache import REFRESH_REQUEST_PREFIX
 
 logger = logging.getLogger(__name__)
 
@@ -49,6 +50,8 @@ class TelegramNotificationConsumer:
                 chat_id = msg_body.get("chat_id")
                 request_id = msg_body.get("request_id", "N/A")
 
+                if not chat_id and request_id.startswith(REFRESH_REQUEST_PREFIX):
+                    return # Фоновое обновление кеша результатов - уведомлять некого
                 if not chat_id:
                     logger.warning(f"[{request_id}] Notification message missing 'chat_id'. Cannot send Telegram message.")
                     return
@@ -75,6 +78,7 @@ class TelegramBot:
     async def startup(self):
         # 1. Инициализируем соединение RabbitMQ для отправки запросов (handlers)
         await initialize_mq_for_bot()
+        await initialize_result_cache()
 
         # 2. Инициализируем Telegram Application
         self.app = Application.builder().token(self.token).build()
@@ -6,6 +6,7 @@ import asyncio
 
 from posterData import PosterData 
 from message_queue_manager import MessageQueueManager 
+from result_cache import ResultCache, REFRESH_REQUEST_PREFIX
 
 
 hui = PosterData
@@ -14,6 +15,7 @@ logger = logging.getLogger(__name__)
 
 # --- Инициализация и менеджер очередей ---
 mq_manager_instance: MessageQueueManager | None = None
+result_cache_instance: ResultCache | None = None
 
 async def initialize_mq_for_bot():
     """
@@ -31,18 +33,68 @@ async def initialize_mq_for_bot():
             logger.error(f"Handlers: Failed to initialize RabbitMQ connection: {e}")
             raise 
 
+async def initialize_result_cache():
+    """Подключает кеш готовых результатов. Без него бот работает как раньше - каждая ссылка идет через пайплайн."""
+    global result_cache_instance
+    if result_cache_instance is None:
+        try:
+            result_cache_instance = ResultCache.from_config()
+            logger.info("Handlers: result cache initialized.")
+        except Exception as e:
+            logger.error(f"Handlers: Failed to initialize result cache, continuing without it: {e}")
+
+async def _answer_from_cache(url: str, chat_id: int, request_id: str) -> bool:
+    """
+    Если по ссылке есть результат для текущей версии модели - сразу отправляет его в очередь уведомлений.
+    Для устаревшего результата дополнительно ставит фоновый парсинг без chat_id (ответ пользователю не дублируется).
+    """
+    if result_cache_instance is None:
+        return False
+    try:
+        cached = await result_cache_instance.lookup(url)
+        if cached is None:
+            return False
+
+        notification = dict(cached.result, chat_id=chat_id, request_id=request_id, from_cache=True)
+        await mq_manager_instance.publish_message("notification_exchange", "notify.user", notification)
+        logger.info(f"[{request_id}] Answered from result cache (ad {cached.ad_id}, age {cached.age_seconds:.0f}s, stale={cached.stale}).")
+    except Exception as e:
+        logger.warning(f"[{request_id}] Result cache unavailable, falling back to pipeline: {e}")
+        return False
+
+    # Ответ уже отправлен: сбой фонового обновления не должен запускать пайплайн и дублировать ответ
+    try:
+        if cached.stale and await result_cache_instance.claim_refresh(cached):
+            await mq_manager_instance.publish_message(
+                "parsing_exchange", "parse.cian_flat_rent",
+                {"url": url, "request_id": f"{REFRESH_REQUEST_PREFIX}{request_id}"},
+            )
+            logger.info(f"[{request_id}] Background refresh requested for ad {cached.ad_id}.")
+    except Exception as e:
+        logger.warning(f"[{request_id}] Background refresh for ad {cached.ad_id} failed: {e}")
+    return True
+
 def format_prediction(data: dict) -> str:
-    predicted_price = data.get('predicted_price', 'N/A')
-    address = data.get('address', 'N/A')
-    url = data.get('url', 'N/A')
+    predicted_price = data.get('predicted_price')
+    address = data.get('address') or 'N/A'
+    url = data.get('url') or data.get('original_ad_url') or 'N/A'
     request_id = data.get('request_id', 'N/A')
+    price_text = f"{predicted_price:,}".replace(",", " ") if isinstance(predicted_price, int) else 'N/A'
 
     message_parts = [
         f"*Прогноз стоимости аренды* (Запрос: `{request_id}`)\n",
         f"🏠 *Адрес:* {address}\n",
-        f"💰 *Справедливая цена:* {predicted_price} ₽/мес\n",
-        f"[Посмотреть объявление]({url})"
+        f"💰 *Справедливая цена:* {price_text} ₽/мес\n",
     ]
+    deviation = data.get('price_deviation_pct')
+    if deviation is not None:
+        direction = "завышена" if deviation > 0 else "занижена"
+        message_parts.append(f"📊 Объявленная цена {direction} на {abs(deviation):.0f}%\n")
+    comparables = data.get('comparables')
+    if comparables:
+        estimate = f"{comparables['estimate']:,}".replace(",", " ")
+        message_parts.append(f"🏘 Похожие квартиры рядом: ~{estimate} ₽/мес (по {comparables['count']} объявлениям)\n")
+    message_parts.append(f"[Посмотреть объявление]({url})")
     return "\n".join(message_parts)
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -58,6 +110,9 @@ async def handle_cian_link(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("🔧 Система временно недоступна. Попробуйте позже.")
         return
 
+    if await _answer_from_cache(url, chat_id, request_id):
+        return
+
     try:
         # Создаем сообщение для парсера
         message_to_send = {